@@ -32,7 +32,7 @@ from subconvert.cli import MainApp
 from subconvert.gui import GuiApp
 from subconvert.utils.PropertyFile import SubtitleProperties
 
-from subconvert.parsing.Core import SubParser
+from subconvert.parsing.Core import SubParser, formatRegistry
 from subconvert.parsing.Formats import *
 
 log = logging.getLogger('Subconvert')
@@ -60,6 +60,8 @@ def prepareOptions(subFormats):
         help = _("runs Subconvert in console"))
     parser.add_argument("-f", "--force", action = "store_true",
         help = _("forces all operations without asking (assuming yes)"))
+    parser.add_argument("-j", "--jobs", metavar = _("N"), type = int, default = 1,
+        help = _("converts up to N files at once in console mode"))
 
 
     subtitleGroup = parser.add_argument_group(_("subtitle options"))
@@ -107,7 +109,8 @@ def prepareOptions(subFormats):
 def initSubParser():
     parser = SubParser()
     for Format in SubFormat.__subclasses__():
-        parser.registerFormat(Format)
+        # formats are compiled only once, so all files parsed in batch mode share them
+        parser.registerFormat(formatRegistry.register(Format))
     return parser
 
 def interruptHandler(signum, frame):
@@ -21,15 +21,17 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 
 import sys
 import re
+import functools
+import itertools
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from string import Template
 
 from subconvert.parsing.Core import SubConverter, SubParsingError
 from subconvert.parsing.Formats import *
-from subconvert.parsing.Offset import TimeSync
 from subconvert.utils.Locale import _
 from subconvert.utils.SubtitleData import SubtitleData
-from subconvert.utils.SubFile import File
+from subconvert.utils.SubFile import File, FpsProber
 from subconvert.utils.SubSettings import SubSettings
 from subconvert.utils.Encodings import ALL_ENCODINGS
 from subconvert.utils.PropertyFile import SubtitleProperties
@@ -43,34 +45,123 @@ log = logging.getLogger('Subconvert.%s' % __name__)
 class FileTemplate(Template):
         delimiter = '%'
 
+class _JobLogHandler(logging.Handler):
+    """Keeps log records of a file converted in a worker process, so they can be printed by the
+    main process in order of converted files."""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # records are pickled, so their arguments and exceptions are formatted up front
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+_jobLogHandler = None
+
+def _initJob(logLevel):
+    global _jobLogHandler
+    _jobLogHandler = _JobLogHandler()
+    logger = logging.getLogger('Subconvert')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_jobLogHandler)
+    logger.setLevel(logLevel)
+
+def _convertFileJob(logLevel, args, parser, filePath, outputFormat, choice):
+    """Convert a single file in a worker process. Returns its log records and an error message
+    (or None)."""
+    if _jobLogHandler is None:
+        _initJob(logLevel)
+    _jobLogHandler.records = []
+    error = None
+    try:
+        app = SubApplication(args, parser)
+        app.convertFile(filePath, outputFormat, SubConverter(), choice)
+    except SubException as msg:
+        error = str(msg)
+    return _jobLogHandler.records, error
+
 class SubApplication:
+    # Files of at least this size are parsed, converted and written subtitle by subtitle, so they
+    # aren't kept in memory as a whole.
+    STREAMING_SIZE = 32 * 1024 * 1024
+
     def __init__(self, args, parser):
         self._args = args
         self._parser = parser
+        self._fpsProber = FpsProber()
 
     def cleanup(self):
-        pass
+        self._fpsProber.close()
 
-    def parseFile(self, subFile, inputEncoding , fps):
-        content = subFile.read(inputEncoding)
+    def parseFile(self, subFile, content, fps):
         try:
-            subtitles = self._parser.parse(content, fps)
+            # Subtitles are only converted and synced, so their texts don't have to be translated
+            # to GSP formatting, unless parser doesn't support it for a given file.
+            if self._parser.rawFormat(content) is not None:
+                subtitles = self._parser.parseRaw(content, fps)
+            else:
+                subtitles = self._parser.parse(content, fps)
         except SubParsingError as msg:
             log.error(msg)
             raise SubException(_("Couldn't parse file '%s'" % subFile.path))
 
+        self._logParsedFormat(subFile)
         return subtitles
 
+    def iterparseFile(self, subFile, encoding, fps):
+        """Parse a file incrementally. Returns an iterable of its Header and Subtitles. Only the
+        beginning of a file, which is needed to recognize its format, is read right away."""
+        subtitles = self._parser.iterparse(subFile.iterLines(encoding), fps)
+        try:
+            header = next(subtitles)
+        except SubParsingError as msg:
+            log.error(msg)
+            raise SubException(_("Couldn't parse file '%s'" % subFile.path))
+
+        self._logParsedFormat(subFile)
+        return itertools.chain([header], subtitles)
+
+    def _logParsedFormat(self, subFile):
+        log.debug(_("Detected format: %(fmt)s (confidence: %(conf).2f)") %
+            {"fmt": self._parser.parsedFormat().NAME, "conf": self._parser.parsedConfidence()})
+        if self._parser.parsedWithLowConfidence():
+            log.warning(_("Format of '%(file)s' is uncertain. It was parsed as %(fmt)s "
+                "(confidence: %(conf).2f).") % {"file": subFile.path,
+                "fmt": self._parser.parsedFormat().NAME, "conf": self._parser.parsedConfidence()})
+
     def getFps(self, subFile):
         fps = self._args.fps
         if fps is None:
             fps = self._args.pfile.fps # default value
             if self._args.pfile.autoFps:
                 movieFile = self._parsePathTemplate(self._args.video, subFile.path)
-                videoInfo = subFile.detectFps(movieFile, fps)
+                videoInfo = subFile.detectFps(movieFile, fps, self._fpsProber)
                 fps = videoInfo.fps
         return fps
 
+    def prefetchFps(self, filePaths):
+        """Start detecting FPS of movies of all given files in background, so they don't wait for
+        MPlayer one after another."""
+        if self._args.fps is not None or not self._args.pfile.autoFps:
+            return
+
+        movieFiles = []
+        for filePath in filePaths:
+            movieFile = self._parsePathTemplate(self._args.video, filePath)
+            if movieFile is None:
+                try:
+                    movieFile = File(filePath).searchForMovieFile()
+                except IOError:
+                    continue
+            movieFiles.append(movieFile)
+        self._fpsProber.prefetch(movieFiles)
+
     def updateEncodings(self, subFile):
         self._inputEncoding = self._args.inputEncoding
         self._outputEncoding = self._args.outputEncoding
@@ -92,13 +183,14 @@ class SubApplication:
             return self._args.pfile.outputFormat
         return SubRip
 
-    def getInputEncoding(self, subFile):
+    def getInputEncoding(self):
+        """Return input encoding chosen by user or None when it should be detected."""
         inputEncoding = self._args.inputEncoding
         if inputEncoding is None:
             if self._args.pfile.autoInputEncoding is False:
                 inputEncoding = self._args.pfile.inputEncoding
             else:
-                inputEncoding = subFile.detectEncoding()
+                return None
         return self._checkEncoding(inputEncoding.lower())
 
     def getOutputEncoding(self, default):
@@ -111,13 +203,35 @@ class SubApplication:
         return self._checkEncoding(outputEncoding.lower())
 
     def getOutputFilePath(self, subFile, formatExtension):
-        outputPath = self._parsePathTemplate(self._args.outputPath, subFile.path)
-        if outputPath is None:
-            filename = os.path.splitext(subFile.path)[0]
-            outputPath = '.'.join((filename, formatExtension))
-        return outputPath
-
-    def writeSubtitles(self, convertedSubtitles, filePath, encoding):
+        return self._outputFilePath(subFile.path, formatExtension)
+
+    def askOverwrite(self, filePath):
+        """Ask whether an existing file should be overwritten. Returns 'yes', 'no', 'backup' or
+        'quit'."""
+        # A little hack to ensure that translator won't make a mistake
+        choices = { 'yes': _('y'), 'no': _('n'), 'quit': _('q'), 'backup': _('b') }
+        choice = ''
+
+        if self._args.force:
+            choice = choices["yes"]
+        while(choice not in choices.values()):
+            vals = {
+                "file": filePath, "yes": choices["yes"], "no": choices['no'],
+                "bck": choices['backup'], "quit": choices["quit"]
+            }
+
+            choice = input(
+                _("File '%(file)s' exists. Overwrite? [%(yes)s/%(no)s/%(bck)s/%(quit)s]") % 
+                vals)
+
+        for key, value in choices.items():
+            if value == choice:
+                return key
+
+    def writeSubtitles(self, convertedSubtitles, filePath, encoding, choice = None):
+        """Write converted subtitles to a given file. When it already exists, user is asked
+        whether it should be overwritten, unless a choice has already been made (see
+        askOverwrite())."""
         try:
             file_ = File(filePath)
         except:
@@ -125,41 +239,27 @@ class SubApplication:
             File.write(filePath, convertedSubtitles, encoding)
             log.info(_("File %s saved.") % filePath)
         else:
-            # A little hack to ensure that translator won't make a mistake
-            choices = { 'yes': _('y'), 'no': _('n'), 'quit': _('q'), 'backup': _('b') }
-            choice = ''
-
-            if self._args.force:
-                choice = choices["yes"]
-            while(choice not in choices.values()):
-                vals = {
-                    "file": filePath, "yes": choices["yes"], "no": choices['no'],
-                    "bck": choices['backup'], "quit": choices["quit"]
-                }
-
-                choice = input(
-                    _("File '%(file)s' exists. Overwrite? [%(yes)s/%(no)s/%(bck)s/%(quit)s]") % 
-                    vals)
-
-            if choice == choices['backup']:
+            if choice is None:
+                choice = self.askOverwrite(filePath)
+
+            if choice == 'backup':
                 backupFilePath = file_.backup()
                 log.info(_("Backup: %s") % backupFilePath)
                 log.info(_("Overwriting %s") % filePath)
                 file_.overwrite(convertedSubtitles, encoding)
-            elif choice == choices['no']:
+            elif choice == 'no':
                 log.info(_("Skipping %s") % filePath)
                 return
-            elif choice == choices['yes']:
+            elif choice == 'yes':
                 log.info(_("Overwriting %s") % filePath)
                 file_.overwrite(convertedSubtitles, encoding)
-            elif choice == choices['quit']:
+            elif choice == 'quit':
                 log.info(_("Quitting converting work."))
                 sys.exit(0)
 
     def run(self):
         try:
             outputFormat = self.getOutputFormat()
-            converter = SubConverter()
 
             if len(self._args.files) == 0:
                 log.warning(_("No files selected."))
@@ -168,20 +268,13 @@ class SubApplication:
                 log.warning(_("-A, --auto-fps switches are deprecated."))
                 log.warning(_("  note: FPS is now automatically fetched whenever it's suitable."))
 
-            for filePath in self._args.files:
-                log.info(_("Starting a job for file: %s") % filePath)
-                try:
-                    subFile = File(filePath)
-                except IOError:
-                    log.warning( _("File '%s' doesn't exist. Skipping...") % filePath)
-                    continue
-
-                data = self.createSubData(subFile, outputFormat)
-
-                if data is not None:
-                    convertedSubtitles = converter.convert(data.outputFormat, data.subtitles)
-                    outputFilePath = self.getOutputFilePath(subFile, data.outputFormat.EXTENSION)
-                    self.writeSubtitles(convertedSubtitles, outputFilePath, data.outputEncoding)
+            if self._args.jobs > 1 and len(self._args.files) > 1:
+                self.convertFilesInParallel(outputFormat, self._args.jobs)
+            else:
+                self.prefetchFps(self._args.files)
+                converter = SubConverter()
+                for filePath in self._args.files:
+                    self.convertFile(filePath, outputFormat, converter)
 
         except SubException as msg:
             log.debug(_("Unhandled Subconvert exception occured:"))
@@ -190,6 +283,98 @@ class SubApplication:
 
         return 0
 
+    def convertFile(self, filePath, outputFormat, converter, choice = None):
+        log.info(_("Starting a job for file: %s") % filePath)
+        try:
+            subFile = File(filePath)
+        except IOError:
+            log.warning( _("File '%s' doesn't exist. Skipping...") % filePath)
+            return
+
+        if self._streamed(subFile):
+            self.convertStreamedFile(subFile, outputFormat, converter, choice)
+            return
+
+        data = self.createSubData(subFile, outputFormat)
+
+        if data is not None:
+            # subtitles are converted and encoded while they're written
+            convertedSubtitles = functools.partial(converter.convertTo,
+                Format = data.outputFormat, subtitles = data.subtitles)
+            outputFilePath = self.getOutputFilePath(subFile, data.outputFormat.EXTENSION)
+            self.writeSubtitles(convertedSubtitles, outputFilePath, data.outputEncoding, choice)
+
+    def convertStreamedFile(self, subFile, outputFormat, converter, choice = None):
+        """Convert a file without reading it into memory as a whole: subtitles are parsed,
+        converted and written one by one. Subtitles can't be synchronized this way."""
+        data = SubtitleData()
+        data.fps = self.getFps(subFile)
+        data.outputFormat = outputFormat
+        inputEncoding = self.getInputEncoding()
+        if inputEncoding is None:
+            inputEncoding = subFile.detectEncoding()
+        data.inputEncoding = self._checkEncoding(inputEncoding.lower())
+        data.outputEncoding = self.getOutputEncoding(data.inputEncoding)
+
+        self.printData(subFile.path, data)
+
+        try:
+            subtitles = self.iterparseFile(subFile, data.inputEncoding, data.fps)
+            convertedSubtitles = functools.partial(converter.convertTo,
+                Format = data.outputFormat, subtitles = subtitles)
+            outputFilePath = self.getOutputFilePath(subFile, data.outputFormat.EXTENSION)
+            self.writeSubtitles(convertedSubtitles, outputFilePath, data.outputEncoding, choice)
+        except SubParsingError as msg:
+            # partially written output file is removed
+            log.error(msg)
+            log.error(_("Couldn't parse file '%s'") % subFile.path)
+        except SubException as msg:
+            log.error(str(msg))
+
+    def convertFilesInParallel(self, outputFormat, jobs):
+        """Convert files in a pool of 'jobs' worker processes. Questions about overwriting existing
+        files are asked up front. Log messages of each file are printed when it's converted, in
+        the same order as files were given."""
+        filePaths = list(self._args.files)
+        outputPaths = [self._outputFilePath(filePath, outputFormat.EXTENSION)
+            for filePath in filePaths]
+        if len(set(outputPaths)) != len(outputPaths):
+            log.warning(_("Some files would be saved to the same output file. "
+                "Converting them one by one."))
+            converter = SubConverter()
+            for filePath in filePaths:
+                self.convertFile(filePath, outputFormat, converter)
+            return
+
+        choices = []
+        quitting = False
+        for filePath, outputPath in zip(filePaths, outputPaths):
+            # choice is used only when output file exists
+            choice = 'no'
+            if os.path.isfile(filePath) and os.path.isfile(outputPath):
+                choice = self.askOverwrite(outputPath)
+            if choice == 'quit':
+                quitting = True
+                break
+            choices.append(choice)
+        filePaths = filePaths[:len(choices)]
+
+        logLevel = logging.getLogger('Subconvert').getEffectiveLevel()
+        with ProcessPoolExecutor(max_workers = jobs) as executor:
+            futures = [executor.submit(_convertFileJob, logLevel, self._args, self._parser,
+                filePath, outputFormat, choice) for filePath, choice in zip(filePaths, choices)]
+            for future in futures:
+                records, error = future.result()
+                for record in records:
+                    logging.getLogger(record.name).handle(record)
+                if error is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    raise SubException(error)
+
+        if quitting:
+            log.info(_("Quitting converting work."))
+
     def printData(self, filePath, data):
         log.debug(_("File properties for %s:") % filePath)
         log.debug(_("FPS             : %s") % data.fps)
@@ -201,17 +386,25 @@ class SubApplication:
         data = SubtitleData()
         data.fps = self.getFps(subFile)
         data.outputFormat = outputFormat
-        data.inputEncoding = self.getInputEncoding(subFile)
+        inputEncoding = self.getInputEncoding()
+
+        # File is read only once. When input encoding isn't given, it's detected from the same
+        # buffer which is decoded.
+        try:
+            content = subFile.load(inputEncoding)
+        except SubException as msg:
+            log.error(str(msg))
+            return None
+
+        data.inputEncoding = self._checkEncoding(content.encoding.lower())
         data.outputEncoding = self.getOutputEncoding(data.inputEncoding)
 
         self.printData(subFile.path, data)
 
         try:
-            data.subtitles = self.parseFile(subFile, data.inputEncoding, data.fps)
+            data.subtitles = self.parseFile(subFile, content.text, data.fps)
             if self._args.sync:
-                syncpoints = syncparse.parse(self._args.sync, data.subtitles)
-                ts = TimeSync(data.subtitles)
-                ts.sync(syncpoints)
+                syncparse.sync(self._args.sync, data.subtitles)
         except SubException as msg:
             log.error(str(msg))
             return None
@@ -220,11 +413,23 @@ class SubApplication:
         data.verifyAll()
         return data
 
+    def _streamed(self, subFile):
+        if self._args.sync:
+            return False
+        return os.path.getsize(subFile.path) >= self.STREAMING_SIZE
+
     def _checkEncoding(self, encoding):
         if encoding not in ALL_ENCODINGS:
             raise SubException(_("Incorrect encoding: '%s'") % encoding)
         return encoding
 
+    def _outputFilePath(self, filePath, formatExtension):
+        outputPath = self._parsePathTemplate(self._args.outputPath, filePath)
+        if outputPath is None:
+            filename = os.path.splitext(filePath)[0]
+            outputPath = '.'.join((filename, formatExtension))
+        return outputPath
+
     def _parsePathTemplate(self, template, filePath):
         if template is not None:
             path, extension = os.path.splitext(filePath)
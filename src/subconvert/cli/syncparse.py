@@ -22,7 +22,7 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 import re
 import collections
 
-from subconvert.parsing.Offset import SyncPoint
+from subconvert.parsing.Offset import SyncPoint, TimeSync
 from subconvert.parsing.FrameTime import FrameTime
 from subconvert.utils.SubException import SubException, SubAssert
 from subconvert.utils.Locale import _
@@ -180,3 +180,22 @@ def parse(s, subs):
     if len(requests) == 1 and requests[0].type_ == _Request.Type.OFFSET:
         return _offset_subtitles(requests[0], subs)
     return _sync_subtitles(requests, subs)
+
+
+def sync(s, subs):
+    """Parses a given string and synchronises subtitles with it. A single offset (e.g. '+2s')
+    is applied with SubManager.offset() instead of creating a SyncPoint for each subtitle."""
+    if len(subs) == 0:
+        return
+
+    requests = _tokenize_request(s)
+
+    if len(requests) == 1 and requests[0].type_ == _Request.Type.OFFSET:
+        ft = requests[0].to_frametime(subs.fps)
+        starts, ends = subs.times()
+        SubAssert(min(starts) + ft.ms >= 0 and min(ends) + ft.ms >= 0,
+                  _('Sync: incorrect offset. '
+                    'Resulting subtitle time would be lower than 0'))
+        subs.offset(ft)
+    else:
+        TimeSync(subs).sync(_sync_subtitles(requests, subs))
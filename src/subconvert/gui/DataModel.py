@@ -19,6 +19,9 @@ You should have received a copy of the GNU General Public License
 along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import collections
+import logging
+
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QUndoStack
 
@@ -27,6 +30,8 @@ from subconvert.utils.SubFile import File, VideoInfo
 from subconvert.utils.SubtitleData import SubtitleData
 from subconvert.utils.SubException import SubException
 
+log = logging.getLogger('Subconvert.%s' % __name__)
+
 class SubtitleUndoStack(QUndoStack):
     def __init__(self, parent = None):
         super().__init__(parent)
@@ -36,6 +41,89 @@ class SubtitleUndoStack(QUndoStack):
         cmd.setup()
         super().push(cmd)
 
+    def memoryUsage(self):
+        """Return approximate number of bytes taken by data kept by commands. Subtitles shared by
+        many commands are counted only once."""
+        counted = set()
+        return sum(self.command(i).memoryUsage(counted) for i in range(self.count()))
+
+    def shrink(self, excess, discard = True):
+        """Try to free excess bytes by compressing data kept by the oldest commands and (when
+        it's not enough) by removing them from the stack. Return number of freed bytes."""
+        # Only undoable commands are touched: data of the others might be currently stored and
+        # commands above them are removed with the next push anyway.
+        commands = [self.command(i) for i in range(self.index())]
+        # Compressing subtitles which other snapshots keep as well would only copy them.
+        shared = self._sharedPartIds()
+        freed = 0
+        for cmd in commands:
+            if freed >= excess:
+                return freed
+            freed += cmd.compress(shared)
+
+        if not discard:
+            return freed
+
+        # Only the oldest commands can be removed. Commands which don't keep any data (e.g. pure
+        # offsets) are removed only when a newer one has to be removed as well, because they
+        # can't be undone anymore then.
+        removed = 0
+        for i, cmd in enumerate(commands):
+            if freed >= excess:
+                break
+            usage = cmd.memoryUsage(set(shared))
+            if usage > 0:
+                freed += usage
+                removed = i + 1
+        if removed > 0:
+            self._removeOldest(removed)
+        return freed
+
+    def _removeOldest(self, count):
+        """Remove a given number of the oldest commands. QUndoStack removes them only when its
+        undo limit is exceeded and the limit can't be changed on a non-empty stack, so the stack
+        is rebuilt from copies of the remaining commands."""
+        wasClean = self.isClean()
+        index = self.index() - count
+        # States below the removed commands can't be reached anymore.
+        cleanIndex = self.cleanIndex() - count if self.cleanIndex() >= count else -1
+        removed = [self.command(i) for i in range(count)]
+        remaining = [self.command(i).copy() for i in range(count, self.count())]
+
+        self.blockSignals(True)
+        try:
+            for cmd in removed:
+                cmd.discard()
+            self.clear()
+            # Copies are only put back on the stack, so they mustn't change any data.
+            for cmd in remaining:
+                cmd._rebuilding = True
+                super().push(cmd)
+            if cleanIndex >= 0:
+                self.setIndex(cleanIndex)
+                self.setClean()
+            else:
+                self.resetClean()
+            self.setIndex(index)
+        finally:
+            for cmd in remaining:
+                cmd._rebuilding = False
+            self.blockSignals(False)
+
+        self.indexChanged.emit(self.index())
+        self.canUndoChanged.emit(self.canUndo())
+        self.undoTextChanged.emit(self.undoText())
+        if self.isClean() != wasClean:
+            self.cleanChanged.emit(self.isClean())
+
+    def _sharedPartIds(self):
+        """Return ids of parts of subtitles which are kept by more than one snapshot."""
+        counts = collections.Counter()
+        for i in range(self.count()):
+            for snapshot in self.command(i).snapshots():
+                counts.update(snapshot.storagePartIds())
+        return set(partId for partId, count in counts.items() if count > 1)
+
 class DataController(QObject):
     _fileAdded = pyqtSignal(str, name = "fileAdded")
     _fileRemoved = pyqtSignal(str, name = "fileRemoved")
@@ -55,8 +143,11 @@ class DataController(QObject):
 
         self._parser = parser
 
-    def _parseFile(self, file_, inputEncoding, fps):
-        fileContent = file_.read(inputEncoding)
+        # Maximum number of bytes taken by undo history of each file and of all files
+        self._historyLimit = None
+        self._totalHistoryLimit = None
+
+    def _parseFile(self, fileContent, fps):
         return self._parser.parse(fileContent, fps)
 
     def createDataFromFile(self, filePath, inputEncoding = None, defaultFps = None):
@@ -70,13 +161,17 @@ class DataController(QObject):
                 and then perform an add/update operation"""
 
         file_ = File(filePath)
-        if inputEncoding is None:
-            inputEncoding = file_.detectEncoding()
-        inputEncoding = inputEncoding.lower()
+        # input encoding is detected (when it's not given) from the same buffer which is decoded
+        content = file_.load(inputEncoding)
+        inputEncoding = content.encoding.lower()
 
         videoInfo = VideoInfo(defaultFps) if defaultFps is not None else file_.detectFps()
 
-        subtitles = self._parseFile(file_, inputEncoding, videoInfo.fps)
+        subtitles = self._parseFile(content.text, videoInfo.fps)
+        if self._parser.parsedWithLowConfidence():
+            log.warning(_("Format of '%(file)s' is uncertain. It was parsed as %(fmt)s "
+                "(confidence: %(conf).2f).") % {"file": filePath,
+                "fmt": self._parser.parsedFormat().NAME, "conf": self._parser.parsedConfidence()})
 
         data = SubtitleData()
         data.subtitles = subtitles
@@ -101,6 +196,41 @@ class DataController(QObject):
                 self._history[cmd.filePath].clear()
         else:
             self._history[cmd.filePath].push(cmd)
+            self._limitHistoryMemory(cmd.filePath)
+
+    def setHistoryMemoryLimits(self, fileLimit, totalLimit):
+        """Set how many bytes undo history can take for each file and for all files. None means
+        that there's no limit."""
+        self._historyLimit = fileLimit
+        self._totalHistoryLimit = totalLimit
+        for filePath in self._history:
+            self._limitHistoryMemory(filePath)
+
+    def historyMemoryUsage(self, filePath = None):
+        """Return approximate number of bytes taken by undo history of a given file or of all
+        files."""
+        if filePath is not None:
+            return self._history[filePath].memoryUsage()
+        return sum(history.memoryUsage() for history in self._history.values())
+
+    def _limitHistoryMemory(self, filePath):
+        if self._historyLimit is not None:
+            history = self._history[filePath]
+            excess = history.memoryUsage() - self._historyLimit
+            if excess > 0:
+                history.shrink(excess)
+
+        if self._totalHistoryLimit is not None:
+            usage = dict((path, history.memoryUsage()) for path, history in self._history.items())
+            excess = sum(usage.values()) - self._totalHistoryLimit
+            # Compress histories of all files before any commands are removed, starting with the
+            # biggest ones.
+            paths = sorted(usage, key = usage.get, reverse = True)
+            for discard in (False, True):
+                for path in paths:
+                    if excess <= 0:
+                        return
+                    excess -= self._history[path].shrink(excess, discard)
 
     def count(self):
         return len(self._storage)
@@ -22,6 +22,7 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 import os
 import logging
 import bisect
+import functools
 from string import Template
 
 from PyQt5.QtWidgets import QMainWindow, QWidget, QFileDialog, QVBoxLayout, QAction, qApp
@@ -91,6 +92,7 @@ class MainWindow(QMainWindow):
         self._subtitleData = DataController(parser, self)
 
         self.__initGui()
+        self.__initHistoryLimits()
         self.__initActions()
         self.__initMenuBar()
         self.__initShortcuts()
@@ -123,6 +125,14 @@ class MainWindow(QMainWindow):
         self.setWindowIcon(QIcon(":/img/logo.png"))
         self.setWindowTitle('Subconvert')
 
+    def __initHistoryLimits(self):
+        def toBytes(mib):
+            return mib * 1024 * 1024 if mib > 0 else None
+
+        self._subtitleData.setHistoryMemoryLimits(
+            toBytes(self._settings.getHistoryMemoryLimit()),
+            toBytes(self._settings.getTotalHistoryMemoryLimit()))
+
     def __connectSignals(self):
         self._tabs.tabChanged.connect(self.__updateMenuItemsState)
         self._tabs.tabChanged.connect(self.__updateWindowTitle)
@@ -348,7 +358,8 @@ class MainWindow(QMainWindow):
 
         data = self._subtitleData.data(filePath)
         converter = SubConverter()
-        content = converter.convert(data.outputFormat, data.subtitles)
+        content = functools.partial(converter.convertTo,
+            Format = data.outputFormat, subtitles = data.subtitles)
 
         if File.exists(newFilePath):
             file_ = File(newFilePath)
@@ -20,8 +20,13 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import io
+import zlib
+import pickle
 
-from subconvert.parsing.Core import Subtitle
+from subconvert.parsing.Core import Subtitle, SubManager
+from subconvert.parsing.FrameTime import FrameTime
+from subconvert.parsing.Offset import TimeSync
 from subconvert.utils.Locale import _, P_
 from subconvert.utils.SubException import SubException, SubAssert
 
@@ -44,6 +49,137 @@ class IncorrectFilePath(SubException):
 class DoubleFileEntry(SubException):
     pass
 
+def _storageParts(obj):
+    """Return parts of SubtitleData or SubManager which might be shared with other ones. See
+    SubManager.storageParts()."""
+    subtitles = getattr(obj, 'subtitles', obj)
+    if isinstance(subtitles, SubManager):
+        return subtitles.storageParts()
+    return []
+
+def _storagePartIds(obj):
+    """Return a frozenset of ids of _storageParts(obj)."""
+    subtitles = getattr(obj, 'subtitles', obj)
+    if isinstance(subtitles, SubManager):
+        return subtitles.storagePartIds()
+    return frozenset()
+
+class _SharingPickler(pickle.Pickler):
+    """Pickles an object without a given list of its parts, which are referenced by their
+    indices instead."""
+    def __init__(self, file, shared):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._indices = dict((id(part), i) for i, part in enumerate(shared))
+
+    def persistent_id(self, obj):
+        return self._indices.get(id(obj))
+
+class _SharingUnpickler(pickle.Unpickler):
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid):
+        return self._shared[pid]
+
+def _dumps(obj, shared):
+    buf = io.BytesIO()
+    _SharingPickler(buf, shared).dump(obj)
+    return buf.getvalue()
+
+def _loads(data, shared):
+    return _SharingUnpickler(io.BytesIO(data), shared).load()
+
+class Snapshot:
+    """Data kept by a command for undo or redo. When history takes too much memory, snapshot can be
+    compressed (it's then kept pickled and each get() returns a new copy) or discarded.
+
+    Snapshots of subtitles usually share their storage with live data and with each other (see
+    SubManager.storageParts()). Parts which are kept by someone else don't take any additional
+    memory, so they're neither counted nor compressed."""
+    def __init__(self, obj):
+        self._obj = obj
+        self._compressed = None
+        self._shared = [] # parts which were kept by someone else when snapshot was compressed
+        self._sharedIds = frozenset()
+        self._sizes = {} # ids of parts kept by someone else: size of the rest of snapshot
+        self._partSizes = {} # id of a shared part: its pickled size
+
+    def get(self):
+        if self._compressed is not None:
+            return _loads(zlib.decompress(self._compressed), self._shared)
+        return self._obj
+
+    def keeps(self, obj):
+        """Return whether snapshot keeps a given object (and not its copy)."""
+        return self._obj is not None and self._obj is obj
+
+    def storagePartIds(self):
+        """Return ids of parts of subtitles which snapshot keeps (and not their copies)."""
+        if self._compressed is not None:
+            return self._sharedIds
+        return _storagePartIds(self._obj)
+
+    def size(self, live = None, shared = ()):
+        """Return approximate number of bytes taken by snapshot (its pickled or compressed size)
+        without parts of subtitles kept by a given live data or listed (by their ids) in
+        'shared'."""
+        if self._obj is None and self._compressed is None:
+            return 0
+        excluded = self._excludedIds(live, shared)
+        if excluded not in self._sizes:
+            if self._compressed is not None:
+                self._sizes[excluded] = len(self._compressed) + sum(self._partSize(part)
+                    for part in self._shared if id(part) not in excluded)
+            else:
+                parts = [part for part in _storageParts(self._obj) if id(part) in excluded]
+                self._sizes = {excluded: len(_dumps(self._obj, parts))}
+        return self._sizes[excluded]
+
+    def compress(self, live = None, shared = ()):
+        """Compress snapshot without parts of subtitles kept by a given live data or listed (by
+        their ids) in 'shared'. Return number of saved bytes."""
+        excluded = self._excludedIds(live, shared)
+        if self._obj is None and excluded == self._sharedIds:
+            return 0
+        size = self.size(live, shared)
+        obj = self.get()
+        parts = [part for part in _storageParts(obj) if id(part) in excluded]
+        self._compressed = zlib.compress(_dumps(obj, parts))
+        self._shared = parts
+        self._sharedIds = frozenset(id(part) for part in parts)
+        self._obj = None
+        self._sizes = {}
+        return size - self.size(live, shared)
+
+    def discard(self):
+        self._obj = None
+        self._compressed = None
+        self._shared = []
+        self._sharedIds = frozenset()
+        self._sizes = {}
+        self._partSizes = {}
+
+    def _excludedIds(self, live, shared):
+        """Return ids of parts kept by snapshot which are kept by a given live data as well or
+        are listed in 'shared'."""
+        ids = self.storagePartIds()
+        liveIds = _storagePartIds(live)
+        # Clones of subtitles share their ids until they're changed. It's the usual case and it's
+        # much cheaper than intersecting ids of all subtitles.
+        if ids is liveIds:
+            return ids
+        excluded = ids.intersection(liveIds)
+        if shared:
+            excluded = excluded.union(ids.intersection(shared))
+        return excluded
+
+    def _partSize(self, part):
+        # parts are kept by snapshot, so their ids don't change
+        if id(part) not in self._partSizes:
+            self._partSizes[id(part)] = len(pickle.dumps(part, pickle.HIGHEST_PROTOCOL))
+        return self._partSizes[id(part)]
+
 def subExcerpt(sub):
     maxChars = 20
     if len(sub.text) > maxChars:
@@ -51,11 +187,73 @@ def subExcerpt(sub):
     return sub.text
 
 class SubtitleChangeCommand(QUndoCommand):
-    """Base class for all Subconvert undo/redo actions."""
+    """Base class for all Subconvert undo/redo actions. Subclasses implement _redo() and _undo()
+    and keep data required by them in Snapshots returned by snapshots()."""
     def __init__(self, filePath, parent = None):
         super(SubtitleChangeCommand, self).__init__(parent)
         self._controller = None
         self._filePath = filePath
+        self._rebuilding = False
+
+    def redo(self):
+        if not self._rebuilding:
+            self._redo()
+
+    def undo(self):
+        if not self._rebuilding:
+            self._undo()
+
+    def _redo(self):
+        pass
+
+    def _undo(self):
+        pass
+
+    def snapshots(self):
+        return []
+
+    def memoryUsage(self, counted = None):
+        """Return approximate number of bytes taken by data kept for undo and redo. Parts of
+        subtitles which ids are in 'counted' set aren't counted and parts kept by this command are
+        added to it, so parts shared by many commands can be counted only once."""
+        if counted is None:
+            counted = set()
+        stored = self._storedData()
+        usage = 0
+        for snapshot in self._idleSnapshots(stored):
+            usage += snapshot.size(stored, counted)
+            counted.update(snapshot.storagePartIds())
+        return usage
+
+    def compress(self, shared = ()):
+        """Compress data kept for undo and redo, except parts of subtitles which ids are in
+        'shared' (e.g. because other commands keep them as well). Return number of saved bytes."""
+        stored = self._storedData()
+        return sum(snapshot.compress(stored, shared) for snapshot in self._idleSnapshots(stored))
+
+    def discard(self):
+        """Discard data kept for undo and redo. It's called when command is removed from a stack,
+        so its data is freed even when something still references the command."""
+        for snapshot in self.snapshots():
+            snapshot.discard()
+
+    def copy(self):
+        """Return a copy of this command which keeps the same data. QUndoStack deletes commands
+        which it removes, so copies of the remaining ones are pushed when a stack is rebuilt."""
+        other = self.__class__.__new__(self.__class__)
+        QUndoCommand.__init__(other, self.text())
+        other.__dict__.update(self.__dict__)
+        return other
+
+    def _storedData(self):
+        if self.controller is None:
+            return None
+        return self.controller._storage.get(self.filePath)
+
+    def _idleSnapshots(self, stored):
+        # Data which is currently stored by controller is modified in place by other commands, so
+        # it's neither compressed nor counted as history.
+        return [snapshot for snapshot in self.snapshots() if not snapshot.keeps(stored)]
 
     def setup(self):
         """When subclassing remember to call SubtitleChangeCommand::setup() to perform generic
@@ -97,14 +295,14 @@ class ChangeSubtitle(SubtitleChangeCommand):
         if type(self._newSubtitle) is not Subtitle:
             raise TypeError("New subtitle are not of type 'Subtitle'!")
 
-    def redo(self):
+    def _redo(self):
         storage = self.controller._storage[self.filePath]
         storage.subtitles.changeSubText(self._subNo, self._newSubtitle.text)
         storage.subtitles.changeSubStart(self._subNo, self._newSubtitle.start)
         storage.subtitles.changeSubEnd(self._subNo, self._newSubtitle.end)
         self.controller.subtitlesChanged.emit(self.filePath, [self._subNo])
 
-    def undo(self):
+    def _undo(self):
         storage = self.controller._storage[self.filePath]
         storage.subtitles.changeSubText(self._subNo, self._oldSubtitle.text)
         storage.subtitles.changeSubStart(self._subNo, self._oldSubtitle.start)
@@ -119,7 +317,7 @@ class ChangeData(SubtitleChangeCommand):
         else:
             self.setText(desc)
 
-        self._newData = newData.clone()
+        self._newData = Snapshot(newData.clone())
         self._oldData = None
 
     def setup(self):
@@ -130,16 +328,119 @@ class ChangeData(SubtitleChangeCommand):
         #  A little hackish way to avoid passing oldData to ChangeData command (which would require
         #  unnecessary deepcopies).
         if self._oldData is None:
-            self._oldData = self.controller.data(self.filePath)
+            self._oldData = Snapshot(self.controller.data(self.filePath))
 
-        self._newData.verifyAll()
+        self._newData.get().verifyAll()
 
-    def redo(self):
-        self.controller._storage[self.filePath] = self._newData
+    def snapshots(self):
+        return [self._oldData, self._newData]
+
+    def _redo(self):
+        # Stored data is modified in place by the following commands, but their undo might be
+        # performed on a different object (e.g. on old data of the next ChangeData), so newData
+        # must stay intact.
+        self.controller._storage[self.filePath] = self._newData.get().clone()
         self.controller.fileChanged.emit(self.filePath)
 
-    def undo(self):
-        self.controller._storage[self.filePath] = self._oldData
+    def _undo(self):
+        self.controller._storage[self.filePath] = self._oldData.get()
+        self.controller.fileChanged.emit(self.filePath)
+
+class OffsetSubtitles(SubtitleChangeCommand):
+    """Moves all subtitles by a given FrameTime. Only the offset is stored unless some times are
+    kept in frames: offset converts them to milliseconds, so they have to be saved for undo."""
+    def __init__(self, filePath, ft, parent = None):
+        super().__init__(filePath, parent)
+        self.setText(_("Offset by: %s") % ft.toStr())
+        self._ft = ft
+        self._oldTimes = None
+
+    def setup(self):
+        super().setup()
+        if not self.controller.fileExists(self.filePath):
+            raise IncorrectFilePath("No entry to update for %s" % self.filePath)
+        subtitles = self.controller._storage[self.filePath].subtitles
+        SubAssert(subtitles.size() == 0 or subtitles.fps == self._ft.fps,
+            "Offset fps must be equal to subtitles fps")
+        if not subtitles.timesInMs():
+            self._oldTimes = Snapshot(subtitles.timesState())
+
+    def snapshots(self):
+        return [] if self._oldTimes is None else [self._oldTimes]
+
+    def _redo(self):
+        storage = self.controller._storage[self.filePath]
+        storage.subtitles.offset(self._ft)
+        self.controller.fileChanged.emit(self.filePath)
+
+    def _undo(self):
+        storage = self.controller._storage[self.filePath]
+        if self._oldTimes is None:
+            storage.subtitles.offset(FrameTime.fromMs(self._ft.fps, -self._ft.ms))
+        else:
+            storage.subtitles.restoreTimes(self._oldTimes.get())
+        self.controller.fileChanged.emit(self.filePath)
+
+class ChangeFps(SubtitleChangeCommand):
+    """Changes FPS of subtitles. Canonical times don't change with FPS, so changing it back is
+    enough to undo."""
+    def __init__(self, filePath, fps, desc = None, parent = None):
+        super().__init__(filePath, parent)
+        if desc is None:
+            self.setText(_("FPS change: %s") % fps)
+        else:
+            self.setText(desc)
+        self._fps = fps
+        self._oldFps = None
+
+    def setup(self):
+        super().setup()
+        if not self.controller.fileExists(self.filePath):
+            raise IncorrectFilePath("No entry to update for %s" % self.filePath)
+        if self._oldFps is None:
+            self._oldFps = self.controller._storage[self.filePath].fps
+
+    def _redo(self):
+        self._changeFps(self._fps)
+
+    def _undo(self):
+        self._changeFps(self._oldFps)
+
+    def _changeFps(self, fps):
+        storage = self.controller._storage[self.filePath]
+        storage.subtitles.changeFps(fps)
+        storage.fps = fps
+        self.controller.fileChanged.emit(self.filePath)
+
+class SyncSubtitles(SubtitleChangeCommand):
+    """Synchronizes subtitles with a given list of SyncPoints. Only subtitle times are saved for
+    undo."""
+    def __init__(self, filePath, syncPoints, parent = None):
+        super().__init__(filePath, parent)
+        self.setText(_("Subtitles synchronization"))
+        self._syncPoints = list(syncPoints)
+        self._oldTimes = None
+
+    def setup(self):
+        super().setup()
+        if not self.controller.fileExists(self.filePath):
+            raise IncorrectFilePath("No entry to update for %s" % self.filePath)
+        if self._oldTimes is None:
+            subtitles = self.controller._storage[self.filePath].subtitles
+            self._oldTimes = Snapshot(subtitles.timesState())
+
+    def snapshots(self):
+        return [self._oldTimes]
+
+    def _redo(self):
+        storage = self.controller._storage[self.filePath]
+        # TimeSync sorts and extends a given list
+        TimeSync(storage.subtitles).sync(list(self._syncPoints))
+        self.controller.fileChanged.emit(self.filePath)
+
+    def _undo(self):
+        storage = self.controller._storage[self.filePath]
+        storage.subtitles.restoreTimes(self._oldTimes.get())
         self.controller.fileChanged.emit(self.filePath)
 
 class NewSubtitles(SubtitleChangeCommand):
@@ -155,11 +456,11 @@ class NewSubtitles(SubtitleChangeCommand):
             raise DoubleFileEntry("'%s' cannot be added twice" % self._filePath)
         self._newData = self.controller.createDataFromFile(self._filePath, self._encoding)
 
-    def redo(self):
+    def _redo(self):
         self.controller._storage[self.filePath] = self._newData
         self.controller.fileAdded.emit(self.filePath)
 
-    def undo(self):
+    def _undo(self):
         pass
 
 class CreateSubtitlesFromData(SubtitleChangeCommand):
@@ -174,11 +475,11 @@ class CreateSubtitlesFromData(SubtitleChangeCommand):
             raise DoubleFileEntry("'%s' cannot be added twice" % self._filePath)
         self._newData.verifyAll()
 
-    def redo(self):
+    def _redo(self):
         self.controller._storage[self.filePath] = self._newData
         self.controller.fileAdded.emit(self.filePath)
 
-    def undo(self):
+    def _undo(self):
         pass
 
 class RemoveFile(SubtitleChangeCommand):
@@ -193,14 +494,14 @@ class RemoveFile(SubtitleChangeCommand):
         if not self.controller.fileExists(self.filePath):
             raise IncorrectFilePath("Cannot remove '%s'. It doesn't exist!" % self._filePath)
 
-    def redo(self):
+    def _redo(self):
         history = self.controller._history[self._filePath]
         history.deleteLater() # C++ delete on next Qt event loop enter
         del self.controller._history[self._filePath] # Python delete from dict
         del self.controller._storage[self._filePath]
         self.controller.fileRemoved.emit(self._filePath)
 
-    def undo(self):
+    def _undo(self):
         pass
 
 class AddSubtitle(SubtitleChangeCommand):
@@ -216,12 +517,12 @@ class AddSubtitle(SubtitleChangeCommand):
         SubAssert(storage.subtitles.size() == 0 or storage.subtitles.fps == self._subtitle.fps,
             "All subtitles must have equal fps values")
 
-    def redo(self):
+    def _redo(self):
         storage = self.controller._storage[self.filePath]
         storage.subtitles.insert(self._subNo, self._subtitle)
         self.controller.subtitlesAdded.emit(self.filePath, [self._subNo])
 
-    def undo(self):
+    def _undo(self):
         storage = self.controller._storage[self.filePath]
         storage.subtitles.remove(self._subNo)
         self.controller.subtitlesRemoved.emit(self.filePath, [self._subNo])
@@ -233,6 +534,7 @@ class RemoveSubtitles(SubtitleChangeCommand):
         # we'll remove from the highest subtitle to keep things simple
         self._subNos = subNos
         self._subNos.sort(reverse = True)
+        self._subs = Snapshot([])
 
     def setup(self):
         super().setup()
@@ -251,19 +553,23 @@ class RemoveSubtitles(SubtitleChangeCommand):
                 "noOfSubs" : len(self._subNos) 
             })
 
-        self._subs = []
+        subs = []
         for subNo in self._subNos:
-            self._subs.append((subNo, storage.subtitles[subNo]))
+            subs.append((subNo, storage.subtitles[subNo]))
+        self._subs = Snapshot(subs)
 
-    def redo(self):
+    def snapshots(self):
+        return [self._subs]
+
+    def _redo(self):
         storage = self.controller._storage[self.filePath]
-        for sub in self._subs:
-            storage.subtitles.remove(sub[0])
+        for subNo in self._subNos:
+            storage.subtitles.remove(subNo)
         self.controller.subtitlesRemoved.emit(self.filePath, self._subNos)
 
-    def undo(self):
+    def _undo(self):
         storage = self.controller._storage[self.filePath]
-        for sub in reversed(self._subs):
+        for sub in reversed(self._subs.get()):
             storage.subtitles.insert(sub[0], sub[1])
         self.controller.subtitlesAdded.emit(self.filePath,
                                             list(reversed(self._subNos)))
@@ -404,9 +404,7 @@ class FileList(SubTab):
             filePath = item.text(0)
             data = self._subtitleData.data(filePath)
             if data.fps != fps:
-                data.subtitles.changeFps(fps)
-                data.fps = fps
-                command = ChangeData(filePath, data, _("FPS: %s") % fps)
+                command = ChangeFps(filePath, fps, _("FPS: %s") % fps)
                 self._subtitleData.execute(command)
 
     def changeSelectedFilesVideoPath(self, path):
@@ -436,10 +434,7 @@ class FileList(SubTab):
             if fps is None:
                 log.error(_("No FPS for '%s' (empty subtitles)." % filePath))
                 continue
-            ft = FrameTime(fps, seconds=seconds)
-            data.subtitles.offset(ft)
-            command = ChangeData(filePath, data,
-                                _("Offset by: %s") % ft.toStr())
+            command = OffsetSubtitles(filePath, FrameTime(fps, seconds=seconds))
             self._subtitleData.execute(command)
 
     def detectSelectedFilesFps(self):
@@ -755,9 +750,7 @@ class SubtitleEditor(SubTab):
     def changeFps(self, fps):
         data = self.data
         if data.fps != fps:
-            data.subtitles.changeFps(fps)
-            data.fps = fps
-            command = ChangeData(self.filePath, data, _("FPS: %s") % fps)
+            command = ChangeFps(self.filePath, fps, _("FPS: %s") % fps)
             self._subtitleData.execute(command)
 
     def changeVideoPath(self, path):
@@ -773,10 +766,7 @@ class SubtitleEditor(SubTab):
         if fps is None:
             log.error(_("No FPS for '%s' (empty subtitles)." % self.filePath))
             return
-        ft = FrameTime(data.subtitles.fps, seconds=seconds)
-        data.subtitles.offset(ft)
-        command = ChangeData(self.filePath, data,
-                             _("Offset by: %s") % ft.toStr())
+        command = OffsetSubtitles(self.filePath, FrameTime(fps, seconds=seconds))
         self._subtitleData.execute(command)
 
     def detectFps(self):
@@ -801,7 +791,7 @@ class SubtitleEditor(SubTab):
 
     def refreshSubtitles(self):
         self._model.removeRows(0, self._model.rowCount())
-        for sub in self.subtitles:
+        for sub in self.subtitles.view():
             self._model.appendRow(createRow(sub))
 
     def updateTab(self):
@@ -906,7 +896,7 @@ class SearchBar(QWidget):
         if self._sit is None:
             data = self.parent().data
             case = any(map(str.isupper, self._editor.text()))
-            self._sit = SearchIterator(data.subtitles,
+            self._sit = SearchIterator(data.subtitles.view(),
                 lambda sub, text = self._editor.text(), case = case: matchText(sub, text, case))
 
         self._updateIteratorPositionFromSelection(direction)
@@ -68,7 +68,7 @@ class SubTabWidget(QWidget):
 
         self._toolbox.addTool(Details(self._subtitleData, self))
         self._toolbox.addTool(Synchronizer(videoWidget, self._subtitleData, self))
-        self._toolbox.addTool(History(self))
+        self._toolbox.addTool(History(self._subtitleData, self))
 
         self.rightWidget = QWidget()
         rightLayout = QGridLayout()
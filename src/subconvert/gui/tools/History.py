@@ -19,14 +19,32 @@ You should have received a copy of the GNU General Public License
 along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from PyQt5.QtWidgets import QVBoxLayout, QUndoView
+from PyQt5.QtWidgets import QVBoxLayout, QUndoView, QLabel
+from PyQt5.QtCore import QTimer
 
 from subconvert.gui.ToolBox import Tool
 from subconvert.utils.Locale import _
 
+def formatSize(size):
+    if size < 1024:
+        return _("%d B") % size
+    if size < 1024 * 1024:
+        return _("%.1f KiB") % (size / 1024)
+    return _("%.1f MiB") % (size / (1024 * 1024))
+
 class History(Tool):
-    def __init__(self, parent = None):
+    def __init__(self, subtitleData, parent = None):
         super().__init__(parent)
+        self._filePath = None
+        self._subtitleData = subtitleData
+        self._connectSignals()
+
+    def _connectSignals(self):
+        # All commands emit one of these signals on each undo and redo
+        self._subtitleData.fileChanged.connect(self._historyChanged)
+        self._subtitleData.subtitlesChanged.connect(self._historyChanged)
+        self._subtitleData.subtitlesAdded.connect(self._historyChanged)
+        self._subtitleData.subtitlesRemoved.connect(self._historyChanged)
 
     @property
     def name(self):
@@ -34,6 +52,29 @@ class History(Tool):
 
     def setContent(self, widget):
         self.clear()
+        self._filePath = widget.filePath
         undoview = QUndoView(widget.history, self)
         undoview.setEmptyLabel(_("<Original file>"))
         self.layout().addWidget(undoview)
+
+        self._memoryLabel = QLabel(self)
+        self._memoryLabel.setWordWrap(True)
+        self.layout().addWidget(self._memoryLabel)
+        self._updateMemoryUsage()
+
+    def clear(self):
+        super().clear()
+        self._memoryLabel = None
+
+    def _historyChanged(self, filePath, *args):
+        if filePath == self._filePath:
+            # history might be compacted after a command is pushed
+            QTimer.singleShot(0, self._updateMemoryUsage)
+
+    def _updateMemoryUsage(self):
+        if self._memoryLabel is None or not self._subtitleData.fileExists(self._filePath):
+            return
+        self._memoryLabel.setText(_("Memory used by history: %(file)s (all files: %(total)s)") % {
+            "file" : formatSize(self._subtitleData.historyMemoryUsage(self._filePath)),
+            "total" : formatSize(self._subtitleData.historyMemoryUsage()),
+        })
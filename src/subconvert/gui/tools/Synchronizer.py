@@ -21,10 +21,10 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 
 from collections import namedtuple, defaultdict
 
-from subconvert.parsing.Offset import SyncPoint, TimeSync
+from subconvert.parsing.Offset import SyncPoint
 from subconvert.gui.ToolBox import Tool
 from subconvert.gui.SubModel import createRow, SubListItemDelegate, CustomDataRoles
-from subconvert.gui.SubtitleCommands import ChangeData
+from subconvert.gui.SubtitleCommands import SyncSubtitles
 from subconvert.utils.Locale import _
 
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QErrorMessage
@@ -92,11 +92,9 @@ class Synchronizer(Tool):
         if len(syncpoints) == 0:
             return
 
-        ts = TimeSync(self._current.data.subtitles)  # in-place sync
-        ts.sync(syncpoints)
-        command = ChangeData(self._current.editor.filePath, self._current.data,
-                             _("Subtitles synchronization"))
-        self._subtitleData.execute(command)
+        path = self._current.editor.filePath
+        self._subtitleData.execute(SyncSubtitles(path, syncpoints))
+        self._current = self._current._replace(data=self._subtitleData.data(path))
 
     @pyqtSlot()
     def addPoint(self):
@@ -22,8 +22,11 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 import os
 import re
 import codecs
+import itertools
+import functools
+from array import array
 
-from subconvert.parsing.FrameTime import FrameTime
+from subconvert.parsing.FrameTime import FrameTime, FrameTimeType
 from subconvert.utils.Locale import _
 from subconvert.utils.SubException import SubException, SubAssert
 from subconvert.utils.Alias import *
@@ -96,6 +99,41 @@ class Subtitle():
     def empty(self):
         return not (bool(self._start) or bool(self._end) or bool(self._text))
 
+class ReadOnlySubtitle:
+    """Read-only proxy of a subtitle stored in a SubManager. It reflects changes of a stored
+    subtitle, but it cannot change it. Times are copied on access, because FrameTime can be changed
+    in place. See SubManager.view()."""
+
+    __slots__ = ('_sub',)
+
+    def __init__(self, sub):
+        self._sub = sub
+
+    def clone(self):
+        return self._sub.clone()
+
+    @property
+    def start(self):
+        return self._sub.start.clone()
+
+    @property
+    def end(self):
+        return self._sub.end.clone()
+
+    @property
+    def text(self):
+        return self._sub.text
+
+    @property
+    def fps(self):
+        return self._sub.fps
+
+    def change(self, start = None, end = None, text = None):
+        raise TypeError("Subtitles of SubManager.view() cannot be changed")
+
+    def empty(self):
+        return self._sub.empty()
+
 class Header(AliasBase):
     def __init__(self):
         super(Header, self).__init__()
@@ -132,6 +170,21 @@ class SubParsingError(SubException):
         super().__init__("%d: %s" % (lineNo, message))
         self.lineNo = lineNo
 
+class SubConversionError(SubException):
+    '''Custom conversion error class.'''
+    def __init__(self, message, subNo):
+        super().__init__(message)
+        self.subNo = subNo
+
+def _pendingApplied(method):
+    """Decorator for SubManager methods which access stored subtitles. It applies pending FPS
+    change and offset before a decorated method is run. See SubManager.offset()."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._applyPending()
+        return method(self, *args, **kwargs)
+    return wrapper
+
 class SubManager:
     def __init__(self):
         self._subs = []
@@ -141,23 +194,112 @@ class SubManager:
         # new sub is appended again
         self._invalidTime = False
 
+        # FPS change and offset (in milliseconds) which haven't been applied to subtitles yet
+        self._pendingFps = None
+        self._pendingOffset = None
+
+        # Clones share a list of subtitles and Subtitle objects until they're changed. See clone().
+        self._sharedList = False
+        self._sharedSubs = False
+
+        # storageParts() and their ids, until the list of subtitles is changed
+        self._parts = None
+        self._partIds = None
+
     def _autoSetEnd(self, sub, nextSub = None):
-        endTime = None
+        # Computed on milliseconds directly, as it's done for every subtitle of formats without
+        # end times.
+        start = sub.start
+        startMs = start.ms
         if nextSub is None:
-            endTime = sub.start + FrameTime(sub.fps, seconds = 2.5)
+            endMs = startMs + 2500
+        else:
+            nextStart = nextSub.start
+            if nextStart.fps != start.fps:
+                SubAssert(False, _("FPS values are not equal"))
+            endMs = startMs + int(round((nextStart.ms - startMs) * 0.85))
+        sub.change(end = FrameTime.fromMs(start.fps, endMs))
+
+    def _applyPending(self):
+        fps = self._pendingFps
+        offset = self._pendingOffset
+        if fps is None and offset is None:
+            return
+        self._pendingFps = None
+        self._pendingOffset = None
+
+        self._ownSubs()
+        for sub in self._subs:
+            if fps is not None:
+                sub.fps = fps
+            if offset is not None:
+                subFps = sub.fps
+                sub.change(start = FrameTime.fromMs(subFps, sub.start.ms + offset),
+                    end = FrameTime.fromMs(subFps, sub.end.ms + offset))
+
+    def _ownList(self):
+        """Copy a list of subtitles shared with clones before it's changed."""
+        # the list is about to be changed
+        self._parts = None
+        if self._sharedList:
+            self._subs = list(self._subs)
+            self._sharedList = False
+
+    def _ownSub(self, subNo):
+        """Return a stored subtitle which can be changed in place."""
+        self._ownList()
+        if self._sharedSubs:
+            self._subs[subNo] = self._subs[subNo].clone()
+        return self._subs[subNo]
+
+    def _ownSubs(self):
+        """Make all stored subtitles changeable in place."""
+        if self._sharedSubs:
+            self._subs = [sub.clone() for sub in self._subs]
+            self._sharedList = False
+            self._sharedSubs = False
+            self._parts = None
         else:
-            endTime = sub.start + (nextSub.start - sub.start) * 0.85
-        sub.change(end = endTime)
+            self._ownList()
 
-    def clone(self):
-        other = SubManager()
+    def _shareWith(self, other):
         other._header = self._header.clone()
         other._invalidTime = self._invalidTime
-        other._subs = []
-        for sub in self._subs:
-            other._subs.append(sub.clone())
+        other._subs = self._subs
+        other._parts = self._parts
+        other._partIds = self._partIds
+        self._sharedList = other._sharedList = True
+        self._sharedSubs = other._sharedSubs = True
         return other
 
+    @_pendingApplied
+    def clone(self):
+        """Return a copy of SubManager. It's cheap: subtitles are shared between copies and copied
+        only when they're changed (copy-on-write)."""
+        return self._shareWith(SubManager())
+
+    def storageParts(self):
+        """Return objects in which subtitles are stored. Clones share them until they're changed,
+        so they tell which data is shared between managers. The same list is returned until
+        subtitles are changed, so it mustn't be modified."""
+        if self._parts is None:
+            self._parts = [self._subs] + self._subs
+            self._partIds = frozenset(id(part) for part in self._parts)
+        return self._parts
+
+    def storagePartIds(self):
+        """Return a frozenset of ids of storageParts()."""
+        self.storageParts()
+        return self._partIds
+
+    def __getstate__(self):
+        # ids are valid only in a current process and parts are computed again when needed
+        state = self.__dict__.copy()
+        if '_parts' in state:
+            state['_parts'] = state['_partIds'] = None
+        return state
+
+    @_pendingApplied
     def insert(self, subNo, sub):
         if subNo >= 0:
             if len(self._subs) < subNo:
@@ -165,67 +307,180 @@ class SubManager:
             else:
                 if sub.end is None:
                     self._autoSetEnd(sub, self._subs[subNo + 1])
+                self._ownList()
                 self._subs.insert(subNo, sub)
         else:
             raise ValueError("insert only accepts positive indices")
 
+    @_pendingApplied
     def append(self, sub):
         if self._invalidTime:
-            invalidSub = self._subs[-1]
+            invalidSub = self._ownSub(-1)
             self._autoSetEnd(invalidSub, sub)
             self._invalidTime = False
 
         if sub.end is None:
             self._autoSetEnd(sub)
             self._invalidTime = True
+        self._ownList()
         self._subs.append(sub)
 
     # TODO: test
+    @_pendingApplied
     def remove(self, subNo):
         if subNo == self.size() - 1:
             self._invalidTime = False
+        self._ownList()
         del self._subs[subNo]
 
+    @_pendingApplied
+    def popFront(self, count):
+        """Remove the first 'count' subtitles and return them in a list."""
+        self._ownList()
+        subs = self._subs[:count]
+        if self._sharedSubs:
+            subs = [sub.clone() for sub in subs]
+        del self._subs[:count]
+        if len(self._subs) == 0:
+            self._invalidTime = False
+        return subs
+
+    def hasPendingEnd(self):
+        """Return whether the last subtitle has been appended without an end time. Its end time
+        is calculated again when a next subtitle is appended."""
+        return self._invalidTime
+
     def clear(self):
         self._subs = []
         self._invalidTime = False
+        self._pendingFps = None
+        self._pendingOffset = None
+        self._sharedList = False
+        self._sharedSubs = False
+        self._parts = None
 
     # TODO: test
     @property
     def fps(self):
         if self.size() > 0:
+            if self._pendingFps is not None:
+                return self._pendingFps
             return self._subs[0].fps
         return None
 
     def changeFps(self, fps):
+        """Change FPS of all subtitles. Like offset(), it's applied when subtitles are accessed."""
         if not fps > 0:
             raise ValueError("Incorrect FPS value")
 
-        for sub in self._subs:
-            sub.fps = fps
+        # Pending offset must be applied with FPS which was set when offset() was called.
+        if self._pendingOffset is not None:
+            self._applyPending()
+        self._pendingFps = float(fps)
         return self
 
     # TODO: test
+    @_pendingApplied
     def changeSubText(self, subNo, newText):
-        self._subs[subNo].change(text = newText)
+        self._ownSub(subNo).change(text = newText)
         return self
 
     # TODO: test
+    @_pendingApplied
     def changeSubStart(self, subNo, newTime):
-        self._subs[subNo].change(start = newTime)
+        self._ownSub(subNo).change(start = newTime)
         return self
 
     # TODO: test
+    @_pendingApplied
     def changeSubEnd(self, subNo, newTime):
-        self._subs[subNo].change(end = newTime)
+        self._ownSub(subNo).change(end = newTime)
         if subNo == self.size() - 1:
             self._invalidTime = False
         return self
 
-    # TODO: test
     def offset(self, ft):
-        for sub in self._subs:
-            sub.change(start=sub.start + ft, end=sub.end + ft)
+        """Move all subtitles by a given FrameTime. Offset isn't applied right away: consecutive
+        offsets and FPS changes are composed in O(1) and applied to all subtitles at once, when
+        they're accessed (e.g. read, changed or converted)."""
+        if self.size() == 0:
+            return
+        SubAssert(ft.fps == self.fps, _("FPS values are not equal"))
+        self._pendingOffset = (self._pendingOffset or 0) + ft.ms
+
+    def view(self):
+        """Return a read-only sequence of subtitles. Contrary to indexing and iterating over
+        SubManager, subtitles aren't cloned. They're given as ReadOnlySubtitle proxies instead,
+        which cannot be changed. Use change* methods to change subtitles."""
+        return SubtitlesView(self)
+
+    @_pendingApplied
+    def _readonly(self, subNo):
+        return self._subs[subNo]
+
+    @_pendingApplied
+    def _iterReadonly(self):
+        return iter(self._subs)
+
+    @_pendingApplied
+    def times(self):
+        """Return start and end times of all subtitles as two arrays of milliseconds."""
+        starts = array('q', [sub.start.ms for sub in self._subs])
+        ends = array('q', [sub.end.ms for sub in self._subs])
+        return (starts, ends)
+
+    @_pendingApplied
+    def changeTimes(self, starts, ends):
+        """Change times of all subtitles at once. Both starts and ends are sequences of
+        milliseconds, one for each subtitle."""
+        SubAssert(len(starts) == len(ends) == self.size(), _("Incorrect number of times"))
+        # All times are replaced, so shared subtitles aren't cloned first. Both times of a stored
+        # subtitle have the same FPS, so they don't have to be validated again.
+        fromMs = FrameTime.fromMs
+        subs = []
+        for sub, start, end in zip(self._subs, starts, ends):
+            fps = sub._start._fps
+            newSub = object.__new__(Subtitle)
+            newSub._start = fromMs(fps, start)
+            newSub._end = fromMs(fps, end)
+            newSub._text = sub._text
+            subs.append(newSub)
+        self._subs = subs
+        self._sharedList = False
+        self._sharedSubs = False
+        self._parts = None
+        self._invalidTime = False
+        return self
+
+    @_pendingApplied
+    def timesInMs(self):
+        """Return whether all subtitle times are kept in milliseconds. They don't change when FPS
+        is changed and offset() can be exactly reverted with an opposite offset."""
+        return all(sub.start.origin == FrameTimeType.Time and sub.end.origin == FrameTimeType.Time
+            for sub in self._subs)
+
+    @_pendingApplied
+    def timesState(self):
+        """Return a compact copy of all subtitle times: arrays of their canonical values and
+        origins. Times can be brought back with restoreTimes()."""
+        subs = self._subs
+        return (array('q', [sub.start.value for sub in subs]),
+                array('b', [sub.start.origin for sub in subs]),
+                array('q', [sub.end.value for sub in subs]),
+                array('b', [sub.end.origin for sub in subs]))
+
+    @_pendingApplied
+    def restoreTimes(self, state):
+        """Restore subtitle times saved with timesState()."""
+        starts, startOrigins, ends, endOrigins = state
+        SubAssert(len(starts) == self.size(), _("Incorrect number of times"))
+        self._ownSubs()
+        for sub, start, startOrigin, end, endOrigin in zip(
+                self._subs, starts, startOrigins, ends, endOrigins):
+            fps = sub.fps
+            sub.change(start = FrameTime.fromValue(fps, startOrigin, start),
+                end = FrameTime.fromValue(fps, endOrigin, end))
+        return self
 
     def header(self):
         return self._header
@@ -233,22 +488,45 @@ class SubManager:
     def size(self):
         return len(self._subs)
 
+    def _keepsSubtitles(self, other):
+        """Return whether other manager keeps Subtitle objects, so they can be compared directly."""
+        return isinstance(other, SubManager) and not isinstance(other, ColumnarSubManager)
+
+    @_pendingApplied
     def __eq__(self, other):
+        if isinstance(other, ColumnarSubManager):
+            return other.__eq__(self)
+        if not self._keepsSubtitles(other):
+            return NotImplemented
+        other._applyPending()
         return self._subs == other._subs
 
     def __ne__(self, other):
-        return self._subs != other._subs
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
 
+    @_pendingApplied
     def __lt__(self, other):
+        if not self._keepsSubtitles(other):
+            return NotImplemented
+        other._applyPending()
         return self._subs < other._subs
 
+    @_pendingApplied
     def __gt__(self, other):
+        if not self._keepsSubtitles(other):
+            return NotImplemented
+        other._applyPending()
         return self._subs > other._subs
 
     # Do not implement __setitem__ as we want to keep explicit control over things that are added
+    @_pendingApplied
     def __getitem__(self, key):
         return self._subs[key].clone()
 
+    @_pendingApplied
     def __iter__(self):
         for sub in self._subs:
             yield sub.clone()
@@ -256,11 +534,511 @@ class SubManager:
     def __len__(self):
         return len(self._subs)
 
+class RawSubManager(SubManager):
+    """SubManager which keeps subtitle texts exactly as they're written in a file of a given format
+    (e.g. '<i>text</i>' instead of '{gsp_i_}text{_gsp_i}'). SubConverter converts them directly to
+    other formats, without a GSP round trip. Texts aren't GSP formatted, so only subtitle times
+    should be changed. See SubParser.parseRaw()."""
+
+    def __init__(self, inputFormat):
+        super().__init__()
+        self._inputFormat = inputFormat
+
+    @_pendingApplied
+    def clone(self):
+        return self._shareWith(RawSubManager(self._inputFormat))
+
+    def inputFormat(self):
+        return self._inputFormat
+
+class SubtitlesView:
+    """Read-only sequence of subtitles stored in a SubManager. See SubManager.view()."""
+
+    def __init__(self, subtitles):
+        self._subtitles = subtitles
+
+    def __getitem__(self, key):
+        return ReadOnlySubtitle(self._subtitles._readonly(key))
+
+    def __iter__(self):
+        return map(ReadOnlySubtitle, self._subtitles._iterReadonly())
+
+    def __len__(self):
+        return self._subtitles.size()
+
+class ColumnarSubManager(SubManager):
+    """SubManager which stores subtitles column by column instead of keeping Subtitle objects:
+    start and end times are kept in integer arrays, texts in a list and FPS only once. It uses a
+    small fraction of memory needed by SubManager. changeFps() is O(1), as times are kept as their
+    canonical values. offset() and changeTimes() still compute each time in Python, but they
+    build new time arrays instead of changing Subtitle objects one by one.
+
+    Subtitles are created on each access, so changing them doesn't change a manager. Use change*
+    methods instead. All subtitles must have the same FPS."""
+
+    _COLUMNS = ('_starts', '_startOrigins', '_ends', '_endOrigins', '_texts')
+
+    def __init__(self):
+        self._fps = None
+        self._header = Header()
+        self._invalidTime = False
+
+        # FPS is changed right away: it's O(1) anyway
+        self._pendingFps = None
+        self._pendingOffset = None
+
+        # FrameTimes are stored as pairs of their canonical values and origins
+        self._starts = array('q')
+        self._startOrigins = array('b')
+        self._ends = array('q')
+        self._endOrigins = array('b')
+        self._texts = []
+
+        # Names of columns shared with clones. They're copied before they're changed in place.
+        self._sharedColumns = set()
+
+    @classmethod
+    def fromSubtitles(cls, subtitles):
+        """Create ColumnarSubManager from any SubManager."""
+        other = cls()
+        other._header = subtitles.header().clone()
+        for sub in subtitles:
+            other._store(other.size(), sub)
+        other._invalidTime = subtitles._invalidTime
+        return other
+
+    def _store(self, subNo, sub):
+        if self.size() == 0:
+            self._fps = sub.fps
+        elif sub.fps != self._fps:
+            raise ValueError("Subtitle FPS values differ: %s != %s" % (self._fps, sub.fps))
+        self._own(*self._COLUMNS)
+        self._starts.insert(subNo, sub.start.value)
+        self._startOrigins.insert(subNo, sub.start.origin)
+        self._ends.insert(subNo, sub.end.value)
+        self._endOrigins.insert(subNo, sub.end.origin)
+        self._texts.insert(subNo, sub.text)
+
+    def _own(self, *columns):
+        for column in columns:
+            if column in self._sharedColumns:
+                setattr(self, column, getattr(self, column)[:])
+                self._sharedColumns.discard(column)
+
+    def _validateTime(self, ft):
+        if ft.fps != self._fps:
+            raise ValueError("Subtitle FPS values differ: %s != %s" % (self._fps, ft.fps))
+
+    def _msColumn(self, values, origins):
+        if FrameTimeType.Frame not in origins and FrameTimeType.Undefined not in origins:
+            return array('q', values)
+        fps = self._fps
+        return array('q', [value if origin == FrameTimeType.Time else
+                           int(round(value * 1000 / fps))
+                           for value, origin in zip(values, origins)])
+
+    def _applyPending(self):
+        offset = self._pendingOffset
+        if offset is None:
+            return
+        self._pendingOffset = None
+        starts = self._msColumn(self._starts, self._startOrigins)
+        ends = self._msColumn(self._ends, self._endOrigins)
+        self._setMsColumns([ms + offset for ms in starts], [ms + offset for ms in ends])
+
+    def _setMsColumns(self, starts, ends):
+        count = self.size()
+        self._starts = array('q', starts)
+        self._startOrigins = array('b', [FrameTimeType.Time]) * count
+        self._ends = array('q', ends)
+        self._endOrigins = array('b', [FrameTimeType.Time]) * count
+        self._sharedColumns.difference_update(('_starts', '_startOrigins', '_ends', '_endOrigins'))
+
+    def _subtitle(self, subNo):
+        # Stored subtitles are already validated
+        fps = self._fps
+        sub = object.__new__(Subtitle)
+        sub._start = FrameTime.fromValue(fps, self._startOrigins[subNo], self._starts[subNo])
+        sub._end = FrameTime.fromValue(fps, self._endOrigins[subNo], self._ends[subNo])
+        sub._text = self._texts[subNo]
+        return sub
+
+    @_pendingApplied
+    def _readonly(self, subNo):
+        return self._subtitle(subNo)
+
+    def _iterReadonly(self):
+        return iter(self)
+
+    @_pendingApplied
+    def clone(self):
+        """Return a copy of ColumnarSubManager. Columns are shared between copies, so it's cheap:
+        only a changed column is copied (e.g. texts, but not times, after changeSubText())."""
+        other = ColumnarSubManager()
+        other._fps = self._fps
+        other._header = self._header.clone()
+        other._invalidTime = self._invalidTime
+        for column in self._COLUMNS:
+            setattr(other, column, getattr(self, column))
+        self._sharedColumns = set(self._COLUMNS)
+        other._sharedColumns = set(self._COLUMNS)
+        return other
+
+    def storageParts(self):
+        return [getattr(self, column) for column in self._COLUMNS]
+
+    def storagePartIds(self):
+        return frozenset(id(part) for part in self.storageParts())
+
+    @_pendingApplied
+    def insert(self, subNo, sub):
+        if subNo >= 0:
+            if self.size() < subNo:
+                self.append(sub)
+            else:
+                if sub.end is None:
+                    self._autoSetEnd(sub, self._subtitle(subNo + 1))
+                self._store(subNo, sub)
+        else:
+            raise ValueError("insert only accepts positive indices")
+
+    @_pendingApplied
+    def append(self, sub):
+        if self._invalidTime:
+            invalidSub = self._subtitle(-1)
+            self._autoSetEnd(invalidSub, sub)
+            self._own('_ends', '_endOrigins')
+            self._ends[-1] = invalidSub.end.value
+            self._endOrigins[-1] = invalidSub.end.origin
+            self._invalidTime = False
+
+        if sub.end is None:
+            self._autoSetEnd(sub)
+            self._invalidTime = True
+        self._store(self.size(), sub)
+
+    @_pendingApplied
+    def remove(self, subNo):
+        if subNo == self.size() - 1:
+            self._invalidTime = False
+        self._own(*self._COLUMNS)
+        del self._starts[subNo]
+        del self._startOrigins[subNo]
+        del self._ends[subNo]
+        del self._endOrigins[subNo]
+        del self._texts[subNo]
+
+    @_pendingApplied
+    def popFront(self, count):
+        subs = [self._subtitle(subNo) for subNo in range(min(count, self.size()))]
+        self._own(*self._COLUMNS)
+        for column in self._COLUMNS:
+            del getattr(self, column)[:count]
+        if self.size() == 0:
+            self._invalidTime = False
+        return subs
+
+    def clear(self):
+        self._starts = array('q')
+        self._startOrigins = array('b')
+        self._ends = array('q')
+        self._endOrigins = array('b')
+        self._texts = []
+        self._invalidTime = False
+        self._pendingOffset = None
+        self._sharedColumns = set()
+
+    @property
+    def fps(self):
+        if self.size() > 0:
+            return self._fps
+        return None
+
+    def changeFps(self, fps):
+        if not fps > 0:
+            raise ValueError("Incorrect FPS value")
+
+        # Canonical FrameTime values don't depend on FPS, but pending offset must be applied with
+        # FPS which was set when offset() was called.
+        self._applyPending()
+        if self.size() > 0:
+            self._fps = float(fps)
+        return self
+
+    @_pendingApplied
+    def changeSubText(self, subNo, newText):
+        self._own('_texts')
+        self._texts[subNo] = newText
+        return self
+
+    @_pendingApplied
+    def changeSubStart(self, subNo, newTime):
+        self._validateTime(newTime)
+        self._own('_starts', '_startOrigins')
+        self._starts[subNo] = newTime.value
+        self._startOrigins[subNo] = newTime.origin
+        return self
+
+    @_pendingApplied
+    def changeSubEnd(self, subNo, newTime):
+        self._validateTime(newTime)
+        self._own('_ends', '_endOrigins')
+        self._ends[subNo] = newTime.value
+        self._endOrigins[subNo] = newTime.origin
+        if subNo == self.size() - 1:
+            self._invalidTime = False
+        return self
+
+    def offset(self, ft):
+        if self.size() == 0:
+            return
+        SubAssert(ft.fps == self._fps, _("FPS values are not equal"))
+        self._pendingOffset = (self._pendingOffset or 0) + ft.ms
+
+    @_pendingApplied
+    def times(self):
+        return (self._msColumn(self._starts, self._startOrigins),
+                self._msColumn(self._ends, self._endOrigins))
+
+    @_pendingApplied
+    def changeTimes(self, starts, ends):
+        SubAssert(len(starts) == len(ends) == self.size(), _("Incorrect number of times"))
+        self._setMsColumns(starts, ends)
+        self._invalidTime = False
+        return self
+
+    @_pendingApplied
+    def timesInMs(self):
+        for origin in (FrameTimeType.Frame, FrameTimeType.Undefined):
+            if origin in self._startOrigins or origin in self._endOrigins:
+                return False
+        return True
+
+    @_pendingApplied
+    def timesState(self):
+        return (array('q', self._starts), array('b', self._startOrigins),
+                array('q', self._ends), array('b', self._endOrigins))
+
+    @_pendingApplied
+    def restoreTimes(self, state):
+        starts, startOrigins, ends, endOrigins = state
+        SubAssert(len(starts) == self.size(), _("Incorrect number of times"))
+        # state is copied, so it can be restored again
+        self._starts = array('q', starts)
+        self._startOrigins = array('b', startOrigins)
+        self._ends = array('q', ends)
+        self._endOrigins = array('b', endOrigins)
+        self._sharedColumns.difference_update(('_starts', '_startOrigins', '_ends', '_endOrigins'))
+        return self
+
+    def size(self):
+        return len(self._texts)
+
+    @_pendingApplied
+    def __eq__(self, other):
+        # Subtitles of other managers are compared through their times and texts, so they're equal
+        # to ColumnarSubManager which stores the same subtitles.
+        if not isinstance(other, SubManager):
+            return NotImplemented
+        if isinstance(other, ColumnarSubManager):
+            otherTexts = other._texts
+        else:
+            otherTexts = [sub.text for sub in other.view()]
+        return (self.fps == other.fps and self._texts == otherTexts and
+                self.times() == other.times())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __lt__(self, other):
+        return NotImplemented
+
+    def __gt__(self, other):
+        return NotImplemented
+
+    @_pendingApplied
+    def __getitem__(self, key):
+        return self._subtitle(key)
+
+    @_pendingApplied
+    def __iter__(self):
+        for subNo in range(self.size()):
+            yield self._subtitle(subNo)
+
+    def __len__(self):
+        return len(self._texts)
+
+class FormatRegistry:
+    """Shared instances of subtitle formats. Compiling format patterns and renderers takes longer
+    than parsing or converting a short file, so each format is instantiated only once per process
+    and its instance is shared by all parsers and converters. Formats don't store any parsing
+    state, so it's safe."""
+
+    def __init__(self):
+        self._instances = {}
+
+    def register(self, Format):
+        """Build a shared instance of a given Format up front. Returns Format."""
+        self.instance(Format)
+        return Format
+
+    def instance(self, Format):
+        """Return a shared instance of a given Format."""
+        fmt = self._instances.get(Format)
+        if fmt is None:
+            fmt = Format()
+            self._instances[Format] = fmt
+        return fmt
+
+    def formats(self):
+        """Return all formats which have been instantiated so far."""
+        return list(self._instances)
+
+formatRegistry = FormatRegistry()
+
+def _iterLines(text):
+    """Iterate over lines of text, keeping line ends. Contrary to str.splitlines(), only '\\n' is
+    treated as a line end, just like in files opened in a text mode."""
+    start = 0
+    end = text.find('\n')
+    while end != -1:
+        yield text[start:end + 1]
+        start = end + 1
+        end = text.find('\n', start)
+    if start < len(text):
+        yield text[start:]
+
+class _FormatParser:
+    """Parsing state of a single subtitle format. Lines are fed one by one, so several formats can
+    be checked side by side during a single pass over the input."""
+
+    def __init__(self, Format, fps, maxHeaderLen, maxFmtSearch):
+        self.Format = Format
+        self.subtitles = SubManager()
+        self.confidence = None
+        self.parsed = 0
+        self.found = False
+        self.done = False
+        self.error = None
+
+        self._fmt = formatRegistry.instance(Format)
+        self._fps = fps
+        self._maxHeaderLen = maxHeaderLen
+        self._maxFmtSearch = maxFmtSearch
+        self._headerFound = False
+        self._headerMarkers = set(self._fmt.HEADER_MARKERS)
+
+        # Lines of a currently parsed section. They're joined only when the whole section is read.
+        self._section = []
+
+    def feed(self, lineNo, line, last):
+        """Parse a next line of input. Please note that time_to is not required to process as not
+        all subtitles provide it."""
+        try:
+            self._feed(lineNo, line, last)
+        except SubParsingError as err:
+            self.subtitles.clear()
+            self.error = err
+            self.done = True
+
+    def feedBuffer(self, buffer):
+        """Parse a whole buffer at once with a whole-buffer engine of line-oriented formats."""
+        try:
+            for offset, subtitle in self._fmt.parseBuffer(self._fps, buffer):
+                if not self.found and buffer.count('\n', 0, offset) > self._maxFmtSearch:
+                    break
+                if subtitle.start and subtitle.text:
+                    self.found = True
+                    try:
+                        self.subtitles.append(subtitle)
+                    except SubException as msg:
+                        raise SubParsingError(msg, buffer.count('\n', 0, offset))
+                    self.parsed += 1
+                elif subtitle.start and not subtitle.text:
+                    pass
+                else:
+                    break
+        except SubParsingError as err:
+            # Mismatch before any subtitle means that it's simply not this format.
+            if self.parsed > 0:
+                self.subtitles.clear()
+                self.error = err
+        self.done = True
+
+    def popCompleted(self, final = False):
+        """Remove and return parsed subtitles which won't change anymore. The last one might still
+        change its auto-calculated end time when a next subtitle is parsed, unless parsing is
+        finished."""
+        subs = self.subtitles
+        count = subs.size()
+        if subs.hasPendingEnd() and not final:
+            count -= 1
+        return subs.popFront(count)
+
+    def _feed(self, lineNo, line, last):
+        fmt = self._fmt
+        if not fmt.WITH_HEADER and not self.found and lineNo > self._maxFmtSearch:
+            self.done = True
+            return
+
+        self._section.append(line)
+        if fmt.WITH_HEADER and not self._headerFound:
+            if lineNo > self._maxHeaderLen:
+                self.done = True
+                return
+            if self._headerComplete(line):
+                self._headerFound = fmt.addHeaderInfo(''.join(self._section),
+                    self.subtitles.header())
+            if self._headerFound:
+                self.found = True
+                self._section = []
+        elif fmt.subtitleEnds(line) or last:
+            section = ''.join(self._section)
+            self._section = []
+            subtitle = fmt.createSubtitle(self._fps, section)
+            if subtitle is None:
+                if section in ('\n', '\r\n', '\r'):
+                    return
+                elif self.parsed > 0:
+                    raise SubParsingError(_("Parsing error"), lineNo)
+                else:
+                    self.done = True
+                    return
+
+            # store parsing result if new end marker occurred, then clear results
+            if subtitle.start and subtitle.text:
+                self.found = True
+                try:
+                    self.subtitles.append(subtitle)
+                except SubException as msg:
+                    raise SubParsingError(msg, lineNo)
+                self.parsed += 1
+            elif subtitle.start and not subtitle.text:
+                pass
+            else:
+                self.done = True
+                return
+
+    def _headerComplete(self, line):
+        """Incrementally check whether all HEADER_MARKERS of a format have already been found, so
+        header isn't parsed again and again for each line."""
+        if len(self._headerMarkers) > 0:
+            lowerLine = line.lower()
+            self._headerMarkers = set(
+                marker for marker in self._headerMarkers if marker not in lowerLine)
+        return len(self._headerMarkers) == 0
+
 class SubParser:
     def __init__(self):
         self._maxHeaderLen = 50
         self._maxFmtSearch = 35
+        self._sniffSize = 4096
+        self._lowConfidence = 0.5
         self._formatFound= False
+        self._confidence = None
 
         self._supportedFormats = set()
 
@@ -292,65 +1070,248 @@ class SubParser:
             return self._format
         return None
 
+    def parsedConfidence(self):
+        """Return how confident (0-1) sniffing was about a parsed format."""
+        if self._formatFound:
+            return self._confidence
+        return None
+
+    def parsedWithLowConfidence(self):
+        """Tell whether sniffing wasn't sure about a parsed format, i.e. other formats were found
+        at least as probable altogether. Such content might have been parsed as a wrong format."""
+        if self._formatFound:
+            return self._confidence <= self._lowConfidence
+        return False
+
+    def sniff(self, sample):
+        """Guess a format of a given text sample (e.g. the first few KB of a file). Return a list of
+        (Format, confidence) pairs for all registered formats, sorted from the most probable one.
+        Confidence is a number between 0 and 1."""
+        scores = [(Format, Format.sniff(sample)) for Format in self._supportedFormats]
+        total = sum(score for Format, score in scores)
+        if total > 0:
+            scores = [(Format, score / total) for Format, score in scores]
+        else:
+            scores = [(Format, 0.0) for Format, score in scores]
+        # formats which are equally probable are always judged in the same order
+        scores.sort(key = lambda item: (-item[1], item[0].NAME))
+        return scores
+
     def parse(self, content, fps = 25):
-        # return a new object each time (otherwise it'd contantly modify the same reference
-        self._subtitles = SubManager()
-        self._formatFound = False
-        for Format in self._supportedFormats:
-            if not self._formatFound:
-                subFormat = Format()
-                self._format = Format
-                try:
-                    self.__parseFormat(subFormat, content, fps)
-                except SubParsingError:
-                    self._subtitles.clear()
-                    raise
-        if self._subtitles.size() == 0:
+        """Parse a given content, which is either a whole text or an iterable of its lines."""
+        text = content if isinstance(content, str) else None
+        lines, guesses = self.__prepare(content)
+
+        # Line-oriented formats can be parsed all at once, which is much faster than feeding them
+        # line by line. Sniffing only counts format signatures, so the most probable format might
+        # still be a wrong one (e.g. SubRip subtitles which contain MicroDVD-like lines). Other
+        # formats are checked side by side then. Buffer engine gives the same results as the line
+        # loop, so the most probable format isn't parsed again.
+        if len(guesses) > 0:
+            Format, confidence = guesses[0]
+            if confidence > 0 and Format.LINE_ORIENTED:
+                buffer = text if text is not None else ''.join(lines)
+                buffer = self._initialLinePrepare(buffer, 0)
+                candidate = self.__candidates(guesses[:1], fps)[0]
+                candidate.feedBuffer(buffer)
+                if self.__choose([candidate]) is not None:
+                    return self.__results(candidate)
+                lines = _iterLines(buffer)
+                guesses = guesses[1:]
+
+        candidates = self.__candidates(guesses, fps)
+        self.__parseFormats(candidates, self.__lines(lines))
+        return self.__results(self.__choose(candidates))
+
+    def parseRaw(self, content, fps = 25):
+        """Parse a given content like parse(), but keep subtitle texts in their original format.
+        Returns RawSubManager, which is converted without GSP round trip by SubConverter.
+        Only the most probable format is checked, as a whole buffer. It must be either
+        LINE_ORIENTED or consist of BLANK_LINE_SECTIONS. SubParsingError is raised when content
+        cannot be parsed this way, even if parse() might succeed, so parse() should be used then
+        (and it'll report a proper error if there's any)."""
+        text = content if isinstance(content, str) else ''.join(content)
+        lines, guesses = self.__prepare(text)
+        if len(guesses) == 0:
+            raise SubParsingError(_("Not a known subtitle format"), 0)
+
+        Format, confidence = guesses[0]
+        if confidence == 0 or not Format.supportsRaw():
+            raise SubParsingError(_("Not a known subtitle format"), 0)
+
+        buffer = self._initialLinePrepare(text, 0)
+        fmt = formatRegistry.instance(Format)
+        subtitles = RawSubManager(Format)
+        found = False
+        for offset, start, end, subText in fmt.parseRawBuffer(fps, buffer):
+            if not found and buffer.count('\n', 0, offset) > self._maxFmtSearch:
+                break
+            # only whitespaces might be formatted to an empty text
+            if not subText.strip() and not fmt.formatSub(subText):
+                continue
+            found = True
+            try:
+                subtitles.append(Subtitle(start, end, subText))
+            except SubException as msg:
+                raise SubParsingError(msg, buffer.count('\n', 0, offset))
+
+        if subtitles.size() == 0:
+            raise SubParsingError(_("Not a known subtitle format"), 0)
+
+        self._format = Format
+        self._formatFound = True
+        self._confidence = confidence
+        self._subtitles = subtitles
+        return subtitles
+
+    def rawFormat(self, content):
+        """Sniff a given content (a whole text or a list of its lines) and return a format which
+        it should be parsed as by parseRaw(), or None when it should be parsed by parse(). Raw
+        parsing checks only the most probable format, so it's chosen only when sniffing is
+        confident about it."""
+        lines = _iterLines(content) if isinstance(content, str) else iter(content)
+        sample = self._initialLinePrepare(''.join(self.__head(lines)), 0)
+        guesses = self.sniff(sample)
+        if len(guesses) > 0:
+            Format, confidence = guesses[0]
+            if confidence > self._lowConfidence and Format.supportsRaw():
+                return Format
+        return None
+
+    def __results(self, winner):
+        if winner is None or winner.subtitles.size() == 0:
             raise SubParsingError(_("Not a known subtitle format"), 0)
         return self._subtitles
 
-    def __parseFormat(self, fmt, content, fps = 25):
-        '''Actual parser. Please note that time_to is not required to process as not all subtitles
-        provide it.'''
+    def iterparse(self, stream, fps = 25):
+        """Parse a given text stream (or any other iterable of lines) incrementally. Generator
+        yields a parsed Header first and then Subtitles, as soon as their sections are complete.
+        Only the lines needed to recognize the format are kept in memory at once.
+
+        Parsing errors are raised during iteration, so some subtitles might have been already
+        yielded at the time of error."""
+        lines, guesses = self.__prepare(stream)
+        lines = self.__lines(lines)
+        candidates = self.__candidates(guesses, fps)
+        self.__parseFormats(candidates, lines, untilDecided = True)
+
+        winner = self.__choose(candidates)
+        if winner is None:
+            raise SubParsingError(_("Not a known subtitle format"), 0)
+
+        yield winner.subtitles.header()
+        yield from winner.popCompleted()
+
+        if not winner.done:
+            for lineNo, line, last in lines:
+                winner.feed(lineNo, line, last)
+                if winner.error is not None:
+                    raise winner.error
+                yield from winner.popCompleted()
+                if winner.done:
+                    break
+        yield from winner.popCompleted(final = True)
+
+        if winner.parsed == 0:
+            raise SubParsingError(_("Not a known subtitle format"), 0)
 
-        headerFound = False
-        subSection = ''
-        for lineNo, line in enumerate(content):
-            line = self._initialLinePrepare(line, lineNo)
-            if not fmt.WITH_HEADER and not self._formatFound and lineNo > self._maxFmtSearch:
+    def __prepare(self, content):
+        '''Reset parsing results and sniff the beginning of content. Return an iterator over all
+        lines of content and guessed formats sorted by their probability.'''
+        # return a new object each time (otherwise it'd contantly modify the same reference
+        self._subtitles = SubManager()
+        self._formatFound = False
+        self._format = None
+        self._confidence = None
+
+        if isinstance(content, str):
+            lines = _iterLines(content)
+        else:
+            lines = iter(content)
+        head = self.__head(lines)
+        sample = self._initialLinePrepare(''.join(head), 0)
+        return itertools.chain(head, lines), self.sniff(sample)
+
+    def __candidates(self, guesses, fps):
+        '''Create parsing states of guessed formats. The most probable format is judged first. As
+        formats are parsed side by side, the rest of them is dropped as soon as it's recognized.'''
+        candidates = []
+        for Format, confidence in guesses:
+            candidate = _FormatParser(Format, fps, self._maxHeaderLen, self._maxFmtSearch)
+            candidate.confidence = confidence
+            candidates.append(candidate)
+        return candidates
+
+    def __parseFormats(self, candidates, lines, untilDecided = False):
+        '''Feed each line to all candidate formats at once, so the whole content is read only once.
+        Candidates which fail are dropped as soon as possible. When untilDecided is True, stop
+        reading lines as soon as it's known which candidate wins.'''
+        active = list(candidates)
+        for lineNo, line, last in lines:
+            for candidate in active:
+                candidate.feed(lineNo, line, last)
+
+            # When a format is recognized, formats judged after it will never be chosen.
+            for i, candidate in enumerate(candidates):
+                if candidate.found or candidate.error is not None:
+                    del candidates[i + 1:]
+                    break
+
+            active = [candidate for candidate in candidates if not candidate.done]
+            if len(active) == 0:
+                return
+            if untilDecided and self.__decided(candidates) is not None:
                 return
 
-            subSection = ''.join([subSection, line])
-            if fmt.WITH_HEADER and not headerFound:
-                if lineNo > self._maxHeaderLen:
-                    return
-                headerFound = fmt.addHeaderInfo(subSection, self._subtitles.header())
-                if headerFound:
-                    self._formatFound = True
-                    subSection = ''
-            elif fmt.subtitleEnds(line) or (lineNo + 1) == len(content):
-                subtitle = fmt.createSubtitle(fps, subSection)
-                if subtitle is None:
-                    if subSection in ('\n', '\r\n', '\r'):
-                        subSection = ''
-                        continue
-                    elif self._subtitles.size() > 0:
-                        raise SubParsingError(_("Parsing error"), lineNo)
-                    else:
-                        return
-
-                # store parsing result if new end marker occurred, then clear results
-                if subtitle.start and subtitle.text:
-                    self._formatFound = True
-                    try:
-                        self._subtitles.append(subtitle)
-                    except SubException as msg:
-                        raise SubParsingError(msg, lineNo)
-                elif subtitle.start and not subtitle.text:
-                    pass
-                else:
-                    return
-                subSection = ''
+    def __decided(self, candidates):
+        '''Return a candidate which wins regardless of the remaining input or None.'''
+        for candidate in candidates:
+            if candidate.found or candidate.error is not None:
+                return candidate
+            if not candidate.done:
+                return None
+        return None
+
+    def __choose(self, candidates):
+        '''Formats are judged in order of sniffing confidence: the first one which either recognized
+        its format or failed after recognizing it decides about parsing results.'''
+        for candidate in candidates:
+            if candidate.error is not None:
+                raise candidate.error
+            if candidate.found:
+                self._format = candidate.Format
+                self._formatFound = True
+                self._confidence = candidate.confidence
+                self._subtitles = candidate.subtitles
+                return candidate
+        return None
+
+    def __head(self, lines):
+        '''Read lines from the beginning of content which are used for format sniffing.'''
+        head = []
+        size = 0
+        for line in lines:
+            head.append(line)
+            size += len(line)
+            if size >= self._sniffSize:
+                break
+        return head
+
+    def __lines(self, content):
+        '''Yield (lineNo, line, isLastLine) for every line of content.'''
+        lines = iter(content)
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+
+        lineNo = 0
+        line = self._initialLinePrepare(line, lineNo)
+        for nextLine in lines:
+            yield lineNo, line, False
+            lineNo += 1
+            line = nextLine
+        yield lineNo, line, True
 
     @property
     def results(self):
@@ -358,26 +1319,91 @@ class SubParser:
         return self._subtitles
 
 class SubConverter:
+    WRITE_CHUNK_SIZE = 64 * 1024
+
     # TODO: test
     def convert(self, Format, subtitles):
-        fmt = Format()
-        convertedLines = []
+        return list(self.iterconvert(Format, subtitles))
+
+    def convertTo(self, stream, Format, subtitles, encoding):
+        """Convert subtitles to a given Format and write them to a binary stream with a given
+        encoding. Converted subtitles are encoded one by one and written in chunks, so a whole
+        converted file is never kept in memory. Raises SubConversionError with a number of
+        subtitle which cannot be encoded (0 for header)."""
+        encoder = codecs.getincrementalencoder(encoding)()
+        firstSubNo = 0 if Format.WITH_HEADER else 1
+
+        chunks = []
+        chunksSize = 0
+        for subNo, convertedSub in enumerate(self.iterconvert(Format, subtitles), firstSubNo):
+            try:
+                data = encoder.encode(convertedSub)
+            except UnicodeEncodeError as err:
+                vals = {"no": subNo, "enc": encoding, "chars": err.object[err.start:err.end]}
+                if subNo == 0:
+                    msg = _("Header contains characters which cannot be encoded to '%(enc)s': "
+                        "%(chars)s") % vals
+                else:
+                    msg = _("Subtitle %(no)d contains characters which cannot be encoded to "
+                        "'%(enc)s': %(chars)s") % vals
+                raise SubConversionError(msg, subNo)
+
+            chunks.append(data)
+            chunksSize += len(data)
+            if chunksSize >= self.WRITE_CHUNK_SIZE:
+                stream.write(b''.join(chunks))
+                chunks = []
+                chunksSize = 0
+
+        chunks.append(encoder.encode('', final=True))
+        stream.write(b''.join(chunks))
+
+    def iterconvert(self, Format, subtitles):
+        """Convert subtitles one by one to a given Format. 'subtitles' might be a SubManager or any
+        iterable which yields a Header followed by Subtitles (e.g. SubParser.iterparse()).
+        Texts of RawSubManager are converted directly, unless they contain any formatting."""
+        fmt = formatRegistry.instance(Format)
+
+        if isinstance(subtitles, RawSubManager):
+            if fmt.WITH_HEADER:
+                yield fmt.convertHeader(subtitles.header())
+            yield from self._iterconvertRaw(fmt, subtitles)
+            return
+
+        # subtitle which has been read from an iterable when it doesn't start with a Header
+        firstSub = None
+        if isinstance(subtitles, SubManager):
+            header = subtitles.header()
+            subtitles = subtitles.view()
+        else:
+            subtitles = iter(subtitles)
+            header = next(subtitles, None)
+            if not isinstance(header, Header):
+                firstSub = header
+                header = Header()
 
         if fmt.WITH_HEADER:
-            head = fmt.convertHeader(subtitles.header())
-            convertedLines.append(head)
-
-        for subNo, sub in enumerate(subtitles):
+            head = fmt.convertHeader(header)
+            yield head
+
+        render = fmt.renderer()
+        firstSubNo = 0
+        if firstSub is not None:
+            yield render(0, firstSub)
+            firstSubNo = 1
+        for subNo, sub in enumerate(subtitles, firstSubNo):
             if sub is not None: # FIXME: do we have to check it?
-                try:
-                    subText = sub.text.format(**fmt.formatting)
-                except KeyError:
-                    subText = sub.text
-                subText = subText.strip() # unnecessary whitespaces will probably break subtitles
-                convertedSub = fmt.subFormatTemplate.format(gsp_no = subNo, \
-                    gsp_from = fmt.convertTime(sub.start, 'time_from'), \
-                    gsp_to = fmt.convertTime(sub.end, 'time_to'), \
-                    gsp_text = subText)
-                convertedLines.append(convertedSub)
-        return convertedLines
-
+                yield render(subNo, sub)
+
+    def _iterconvertRaw(self, fmt, subtitles):
+        inputFmt = formatRegistry.instance(subtitles.inputFormat())
+        convertText = inputFmt.textConverter(type(fmt))
+        render = fmt.renderer()
+        renderText = fmt.textRenderer()
+        for subNo, sub in enumerate(subtitles.view()):
+            text = convertText(sub.text)
+            if text is None:
+                sub = Subtitle(sub.start, sub.end, inputFmt.formatSub(sub.text))
+                yield render(subNo, sub)
+            else:
+                yield renderText(subNo, sub.start, sub.end, text)
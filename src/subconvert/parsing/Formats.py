@@ -20,12 +20,26 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 import os
 import re
+import string
 
-from subconvert.parsing.FrameTime import FrameTime
-from subconvert.parsing.Core import Subtitle
-from subconvert.utils.SubException import SubAssert
+from subconvert.parsing.FrameTime import FrameTime, FrameTimeType
+from subconvert.parsing.Core import Subtitle, SubParsingError, formatRegistry
+from subconvert.utils.SubException import SubException, SubAssert
 from subconvert.utils.Locale import _
 
+_GSP_TAGS = ('gsp_b_', '_gsp_b', 'gsp_i_', '_gsp_i', 'gsp_u_', '_gsp_u')
+
+# Template fields which might be rendered by a compiled renderer, in an order in which renderer
+# computes them.
+_TEMPLATE_FIELDS = ('gsp_no', 'gsp_from', 'gsp_to', 'gsp_text')
+
+def _timeComponents(frametime):
+    """Return hours, minutes, seconds and milliseconds of a non-negative FrameTime."""
+    ms = frametime.ms
+    if ms < 0:
+        raise SubException(_("Negative time present."))
+    return (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
 class TimeFormat:
     UNKNOWN = 0
     FRAME = 1
@@ -39,6 +53,26 @@ class SubFormat:
     OPT = None
     WITH_HEADER = False
 
+    # Lower case strings which must all be present in a header before 'addHeaderInfo' is able to
+    # parse it. Until then 'addHeaderInfo' isn't called at all.
+    HEADER_MARKERS = ()
+
+    # Line-oriented formats store each subtitle in a single line, which allows parsing a whole
+    # file at once with 'parseBuffer'.
+    LINE_ORIENTED = False
+
+    # Formats whose subtitles are sections of lines separated by blank lines (and which don't have
+    # a header) can be parsed as a whole buffer with 'parseRawBuffer', just like LINE_ORIENTED ones.
+    BLANK_LINE_SECTIONS = False
+
+    # Regular expression (compiled with re.M) which matches characteristic lines of a format. It is
+    # used to cheaply guess a format of a file before actual parsing.
+    SIGNATURE = None
+
+    # printf-style template of subtitle start and end times. When it's set, compiled renderers
+    # format times with it and values returned by 'timeValues' instead of calling 'convertTime'.
+    TIME_TEMPLATE = None
+
     def __init__(self, subFormat, subPattern = "", endPattern = "", formatting = None):
         """
         Init SubFormat. It should be called by derived class at the beginning of its __init__().
@@ -76,8 +110,16 @@ class SubFormat:
         """
 
         self._subFormat = subFormat
+        self._renderer = None
+        self._textRenderer = None
+        self._replacements = None
         self._endPattern = re.compile(endPattern, re.X)
         self._pattern = re.compile(subPattern, re.X)
+        self._bufferPattern = None
+        if self.LINE_ORIENTED:
+            # Consume line endings as well, so there's usually nothing between subsequent matches.
+            self._bufferPattern = re.compile(''.join([subPattern, '\n', r'(?:\r\n|\n|\r)?']),
+                re.X | re.M)
 
         if formatting is not None:
             self._formatting = formatting
@@ -92,30 +134,19 @@ class SubFormat:
     def __hash__(self):
         return self.NAME.__hash__()
 
-    def _formatLinesep(self, string):
-        if self.formatting["gsp_nl"]:
-            if self.formatting["gsp_nl"] == os.linesep:
-                if "\r\n" in string:
-                    string = string.replace("\r\n", "{gsp_nl}")
-                elif "\n" in string:
-                    string = string.replace("\n", "{gsp_nl}")
-                elif "\r" in string:
-                    string = string.replace("\r", "{gsp_nl}")
-            else:
-                string = string.replace(self.formatting["gsp_nl"], "{gsp_nl}")
-        return string
-
-    def _formatWithTags(self, openTag, closeTag, string):
-        if self.formatting[openTag]:
-            fullOpenTag = ''.join(['{', openTag, '}'])
-            openFormatTag = self.formatting[openTag].replace('{', '{{').replace('}', '}}')
-            string = string.replace(openFormatTag, fullOpenTag)
+    @classmethod
+    def sniff(cls, sample):
+        """Return a score telling how much a given text 'sample' looks like this format. Score is
+        a number of occurences of format's SIGNATURE in a sample."""
+        if cls.SIGNATURE is None:
+            return 0
+        return len(cls.SIGNATURE.findall(sample))
 
-        if self.formatting[closeTag]:
-            fullCloseTag = ''.join(['{', closeTag, '}'])
-            closeFormatTag = self.formatting[closeTag].replace('{', '{{').replace('}', '}}')
-            string = string.replace(closeFormatTag, fullCloseTag)
-        return string
+    @classmethod
+    def supportsRaw(cls):
+        """Return whether format can be parsed without translating subtitle texts to GSP
+        formatting, i.e. by SubParser.parseRaw()."""
+        return cls.LINE_ORIENTED or cls.BLANK_LINE_SECTIONS
 
     #
     # Parsing subtitle format.
@@ -133,14 +164,83 @@ class SubFormat:
         By default 'section' is checked against 'subPattern' regular expression."""
         matched = self._pattern.search(section)
         if matched is not None:
-            matchedDict = matched.groupdict()
-            return Subtitle(
-                self.frametime(fps, matchedDict.get("time_from")),
-                self.frametime(fps, matchedDict.get("time_to")),
-                self.formatSub(matchedDict.get("text"))
-            )
+            return self._subtitleFromMatch(fps, matched)
         return None
 
+    def parseBuffer(self, fps, buffer):
+        """Whole-buffer parsing engine of LINE_ORIENTED formats. Instead of checking 'buffer' line
+        by line, 'subPattern' is run over all of it at once. Yields (offset, Subtitle) pairs, where
+        offset is a position of subtitle's line in 'buffer'. Only newlines are allowed between
+        matched subtitles. Otherwise SubParsingError is raised with a number of the first line which
+        doesn't match."""
+        SubAssert(self.LINE_ORIENTED, "%s is not a line-oriented format" % self.NAME)
+        for offset, matched in self._bufferMatches(buffer):
+            yield offset, self._subtitleFromMatch(fps, matched)
+
+    def parseRawBuffer(self, fps, buffer):
+        """Parse a whole 'buffer' of LINE_ORIENTED or BLANK_LINE_SECTIONS format without converting
+        subtitle texts to GSP formatting. Yields (offset, start, end, text) tuples, where offset is
+        a position of the last line of a subtitle in 'buffer', end is None when format doesn't
+        store it and text is exactly the same as in 'buffer'. SubParsingError is raised for the
+        first line which doesn't match."""
+        if self.LINE_ORIENTED:
+            matches = self._bufferMatches(buffer)
+        else:
+            SubAssert(self.BLANK_LINE_SECTIONS,
+                "%s cannot be parsed as a whole buffer" % self.NAME)
+            matches = self._sectionMatches(buffer)
+
+        frametime = self.frametime
+        for offset, matched in matches:
+            matchedDict = matched.groupdict()
+            yield (offset, frametime(fps, matchedDict.get("time_from")),
+                frametime(fps, matchedDict.get("time_to")), matchedDict.get("text"))
+
+    def _bufferMatches(self, buffer):
+        pos = 0
+        for matched in self._bufferPattern.finditer(buffer):
+            start = matched.start()
+            if start != pos:
+                self._checkGap(buffer, pos, start)
+            yield start, matched
+            pos = matched.end()
+        self._checkGap(buffer, pos, len(buffer))
+
+    def _sectionMatches(self, buffer):
+        # Sections end with a blank line or with the last line, just like when they're fed line by
+        # line. Only '\n' line endings are recognized.
+        if '\r' in buffer:
+            raise SubParsingError(_("Parsing error"), buffer.count('\n', 0, buffer.find('\r')))
+
+        pos = 0
+        size = len(buffer)
+        while pos < size:
+            if buffer.startswith('\n', pos):
+                pos += 1
+                continue
+            end = buffer.find('\n\n', pos)
+            end = size if end == -1 else end + 2
+            matched = self._pattern.search(buffer[pos:end])
+            if matched is None:
+                raise SubParsingError(_("Parsing error"), buffer.count('\n', 0, end - 1))
+            yield end - 1, matched
+            pos = end
+
+    def _checkGap(self, buffer, start, end):
+        gap = buffer[start:end]
+        stripped = gap.lstrip('\r\n')
+        if stripped:
+            mismatch = start + len(gap) - len(stripped)
+            raise SubParsingError(_("Parsing error"), buffer.count('\n', 0, mismatch))
+
+    def _subtitleFromMatch(self, fps, matched):
+        matchedDict = matched.groupdict()
+        return Subtitle(
+            self.frametime(fps, matchedDict.get("time_from")),
+            self.frametime(fps, matchedDict.get("time_to")),
+            self.formatSub(matchedDict.get("text"))
+        )
+
     def addHeaderInfo(self, content, header):
         """Try to find header in a given subSection. Return True if header was parsed, False
         otherwise.  Header parsing results should be saved to the 'header' (which is passed by
@@ -162,27 +262,161 @@ class SubFormat:
         If 'gsp_nl' equals to os.linesep, then a given string will be checked against occurance of
         any of newline styles (Linux, Windows and Mac).
         Trivia: GSP stands for "GenericSubParser" which was SubParser class name before."""
+        if self._replacements is None:
+            self._replacements = self._compileReplacements()
+
         string = string.strip()
-        string = string.replace('{', '{{').replace('}', '}}')
-        string = self._formatWithTags("gsp_b_", "_gsp_b", string)
-        string = self._formatWithTags("gsp_i_", "_gsp_i", string)
-        string = self._formatWithTags("gsp_u_", "_gsp_u", string)
-        string = self._formatLinesep(string)
+        for old, new in self._replacements:
+            if old in string:
+                string = string.replace(old, new)
+        if self.formatting["gsp_nl"] == os.linesep:
+            if "\r\n" in string:
+                string = string.replace("\r\n", "{gsp_nl}")
+            elif "\n" in string:
+                string = string.replace("\n", "{gsp_nl}")
+            elif "\r" in string:
+                string = string.replace("\r", "{gsp_nl}")
         return string
 
+    def _compileReplacements(self):
+        """Returns a list of (old, new) pairs which formatSub() replaces in order: brace escaping,
+        format tags translated to GSP tags and format specific newline (when it differs from
+        os.linesep). Replacements are computed once per format instead of once per subtitle."""
+        replacements = [('{', '{{'), ('}', '}}')]
+        for gspTag in _GSP_TAGS:
+            tag = self.formatting[gspTag]
+            if tag:
+                escapedTag = tag.replace('{', '{{').replace('}', '}}')
+                replacements.append((escapedTag, ''.join(['{', gspTag, '}'])))
+        newline = self.formatting["gsp_nl"]
+        if newline and newline != os.linesep:
+            replacements.append((newline, "{gsp_nl}"))
+        return replacements
+
+    def textConverter(self, Format):
+        """Return a function which converts a subtitle text written in this format directly to
+        a text of a given Format, without GSP formatting in between: convert(string). Only newlines
+        are converted, so it returns None for texts with formatting tags, braces or carriage
+        returns, which have to be formatted with formatSub() and rendered as usual.
+        Formats which implement their own formatSub() might need to reimplement it as well."""
+        markup = ['{', '}', '\r']
+        markup.extend(self.formatting[gspTag] for gspTag in _GSP_TAGS if self.formatting[gspTag])
+
+        newline = self.formatting["gsp_nl"]
+        if newline == os.linesep:
+            newline = '\n' # see formatSub(), carriage returns are never converted here
+        formatNewline = formatRegistry.instance(Format).formatting["gsp_nl"]
+
+        def convert(string):
+            for mark in markup:
+                if mark in string:
+                    return None
+            string = string.strip()
+            if newline and newline in string:
+                string = string.replace(newline, formatNewline).strip()
+            return string
+        return convert
+
     #
     # Converting to subtitle format from parsed content.
     #
 
+    def renderer(self):
+        """Return a function which converts a single subtitle to a format specific string:
+        render(subNo, subtitle). It is compiled only once from subFormatTemplate, formatting and
+        convertTime."""
+        if self._renderer is None:
+            self._renderer, self._textRenderer = self._compileRenderer()
+        return self._renderer
+
+    def textRenderer(self):
+        """Return a function which converts a subtitle given by its parts to a format specific
+        string: render(subNo, start, end, text). Contrary to renderer(), 'text' is already written
+        in this format (see textConverter()), so GSP formatting isn't applied to it."""
+        if self._textRenderer is None:
+            self._renderer, self._textRenderer = self._compileRenderer()
+        return self._textRenderer
+
+    def _compileRenderer(self):
+        # subFormatTemplate is translated to a printf-style template with positional arguments,
+        # which is a lot faster than str.format() with keyword arguments. Times are formatted
+        # directly in that template when format defines TIME_TEMPLATE.
+        literals = []
+        fields = []
+        for literal, field, spec, conversion in string.Formatter().parse(self.subFormatTemplate):
+            literals.append(literal.replace('%', '%%'))
+            if field is not None:
+                if spec or conversion or field not in _TEMPLATE_FIELDS or field in fields:
+                    return self._renderWithTemplate, self._renderTextWithTemplate
+                if field in ('gsp_from', 'gsp_to') and self.TIME_TEMPLATE is not None:
+                    literals.append(self.TIME_TEMPLATE)
+                else:
+                    literals.append('%s')
+                fields.append(field)
+
+        # arguments are concatenated in _TEMPLATE_FIELDS order
+        if fields != [field for field in _TEMPLATE_FIELDS if field in fields]:
+            return self._renderWithTemplate, self._renderTextWithTemplate
+
+        template = ''.join(literals)
+        withNo = 'gsp_no' in fields
+        withFrom = 'gsp_from' in fields
+        withTo = 'gsp_to' in fields
+        withText = 'gsp_text' in fields
+        formatting = self.formatting
+        timeValues = self.timeValues
+
+        def renderText(subNo, start, end, text):
+            values = (subNo,) if withNo else ()
+            if withFrom:
+                values += timeValues(start, 'time_from')
+            if withTo:
+                values += timeValues(end, 'time_to')
+            if withText:
+                # unnecessary whitespaces will probably break subtitles
+                values += (text.strip(),)
+            return template % values
+
+        def render(subNo, sub):
+            text = sub.text
+            if '{' in text or '}' in text: # otherwise there's nothing to format
+                try:
+                    text = text.format_map(formatting)
+                except KeyError:
+                    pass
+            return renderText(subNo, sub.start, sub.end, text)
+        return render, renderText
+
+    def _renderWithTemplate(self, subNo, sub):
+        try:
+            subText = sub.text.format(**self.formatting)
+        except KeyError:
+            subText = sub.text
+        return self._renderTextWithTemplate(subNo, sub.start, sub.end, subText)
+
+    def _renderTextWithTemplate(self, subNo, start, end, text):
+        text = text.strip() # unnecessary whitespaces will probably break subtitles
+        return self.subFormatTemplate.format(gsp_no = subNo, \
+            gsp_from = self.convertTime(start, 'time_from'), \
+            gsp_to = self.convertTime(end, 'time_to'), \
+            gsp_text = text)
+
     def convertHeader(self, header):
         """Convert a given Header object to format specific string that can be saved to file."""
         return None
 
+    def timeValues(self, frametime, which):
+        """Return a tuple of values which describe subtitle start or end time in TIME_TEMPLATE.
+        By default it's a result of convertTime."""
+        return (self.convertTime(frametime, which),)
+
     def convertTime(self, frametime, which):
         """Convert FrameTime object to properly formatted string that describes subtitle start or
         end time."""
-        SubAssert(frametime.frame >= 0, _("Negative time present."))
-        return frametime.frame
+        frame = frametime.frame
+        if frame < 0:
+            raise SubException(_("Negative time present."))
+        return frame
 
     @property
     def formatting(self):
@@ -203,6 +437,9 @@ class MicroDVD(SubFormat):
     OPT = 'microdvd'
     TIMEFORMAT = 'frame'
     EXTENSION = 'sub'
+    LINE_ORIENTED = True
+    SIGNATURE = re.compile(r'^\{\d+\}\{\d*\}', re.M)
+    TIME_TEMPLATE = '%d'
 
     def __init__(self):
         pattern = r'''
@@ -225,7 +462,10 @@ class MicroDVD(SubFormat):
         return FrameTime(fps, frames=string)
 
     def formatSub(self, string):
-        string = string.replace('{', '{{').replace('}', '}}')
+        if '{' in string or '}' in string:
+            string = string.replace('{', '{{').replace('}', '}}')
+        if 'y:' not in string:
+            return string.replace('|', '{gsp_nl}')
         lines = string.split('|')
         for i, line in enumerate(lines):
             if '{{y:b}}' in line:
@@ -241,15 +481,23 @@ class MicroDVD(SubFormat):
         string = '{gsp_nl}'.join(lines)
         return string
 
+    def timeValues(self, frametime, which):
+        frame = frametime.frame
+        if frame < 0:
+            raise SubException(_("Negative time present."))
+        return (frame,)
+
     def convertTime(self, frametime, which):
-        SubAssert(frametime.frame >= 0, _("Negative time present."))
-        return frametime.frame
+        return self.timeValues(frametime, which)[0]
 
 class SubRip(SubFormat):
     NAME = 'Sub Rip'
     OPT = 'subrip'
     TIMEFORMAT = 'time'
     EXTENSION = 'srt'
+    BLANK_LINE_SECTIONS = True
+    SIGNATURE = re.compile(r'^\d+:\d{2}:\d{2},\d+[ \t]*-->', re.M)
+    TIME_TEMPLATE = '%02d:%02d:%02d,%03d'
 
     def __init__(self):
         pattern = r'''
@@ -271,20 +519,21 @@ class SubRip(SubFormat):
         }
         super().__init__(subFormat, pattern, endPattern, formatting)
 
-        self.time_fmt = re.compile(
-            r'^(?P<h>\d+):(?P<m>\d{2}):(?P<s>\d{2}),(?P<ms>\d+)$'
-        )
-
     def frametime(self, fps, string):
-        time = self.time_fmt.search(string)
-        return FrameTime(fps, time = "%d:%02d:%02d.%03d" % \
-            (int(time.group('h')), int(time.group('m')), int(time.group('s')), int(time.group('ms'))))
+        # string is already validated by subtitle pattern: 00:00:00,000
+        time, ms = string.split(',')
+        hours, minutes, seconds = time.split(':')
+        ms = int(ms)
+        if ms > 999:
+            # only 3 leading digits of overlong milliseconds were ever taken into account
+            ms = int(str(ms)[:3])
+        return FrameTime.fromComponents(fps, int(hours), int(minutes), int(seconds), ms)
+
+    def timeValues(self, frametime, which):
+        return _timeComponents(frametime)
 
     def convertTime(self, frametime, which):
-        SubAssert(frametime.fullSeconds >= 0, _("Negative time present."))
-        t = frametime.time
-        return '%02d:%02d:%02d,%03d' % (t['hours'], t['minutes'], t['seconds'],
-                                        t['miliseconds'])
+        return self.TIME_TEMPLATE % self.timeValues(frametime, which)
 
 class SubViewer(SubFormat):
     NAME = 'SubViewer 1.0'
@@ -292,6 +541,10 @@ class SubViewer(SubFormat):
     TIMEFORMAT = 'time'
     EXTENSION = 'sub'
     WITH_HEADER = True
+    HEADER_MARKERS = ('[colf]', '[information]')
+    SIGNATURE = re.compile(
+        r'^(?:\[INFORMATION\]|\d{2}:\d{2}:\d{2}.\d{2},\d{2}:\d{2}:\d{2}.\d{2}\s*$)', re.M | re.I)
+    TIME_TEMPLATE = '%02d:%02d:%02d.%02d'
 
     def __init__(self):
         pattern = r'''
@@ -306,26 +559,24 @@ class SubViewer(SubFormat):
         subFormat = "{gsp_from},{gsp_to}%s{gsp_text}%s%s" % (os.linesep, os.linesep, os.linesep)
         super().__init__(subFormat, pattern, endPattern)
 
-        self.time_fmt = re.compile(
-            r'^(?P<h>\d+):(?P<m>\d{2}):(?P<s>\d{2}).(?P<ms>\d+)$'
-        )
-
     def frametime(self, fps, string):
-        time = self.time_fmt.search(string)
-        return FrameTime(fps, time = "%d:%02d:%02d.%03d" % \
-            (int(time.group('h')), int(time.group('m')), int(time.group('s')), int(time.group('ms'))*10))
+        # string is already validated by subtitle pattern: 00:00:00.00
+        return FrameTime.fromComponents(fps,
+            int(string[0:2]), int(string[3:5]), int(string[6:8]), 10 * int(string[9:11]))
+
+    def timeValues(self, frametime, which):
+        hours, minutes, seconds, ms = _timeComponents(frametime)
+        return (hours, minutes, seconds, int(round(ms / float(10))))
 
     def convertTime(self, frametime, which):
-        SubAssert(frametime.fullSeconds >= 0, _("Negative time present."))
-        t = frametime.time
-        ms = int(round(t['miliseconds'] / float(10)))
-        return '%02d:%02d:%02d.%02d' % (t['hours'], t['minutes'], t['seconds'], ms)
+        return self.TIME_TEMPLATE % self.timeValues(frametime, which)
 
     def addHeaderInfo(self, content, header):
-        if( '[colf]' in content.lower() and '[information]' in content.lower()):
-            end = content.lower().find('[end information]')
+        lowerContent = content.lower()
+        if( '[colf]' in lowerContent and '[information]' in lowerContent):
+            end = lowerContent.find('[end information]')
             if -1 == end:
-                end = content.lower().find('[subtitle]')
+                end = lowerContent.find('[subtitle]')
                 if -1 == end:
                     return True
 
@@ -340,13 +591,14 @@ class SubViewer(SubFormat):
             for tag in tag_list:
                 parse_result = tag.strip()[1:].partition(']')
                 if parse_result[2]:
-                    if parse_result[0].lower() == 'color':
+                    tagName = parse_result[0].lower()
+                    if tagName == 'color':
                         header.add('color', parse_result[2])
-                    elif parse_result[0].lower() == 'style':
+                    elif tagName == 'style':
                         header.add('font_style', parse_result[2])
-                    elif parse_result[0].lower() == 'size':
+                    elif tagName == 'size':
                         header.add('font_size', parse_result[2])
-                    elif parse_result[0].lower() == 'font':
+                    elif tagName == 'font':
                         header.add('font', parse_result[2])
             return True
         else:
@@ -378,6 +630,9 @@ class TMP(SubFormat):
     OPT = 'tmp'
     TIMEFORMAT = 'time'
     EXTENSION = 'txt'
+    LINE_ORIENTED = True
+    SIGNATURE = re.compile(r'^\d+:\d{2}:\d{2}:', re.M)
+    TIME_TEMPLATE = '%02d:%02d:%02d'
 
     def __init__(self):
         pattern = r'''
@@ -396,28 +651,28 @@ class TMP(SubFormat):
         }
         super().__init__(subFormat, pattern, endPattern, formatting)
 
-        self.time_fmt = re.compile(
-            r'^(?P<h>\d+):(?P<m>\d{2}):(?P<s>\d{2})$'
-        )
-
     def frametime(self, fps, string):
         if string:
-            time = self.time_fmt.search(string)
-            return FrameTime(fps, time = "%d:%02d:%02d" % \
-                (int(time.group('h')), int(time.group('m')), int(time.group('s'))))
+            # string is already validated by subtitle pattern: 00:00:00
+            hours, minutes, seconds = string.split(':')
+            return FrameTime.fromComponents(fps, int(hours), int(minutes), int(seconds), 0)
         return None
 
     def convertTime(self, frametime, which):
         if which == 'time_from':
-            SubAssert(frametime.fullSeconds >= 0, _("Negative time present."))
-            t = frametime.time
-            return '%02d:%02d:%02d' % (t['hours'], t['minutes'], t['seconds'])
+            return self.TIME_TEMPLATE % self.timeValues(frametime, which)
+
+    def timeValues(self, frametime, which):
+        return _timeComponents(frametime)[:3]
 
 class MPL2(SubFormat):
     NAME = 'MPL2'
     OPT = 'mpl2'
     TIMEFORMAT = 'time'
     EXTENSION = 'txt'
+    LINE_ORIENTED = True
+    SIGNATURE = re.compile(r'^\[\d+\]\[\d*\]', re.M)
+    TIME_TEMPLATE = '%d'
 
     def __init__(self):
         pattern = r'''
@@ -437,14 +692,20 @@ class MPL2(SubFormat):
         super().__init__(subFormat, pattern, endPattern, formatting)
 
     def frametime(self, fps, string):
-        string = ''.join(['0', string]) # Parsing "[0][5] sub" would cause an error without this
-        ms = int(string[-1]) / 10.0
-        seconds = int(string[:-1]) + ms
-        return FrameTime(fps, seconds=seconds)
+        # MPL2 time is a number of deciseconds, already validated by subtitle pattern
+        if fps <= 0:
+            raise ValueError("Incorrect FPS value: %s." % fps)
+        return FrameTime.fromMs(float(fps), 100 * int(string))
+
+    def timeValues(self, frametime, which):
+        # a whole number of deciseconds, i.e. full seconds truncated to one fractional digit
+        value = frametime.value
+        if value < 0:
+            raise SubException(_("Negative time present."))
+        if frametime.origin == FrameTimeType.Time:
+            return (value // 100,)
+        return (int(10 * value // frametime.fps),)
 
     def convertTime(self, frametime, which):
-        SubAssert(frametime.fullSeconds >= 0, _("Negative time present."))
-        time = str(frametime.fullSeconds).split('.')
-        time = ''.join([time[0].lstrip('0'), time[1][0]])
-        return time
+        return self.TIME_TEMPLATE % self.timeValues(frametime, which)
 
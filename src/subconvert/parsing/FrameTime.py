@@ -31,9 +31,18 @@ class FrameTimeType:
     Frame = 1
     Time = 2
 
+_timePattern = re.compile(
+    r"(?P<sign>[+-]?)(?P<h>\d+):(?P<m>[0-5][0-9]):(?P<s>[0-5][0-9])(?:$|\.(?P<ms>\d{1,3}))")
+
 @functools.total_ordering
 class FrameTime():
-    """Class defining a FrameTime object which consists of frame and time metrics (and fps as well)."""
+    """Class defining a FrameTime object which consists of frame and time metrics (and fps as well).
+
+    FrameTime keeps a single integer as its canonical value: a number of milliseconds when it was
+    created from time and a number of frames when it was created from frames. The other metric is
+    computed on demand, so changing FPS never accumulates rounding errors."""
+
+    __slots__ = ('_fps', '_origin', '_value')
 
     def __init__(self, fps, seconds=None, frames=None, time=None):
         """Constructs FrameTime object with a given FPS value. Constructor accepts only one value
@@ -52,8 +61,7 @@ class FrameTime():
         self._fps = float(fps)
         if frames is None and time is None and seconds is None:
             self._origin = FrameTimeType.Undefined
-            self._frame = 0
-            self._full_seconds = 0.0
+            self._value = 0
         else:
             exclusiveArgs = [frames, time, seconds]
             if exclusiveArgs.count(None) != 2:
@@ -61,7 +69,7 @@ class FrameTime():
 
             if frames is not None:
                 self._origin = FrameTimeType.Frame
-                self.__setFrame__(int(frames))
+                self._value = int(frames)
             elif time is not None:
                 self._origin = FrameTimeType.Time
                 self.__setTime__(str(time))
@@ -69,11 +77,51 @@ class FrameTime():
                 self._origin = FrameTimeType.Time
                 self.__setSeconds__(float(seconds))
 
+    @classmethod
+    def fromMs(cls, fps, ms):
+        """Fast constructor which creates a FrameTime from an integer number of milliseconds.
+        Arguments are not validated: fps must be a positive float."""
+        ft = object.__new__(cls)
+        ft._fps = fps
+        ft._origin = FrameTimeType.Time
+        ft._value = ms
+        return ft
+
+    @classmethod
+    def fromFrames(cls, fps, frames):
+        """Fast constructor which creates a FrameTime from an integer number of frames.
+        Arguments are not validated: fps must be a positive float."""
+        ft = object.__new__(cls)
+        ft._fps = fps
+        ft._origin = FrameTimeType.Frame
+        ft._value = frames
+        return ft
+
+    @classmethod
+    def fromValue(cls, fps, origin, value):
+        """Fast constructor which recreates a FrameTime from its origin and canonical value.
+        Arguments are not validated: fps must be a positive float."""
+        ft = object.__new__(cls)
+        ft._fps = fps
+        ft._origin = origin
+        ft._value = value
+        return ft
+
+    @classmethod
+    def fromComponents(cls, fps, hours, minutes, seconds, ms):
+        """Constructs FrameTime from integer time components, which is what format parsers
+        usually have at hand. Components are validated just like a time string is."""
+        if fps <= 0:
+            raise ValueError("Incorrect FPS value: %s." % fps)
+        if hours < 0 or not (0 <= minutes < 60 and 0 <= seconds < 60 and 0 <= ms < 1000):
+            raise ValueError("Incorrect time format.")
+        return cls.fromMs(float(fps), 1000 * (3600*hours + 60*minutes + seconds) + ms)
+
     def clone(self):
-        other = FrameTime(fps = self.fps)
+        other = object.__new__(FrameTime)
+        other._fps = self._fps
         other._origin = self._origin
-        other._frame = self._frame
-        other._full_seconds = self._full_seconds
+        other._value = self._value
         return other
 
     @property
@@ -87,56 +135,69 @@ class FrameTime():
         else:
             raise ValueError("Incorrect FPS value: %s." % newFps)
 
-        # TODO: test
-        if self._origin == FrameTimeType.Time:
-            self.__setFrame__(self._full_seconds * self._fps)
-        else:
-            self.__setSeconds__(self._frame / self._fps)
+    @property
+    def origin(self):
+        """Get FrameTimeType which FrameTime was created from."""
+        return self._origin
 
+    @property
+    def value(self):
+        """Get a canonical integer value: milliseconds for FrameTimeType.Time origin and frames
+        otherwise."""
+        return self._value
 
     @property
     def frame(self):
         """Get Frame (and FPS) value)"""
-        return int(round(self._frame))
+        if self._origin == FrameTimeType.Time:
+            return int(round(self._value * self._fps / 1000))
+        return self._value
 
     @property
     def fullSeconds(self):
-        return self._full_seconds
+        if self._origin == FrameTimeType.Time:
+            return self._value / 1000
+        return self._value / self._fps
+
+    @property
+    def ms(self):
+        """Get a total number of milliseconds."""
+        if self._origin == FrameTimeType.Time:
+            return self._value
+        return int(round(self._value * 1000 / self._fps))
 
     @property
     def time(self):
-        hours = int(self.fullSeconds / 3600)
-        counted = hours * 3600
-        minutes = int((self.fullSeconds - counted) / 60)
-        counted += minutes * 60
-        seconds = int((self.fullSeconds - counted))
-        counted += seconds
-        ms = int(round(1000 * (self.fullSeconds - counted)))
+        total = self.ms
+        sign = -1 if total < 0 else 1
+        seconds, ms = divmod(abs(total), 1000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
 
         return { \
-            'hours': hours,
-            'minutes': minutes,
-            'seconds': seconds,
-            'miliseconds': ms
+            'hours': sign * hours,
+            'minutes': sign * minutes,
+            'seconds': sign * seconds,
+            'miliseconds': sign * ms
         }
 
     def toStr(self, strType="time"):
         """Convert FrameTime to string representation"""
         if strType == "time":
             t = self.time
-            fmt = dict(sign='' if self._full_seconds >= 0 else '-',
+            fmt = dict(sign='' if self._value >= 0 else '-',
                        h=abs(t['hours']),
                        m=abs(t['minutes']),
                        s=abs(t['seconds']),
                        ms=abs(t['miliseconds']))
             return "%(sign)s%(h)d:%(m)02d:%(s)02d.%(ms)03d" % fmt
         elif strType == "frame":
-            return "%s" % int(round(self._frame))
+            return "%s" % self.frame
         else:
             raise AttributeError("Incorrect string type: '%s'" % strType)
 
     def __setTime__(self, value):
-        time = re.match(r"(?P<sign>[+-]?)(?P<h>\d+):(?P<m>[0-5][0-9]):(?P<s>[0-5][0-9])(?:$|\.(?P<ms>\d{1,3}))", value)
+        time = _timePattern.match(value)
         if time is None:
             raise ValueError("Incorrect time format.")
 
@@ -155,45 +216,44 @@ class FrameTime():
         minutes = int(time.group('m'))
         hours = int(time.group('h'))
 
-        self._full_seconds = sign * (3600*hours + 60*minutes + seconds + float(ms)/1000)
-        self._frame = self._fps * self._full_seconds
+        self._value = sign * (1000 * (3600*hours + 60*minutes + seconds) + ms)
 
     def __setSeconds__(self, seconds):
-        self._full_seconds = seconds
-        self._frame = seconds * self._fps
-
-    def __setFrame__(self, frame):
-        self.__setSeconds__(frame / self._fps)
+        self._value = int(round(seconds * 1000))
 
     def __eq__(self, other):
-        SubAssert(self._fps == other._fps, _("FPS values are not equal"))
-        return self._full_seconds == other._full_seconds
+        if self._fps != other._fps:
+            SubAssert(False, _("FPS values are not equal"))
+        if self._origin == other._origin:
+            return self._value == other._value
+        return self.fullSeconds == other.fullSeconds
 
     def __lt__(self, other):
-        SubAssert(self._fps == other._fps, _("FPS values are not equal"))
-        return self._full_seconds < other._full_seconds
+        if self._fps != other._fps:
+            SubAssert(False, _("FPS values are not equal"))
+        if self._origin == other._origin:
+            return self._value < other._value
+        return self.fullSeconds < other.fullSeconds
 
     def __add__(self, other):
         """Defines FrameTime + FrameTime"""
-        SubAssert(self._fps == other._fps, _("FPS values are not equal"))
-        result = self._full_seconds + other._full_seconds
-        return FrameTime(fps = self._fps, seconds = result)
+        if self._fps != other._fps:
+            SubAssert(False, _("FPS values are not equal"))
+        return FrameTime.fromMs(self._fps, self.ms + other.ms)
 
     def __sub__(self, other):
         """Defines FrameTime - FrameTime"""
-        SubAssert(self._fps == other._fps, _("FPS values are not equal"))
-        result = self._full_seconds - other._full_seconds
-        return FrameTime(fps = self._fps, seconds = result)
+        if self._fps != other._fps:
+            SubAssert(False, _("FPS values are not equal"))
+        return FrameTime.fromMs(self._fps, self.ms - other.ms)
 
     def __mul__(self, val):
         """Defines FrameTime * number"""
-        result = self._full_seconds * val
-        return FrameTime(fps = self._fps, seconds = result)
+        return FrameTime.fromMs(self._fps, int(round(self.ms * val)))
 
     def __div__(self, val):
         """Defines FrameTime / number"""
-        result = self._full_seconds / val
-        return FrameTime(fps = self._fps, seconds = result)
+        return FrameTime.fromMs(self._fps, int(round(self.ms / val)))
 
     def __str__(self):
         """Defines str(FrameTime)"""
@@ -202,6 +262,3 @@ class FrameTime():
     def __repr__(self):
         return "FrameTime(id=%s, s=%s, f=%s, fps=%s)" % \
                (id(self), self.fullSeconds, self.frame, self.fps)
-
-
-
@@ -20,6 +20,7 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import logging
+from array import array
 
 from subconvert.utils.Locale import _
 from subconvert.utils.SubException import SubAssert
@@ -63,33 +64,40 @@ class TimeSync():
         if len(syncPointList) == 0:
             return
 
-        subsCopy = self._subs.clone()
+        # Old times are read before any change, so subtitles don't have to be cloned.
+        subs = self._subs.view()
 
         syncPointList.sort()
 
         SubAssert(syncPointList[0].subNo >= 0)
-        SubAssert(syncPointList[0].subNo < subsCopy.size())
-        SubAssert(syncPointList[-1].subNo < subsCopy.size())
+        SubAssert(syncPointList[0].subNo < len(subs))
+        SubAssert(syncPointList[-1].subNo < len(subs))
 
         # Always start from the first subtitle.
-        firstSyncPoint = self._getLowestSyncPoint(syncPointList, subsCopy)
+        firstSyncPoint = self._getLowestSyncPoint(syncPointList, subs)
         if firstSyncPoint != syncPointList[0]:
             syncPointList.insert(0, firstSyncPoint)
 
-        for i, syncPoint in enumerate(syncPointList):
-
-            # Algorithm:
-            # 1. Calculate time deltas between sync points and between subs:
-            #        DE_OLD = subTime[secondSyncSubNo] - subTime[firstSyncSubNo]
-            #        DE_NEW = secondSyncTime - firstSyncTime
-            # 2. Calculate proportional sub position within DE_OLD:
-            #        d = (subTime - subTime[firstSubNo]) / DE_OLD
-            # 3. "d" is constant within deltas, so we can now calculate newSubTime:
-            #        newSubTime = DE_NEW * d + firstSyncTime
-
-            firstSyncPoint = syncPointList[i]
-            secondSyncPoint = self._getSyncPointOrEnd(i + 1, syncPointList, subsCopy)
-
+        # Algorithm:
+        # Sync points (and the last subtitle) are breakpoints of piecewise-linear functions which
+        # map old subtitle times to the new ones. Between each pair of breakpoints:
+        # 1. Calculate time deltas between sync points and between subs:
+        #        DE_OLD = subTime[secondSyncSubNo] - subTime[firstSyncSubNo]
+        #        DE_NEW = secondSyncTime - firstSyncTime
+        # 2. Calculate proportional sub position within DE_OLD:
+        #        d = (subTime - subTime[firstSubNo]) / DE_OLD
+        # 3. "d" is constant within deltas, so we can now calculate newSubTime:
+        #        newSubTime = DE_NEW * d + firstSyncTime
+        #
+        # Times are synced as whole columns of milliseconds, which is much cheaper than changing
+        # subtitles one by one, and each segment between breakpoints is computed in one pass.
+        breakpoints = syncPointList + [
+            self._getSyncPointOrEnd(len(syncPointList), syncPointList, subs)]
+        oldStarts, oldEnds = self._subs.times()
+        newStarts, newEnds = oldStarts[:], oldEnds[:]
+        fps = self._subs.fps
+
+        for firstSyncPoint, secondSyncPoint in zip(breakpoints, breakpoints[1:]):
             log.debug(_("Syncing times for sync points:"))
             log.debug("  %s" % firstSyncPoint)
             log.debug("  %s" % secondSyncPoint)
@@ -98,47 +106,44 @@ class TimeSync():
             if firstSyncPoint == secondSyncPoint:
                 continue
 
-            secondSubNo = secondSyncPoint.subNo
-            firstSubNo = firstSyncPoint.subNo
-
-            firstOldSub = subsCopy[firstSubNo]
-            secondOldSub = subsCopy[secondSubNo]
-
-            oldStartDelta, oldEndDelta = self._getDeltas(firstOldSub, secondOldSub)
-            newStartDelta, newEndDelta = self._getDeltas(firstSyncPoint, secondSyncPoint)
-
-            for subNo in range(firstSubNo, secondSubNo + 1):
-                sub = subsCopy[subNo]
-                newStartTime = self._calculateTime(sub.start, firstOldSub.start,
-                    firstSyncPoint.start, oldStartDelta, newStartDelta)
-                newEndTime = self._calculateTime(sub.end, firstOldSub.end,
-                    firstSyncPoint.end, oldEndDelta, newEndDelta)
-
-                self._subs.changeSubStart(subNo, newStartTime)
-                self._subs.changeSubEnd(subNo, newEndTime)
-
-    def _getDeltas(self, firstSub, secondSub):
-        """Arguments must have "start" and "end" properties which are FrameTimes."""
-        startDelta = max(firstSub.start, secondSub.start) - min(firstSub.start, secondSub.start)
-        endDelta = max(firstSub.end, secondSub.end) - min(firstSub.end, secondSub.end)
-        return (startDelta, endDelta)
-
-    def _calculateTime(self, currentSubTime, firstOldTime, firstSyncTime, oldDelta, newDelta):
-        if currentSubTime < firstOldTime:
-            log.warning(_("Currently synced subtitle has lower time than a previous one:" "%s < %s")
-                % (currentSubTime, firstOldTime))
+            segment = slice(firstSyncPoint.subNo, secondSyncPoint.subNo + 1)
+            newStarts[segment] = self._interpolate(fps, oldStarts[segment],
+                firstSyncPoint.start.ms, secondSyncPoint.start.ms)
+            newEnds[segment] = self._interpolate(fps, oldEnds[segment],
+                firstSyncPoint.end.ms, secondSyncPoint.end.ms)
+
+        self._subs.changeTimes(newStarts, newEnds)
+
+    def _interpolate(self, fps, oldTimes, firstSyncTime, secondSyncTime):
+        """Return new times of subtitles between two sync points, which are the first and the last
+        ones of oldTimes. All times are in milliseconds."""
+        firstOldTime = oldTimes[0]
+        oldDelta = abs(oldTimes[-1] - firstOldTime)
+        newDelta = abs(secondSyncTime - firstSyncTime)
+
+        if min(oldTimes) < firstOldTime:
+            for currentSubTime in oldTimes:
+                if currentSubTime < firstOldTime:
+                    log.warning(_("Currently synced subtitle has lower time than a previous one:"
+                        "%s < %s") % (FrameTime.fromMs(fps, currentSubTime),
+                        FrameTime.fromMs(fps, firstOldTime)))
+            oldTimes = [max(firstOldTime, time) for time in oldTimes]
 
         # Safety fuse. FrameTime disallows substracting higher time from the lower one but in some
         # corner cases this might be the case.
         # For example, when current time is lower than the previous one (i.e. firstOldTime), it
         # clearly means that subs are incorrect, but we'll still try to do something with them.
         # Because of basic physics (time continuity), we can safely assume that a given sub occurs
-        # AT LEAST at firstOldTime (which will be the case when secondsWithoutOffset is set to 0)
-        secondsWithoutOffset = max(0.0, currentSubTime.fullSeconds - firstOldTime.fullSeconds)
-
-        proportion = secondsWithoutOffset / oldDelta.fullSeconds
-        newTime = firstSyncTime + newDelta * proportion
-        return newTime
+        # AT LEAST at firstOldTime (which will be the case when time without offset is set to 0)
+        # When subtitles at both sync points have the same time, there's no proportion to keep,
+        # so all subtitles between them are moved to the first sync point.
+        if oldDelta == 0:
+            log.warning(_("Subtitles at sync points have the same time: %s. Subtitles between "
+                "them are moved to the first sync point.") % FrameTime.fromMs(fps, firstOldTime))
+            return array('q', [firstSyncTime]) * len(oldTimes)
+        scale = newDelta / oldDelta
+        return array('q', [firstSyncTime + round((time - firstOldTime) * scale)
+            for time in oldTimes])
 
     def _getLowestSyncPoint(self, syncPointList, subs):
         """Get the lowest possible sync point. If it is not the first one on the **sorted**
@@ -151,7 +156,7 @@ class TimeSync():
         if index < len(syncPointList):
             return syncPointList[index]
 
-        lastSubIndex = subs.size() - 1
+        lastSubIndex = len(subs) - 1
         lastSub = subs[-1]
         ret = SyncPoint(lastSubIndex, lastSub.start, lastSub.end)
         return ret
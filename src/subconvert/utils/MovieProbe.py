@@ -0,0 +1,245 @@
+#-*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2011, 2012, 2013 Michal Goral.
+
+This file is part of Subconvert
+
+Subconvert is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Subconvert is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Reads movie FPS straight from container headers of AVI, Matroska and MP4 files. Only headers
+# are read: chunks, elements and boxes which don't contain them are skipped.
+
+import os
+import struct
+
+# Matroska element IDs
+_MKV_SEGMENT = 0x18538067
+_MKV_TRACKS = 0x1654AE6B
+_MKV_TRACK_ENTRY = 0xAE
+_MKV_TRACK_TYPE = 0x83
+_MKV_DEFAULT_DURATION = 0x23E383
+_MKV_CLUSTER = 0x1F43B675
+_MKV_VIDEO_TRACK = 1
+
+_MP4_TOP_LEVEL_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot')
+
+def probeFps(movieFile):
+    """Return FPS read from headers of a given movie or None when it's not possible (e.g. movie
+    doesn't exist, it's in unsupported format or its headers are damaged)."""
+    try:
+        with open(movieFile, 'rb') as f:
+            fileSize = os.fstat(f.fileno()).st_size
+            magic = f.read(12)
+            if magic[:4] == b'RIFF' and magic[8:12] == b'AVI ':
+                fps = _aviFps(f, fileSize)
+            elif magic[:4] == b'\x1a\x45\xdf\xa3':
+                fps = _matroskaFps(f, fileSize)
+            elif magic[4:8] in _MP4_TOP_LEVEL_BOXES:
+                fps = _mp4Fps(f, fileSize)
+            else:
+                fps = None
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if fps is None or not 0 < fps < 1000:
+        return None
+    # MPlayer reports FPS with the same precision
+    return round(fps, 3)
+
+def _read(f, pos, size):
+    f.seek(pos)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("unexpected end of file")
+    return data
+
+#
+# AVI
+#
+
+def _riffChunks(f, start, end):
+    """Yield (fourcc, dataStart, dataSize) of RIFF chunks between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        fourcc, size = struct.unpack('<4sI', _read(f, pos, 8))
+        yield fourcc, pos + 8, size
+        pos += 8 + size + (size & 1) # chunks are word-aligned
+
+def _aviFps(f, fileSize):
+    for fourcc, data, size in _riffChunks(f, 12, fileSize):
+        if fourcc == b'LIST' and _read(f, data, 4) == b'hdrl':
+            return _aviHeaderFps(f, data + 4, min(data + size, fileSize))
+    return None
+
+def _aviHeaderFps(f, start, end):
+    # Video stream header (strh) is more accurate than the main header (avih), which stores
+    # frame duration in whole microseconds.
+    microSecPerFrame = 0
+    for fourcc, data, size in _riffChunks(f, start, end):
+        if fourcc == b'avih' and size >= 4:
+            microSecPerFrame, = struct.unpack('<I', _read(f, data, 4))
+        elif fourcc == b'LIST' and _read(f, data, 4) == b'strl':
+            for streamFourcc, streamData, streamSize in _riffChunks(f, data + 4, data + size):
+                if streamFourcc == b'strh' and streamSize >= 28:
+                    header = _read(f, streamData, 28)
+                    scale, rate = struct.unpack('<II', header[20:28])
+                    if header[:4] == b'vids' and scale > 0 and rate > 0:
+                        return rate / scale
+                    break
+    if microSecPerFrame > 0:
+        return 1000000 / microSecPerFrame
+    return None
+
+#
+# Matroska
+#
+
+def _ebmlNumber(f, keepMarker):
+    first = f.read(1)
+    if len(first) == 0:
+        raise ValueError("unexpected end of file")
+    mask = 0x80
+    length = 1
+    while not first[0] & mask:
+        mask >>= 1
+        length += 1
+        if length > 8:
+            raise ValueError("invalid EBML number")
+    value = first[0] if keepMarker else first[0] & (mask - 1)
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        raise ValueError("unexpected end of file")
+    for byte in rest:
+        value = (value << 8) | byte
+    return value, length
+
+def _ebmlElements(f, start, end):
+    """Yield (elementId, dataStart, dataSize) of EBML elements between start and end. dataSize
+    is None for elements with unknown size, which end iteration."""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        elementId = _ebmlNumber(f, keepMarker = True)[0]
+        size, length = _ebmlNumber(f, keepMarker = False)
+        if size == (1 << (7 * length)) - 1:
+            yield elementId, f.tell(), None
+            return
+        data = f.tell()
+        yield elementId, data, size
+        pos = data + size
+
+def _matroskaFps(f, fileSize):
+    for elementId, data, size in _ebmlElements(f, 0, fileSize):
+        if elementId != _MKV_SEGMENT:
+            continue
+        end = fileSize if size is None else min(data + size, fileSize)
+        for segmentId, segmentData, segmentSize in _ebmlElements(f, data, end):
+            if segmentId == _MKV_TRACKS and segmentSize is not None:
+                return _matroskaTracksFps(f, segmentData, segmentData + segmentSize)
+            # Tracks are stored before clusters, which would take ages to skip.
+            if segmentId == _MKV_CLUSTER or segmentSize is None:
+                break
+        return None
+    return None
+
+def _matroskaTracksFps(f, start, end):
+    for elementId, data, size in _ebmlElements(f, start, end):
+        if elementId != _MKV_TRACK_ENTRY or size is None:
+            continue
+        trackType = defaultDuration = None
+        for entryId, entryData, entrySize in _ebmlElements(f, data, data + size):
+            if entrySize is None:
+                break
+            if entryId == _MKV_TRACK_TYPE:
+                trackType = int.from_bytes(_read(f, entryData, entrySize), 'big')
+            elif entryId == _MKV_DEFAULT_DURATION:
+                defaultDuration = int.from_bytes(_read(f, entryData, entrySize), 'big')
+        if trackType == _MKV_VIDEO_TRACK and defaultDuration:
+            # DefaultDuration is a frame duration in nanoseconds
+            return 1000000000 / defaultDuration
+    return None
+
+#
+# MP4
+#
+
+def _mp4Boxes(f, start, end):
+    """Yield (boxType, dataStart, boxEnd) of MP4 boxes between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        size, boxType = struct.unpack('>I4s', _read(f, pos, 8))
+        headerSize = 8
+        if size == 1:
+            size, = struct.unpack('>Q', _read(f, pos + 8, 8))
+            headerSize = 16
+        elif size == 0: # box extends to the end of file
+            size = end - pos
+        if size < headerSize:
+            raise ValueError("invalid MP4 box size")
+        yield boxType, pos + headerSize, pos + size
+        pos += size
+
+def _mp4Child(f, start, end, boxType):
+    for childType, data, childEnd in _mp4Boxes(f, start, end):
+        if childType == boxType:
+            return data, childEnd
+    return None
+
+def _mp4Fps(f, fileSize):
+    moov = _mp4Child(f, 0, fileSize, b'moov')
+    if moov is None:
+        return None
+    for boxType, data, end in _mp4Boxes(f, moov[0], moov[1]):
+        if boxType == b'trak':
+            fps = _mp4TrackFps(f, data, end)
+            if fps is not None:
+                return fps
+    return None
+
+def _mp4TrackFps(f, start, end):
+    mdia = _mp4Child(f, start, end, b'mdia')
+    if mdia is None:
+        return None
+
+    timescale = handler = stbl = None
+    for boxType, data, boxEnd in _mp4Boxes(f, mdia[0], mdia[1]):
+        if boxType == b'mdhd':
+            # version 1 has 64-bit creation and modification times
+            version = _read(f, data, 1)[0]
+            timescaleOffset = 20 if version == 1 else 12
+            timescale, = struct.unpack('>I', _read(f, data + timescaleOffset, 4))
+        elif boxType == b'hdlr':
+            handler = _read(f, data + 8, 4)
+        elif boxType == b'minf':
+            stbl = _mp4Child(f, data, boxEnd, b'stbl')
+    if handler != b'vide' or not timescale or stbl is None:
+        return None
+
+    stts = _mp4Child(f, stbl[0], stbl[1], b'stts')
+    if stts is None:
+        return None
+    entryCount, = struct.unpack('>I', _read(f, stts[0] + 4, 4))
+    if stts[0] + 8 + 8 * entryCount > stts[1]:
+        raise ValueError("invalid stts box")
+
+    # stts maps sample (frame) counts to their durations
+    frames = duration = 0
+    for count, delta in struct.iter_unpack('>II', _read(f, stts[0] + 8, 8 * entryCount)):
+        frames += count
+        duration += count * delta
+    if duration == 0:
+        return None
+    return timescale * frames / duration
@@ -20,15 +20,26 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, TimeoutExpired
+import io
+import threading
+import concurrent.futures
+import mmap
 import shutil
 import codecs
+import contextlib
 import re
 import logging
 import datetime
+import json
+import stat
+import errno
+from collections import OrderedDict, namedtuple
 
 from subconvert.utils.Locale import _, P_
 from subconvert.utils.SubException import SubException
+from subconvert.utils.SubSettings import SubSettings
+from subconvert.utils.MovieProbe import probeFps
 
 try:
     import chardet
@@ -49,23 +60,38 @@ class VideoInfo:
         self.fps = fps
         self.videoPath = videoPath
 
+# Contents of a file read by File.load(): decoded text, encoding which was used to decode it and
+# file size in bytes.
+FileContent = namedtuple('FileContent', ['text', 'encoding', 'size'])
+
 class File:
     """Physical file handler. Reads/writes files, detects their encoding,
     backups etc."""
 
     DEFAULT_ENCODING = "utf-8"
+    CHARDET_SIZE = 5000
+    DECODE_CHUNK_SIZE = 1024 * 1024
     MOVIE_EXTENSIONS = ('avi', 'mkv', 'mpg', 'mp4', 'wmv', 'rmvb', 'mov', 'mpeg')
 
+    # Longer BOMs first: UTF-32 LE BOM starts with UTF-16 LE BOM.
+    BOMS = (
+        (codecs.BOM_UTF32_LE, 'utf-32'),
+        (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16'),
+    )
+
     def __init__(self, filePath):
-        # Will raise IOError if file doesn't exist
-        with open(filePath): pass
+        # Will raise IOError if file doesn't exist, is a directory or can't be read. File isn't
+        # opened until it's read.
+        if stat.S_ISDIR(os.stat(filePath).st_mode):
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), filePath)
+        if not os.access(filePath, os.R_OK):
+            raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), filePath)
 
         self._filePath = filePath
 
-        defaultChardetSize = 5000
-        fileSize = os.path.getsize(self._filePath)
-        self._chardetSize = defaultChardetSize if fileSize > defaultChardetSize else fileSize
-
     @property
     def path(self):
         return self._filePath
@@ -79,17 +105,25 @@ class File:
             return False
 
     def detectEncoding(self):
+        with open(self._filePath, mode='rb',) as file_:
+            return self._detectEncoding(file_.read(self.CHARDET_SIZE))
+
+    def _detectEncoding(self, sample):
         encoding = self.DEFAULT_ENCODING
 
+        for bom, bomEncoding in self.BOMS:
+            if sample.startswith(bom):
+                log.debug(_(" ...detected %s encoding from BOM.") % bomEncoding)
+                return bomEncoding
+
         if IS_CHARDET:
             minimumConfidence = 0.52
-            with open(self._filePath, mode='rb',) as file_:
-                enc = chardet.detect(file_.read(self._chardetSize))
-                log.debug(P_(
-                    "Detecting encoding from %d byte",
-                    "Detecting encoding from %d bytes",
-                    self._chardetSize) % self._chardetSize)
-                log.debug(_(" ...chardet: %s") % enc)
+            enc = chardet.detect(sample)
+            log.debug(P_(
+                "Detecting encoding from %d byte",
+                "Detecting encoding from %d bytes",
+                len(sample)) % len(sample))
+            log.debug(_(" ...chardet: %s") % enc)
             if enc['confidence'] > minimumConfidence:
                 encoding = enc['encoding']
                 log.debug(_(" ...detected %s encoding.") % enc['encoding'])
@@ -113,13 +147,69 @@ class File:
             raise SubFileError(_("Cannot handle '%(file)s' with '%(enc)s' encoding.") % vals)
         return fileInput
 
+    def load(self, encoding = None):
+        """Read a whole file at once and return its FileContent. File is opened only once and
+        memory-mapped, so encoding detection (when encoding isn't given) samples the same mapping
+        which is later decoded in large chunks. Line endings are translated to '\\n', just like for
+        files opened in a text mode."""
+        with self._mapped() as data:
+            if encoding is None:
+                encoding = self._detectEncoding(data[:self.CHARDET_SIZE])
+            return FileContent(self._decode(data, encoding), encoding, len(data))
+
+    def iterLines(self, encoding):
+        """Yield lines of a file one by one, so a whole file is never kept in memory. Like in
+        load(), line endings are translated to '\\n'. SubFileError is raised during iteration when
+        a file cannot be decoded."""
+        try:
+            with open(self._filePath, mode='r', encoding=encoding) as file_:
+                yield from file_
+        except LookupError as msg:
+            raise SubFileError(_("Unknown encoding name: '%s'.") % encoding)
+        except UnicodeDecodeError:
+            vals = {"file": self._filePath, "enc": encoding}
+            raise SubFileError(_("Cannot handle '%(file)s' with '%(enc)s' encoding.") % vals)
+
+    def readText(self, encoding = None):
+        """Read a whole file as a single string. See load()."""
+        return self.load(encoding).text
+
+    @contextlib.contextmanager
+    def _mapped(self):
+        with open(self._filePath, mode='rb') as file_:
+            if os.fstat(file_.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                yield b''
+                return
+            with mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    def _decode(self, data, encoding):
+        try:
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(encoding)(), translate=True)
+            chunks = []
+            for pos in range(0, len(data), self.DECODE_CHUNK_SIZE):
+                chunks.append(decoder.decode(data[pos:pos + self.DECODE_CHUNK_SIZE]))
+            chunks.append(decoder.decode(b'', final=True))
+        except LookupError as msg:
+            raise SubFileError(_("Unknown encoding name: '%s'.") % encoding)
+        except UnicodeDecodeError:
+            vals = {"file": self._filePath, "enc": encoding}
+            raise SubFileError(_("Cannot handle '%(file)s' with '%(enc)s' encoding.") % vals)
+        return ''.join(chunks)
+
     @classmethod
     def _writeFile(cls, filePath, content, encoding = None):
         """Safe file writing. Most common mistakes are checked against and reported before write
         operation. After that, if anything unexpected happens, user won't be left without data or
         with corrupted one as this method writes to a temporary file and then simply renames it
         (which should be atomic operation according to POSIX but who knows how Ext4 really works.
-        @see: http://lwn.net/Articles/322823/)."""
+        @see: http://lwn.net/Articles/322823/).
+
+        content is either a list of strings or a function which writes encoded content to
+        a binary stream: content(stream, encoding = encoding), e.g. SubConverter.convertTo with
+        bound Format and subtitles."""
 
         filePath = os.path.realpath(filePath)
         log.debug(_("Real file path to write: %s" % filePath))
@@ -128,21 +218,30 @@ class File:
             encoding = File.DEFAULT_ENCODING
 
         try:
-            encodedContent = ''.join(content).encode(encoding)
+            codecs.lookup(encoding)
         except LookupError as msg:
             raise SubFileError(_("Unknown encoding name: '%s'.") % encoding)
+
+        writer = content if callable(content) else cls._contentWriter(content)
+
+        tmpFilePath = "%s.tmp" % filePath
+        bakFilePath = "%s.bak" % filePath
+        try:
+            with open(tmpFilePath, 'wb') as f:
+                writer(f, encoding = encoding)
+                # ensure that all data is on disk.
+                # for performance reasons, we skip os.fsync(f.fileno())
+                f.flush()
         except UnicodeEncodeError:
+            os.unlink(tmpFilePath)
             raise SubFileError(
                 _("There are some characters in '%(file)s' that cannot be encoded to '%(enc)s'.")
                 % {"file": filePath, "enc": encoding})
-
-        tmpFilePath = "%s.tmp" % filePath
-        bakFilePath = "%s.bak" % filePath
-        with open(tmpFilePath, 'wb') as f:
-            f.write(encodedContent)
-            # ensure that all data is on disk.
-            # for performance reasons, we skip os.fsync(f.fileno())
-            f.flush()
+        except BaseException:
+            # don't leave partially written files
+            if os.path.exists(tmpFilePath):
+                os.unlink(tmpFilePath)
+            raise
 
         try:
             os.rename(filePath, bakFilePath)
@@ -158,6 +257,15 @@ class File:
         except FileNotFoundError:
             pass
 
+    @classmethod
+    def _contentWriter(cls, content):
+        def write(stream, encoding):
+            encoder = codecs.getincrementalencoder(encoding)()
+            for part in content:
+                stream.write(encoder.encode(part))
+            stream.write(encoder.encode('', final=True))
+        return write
+
     def overwrite(self, content, encoding = None):
         self._writeFile(self._filePath, content, encoding)
 
@@ -186,25 +294,64 @@ class File:
         shutil.copyfile(self._filePath, backupFilePath)
         return backupFilePath
 
-    def detectFps(self, movieFile = None, default = 23.976):
-        """Fetch movie FPS from MPlayer output or return given default."""
+    def detectFps(self, movieFile = None, default = 23.976, prober = None):
+        """Fetch movie FPS from MPlayer output or return given default. When FpsProber is given,
+        its (possibly prefetched) result is used."""
 
         if movieFile is None:
-            movieFile = self._searchForMovieFile()
+            movieFile = self.searchForMovieFile()
+        if prober is not None:
+            return prober.result(movieFile, default)
         return File.detectFpsFromMovie(movieFile, default)
 
     @classmethod
     def detectFpsFromMovie(cls, movieFile, default = 23.976):
-        """Fetch movie FPS from MPlayer output or return given default."""
+        """Fetch movie FPS from its headers, MPlayer output or return given default. FPS which has
+        been already detected by MPlayer for unchanged movie is taken from fpsCache."""
+        if not movieFile:
+            log.debug(_("No movie file found. Using default FPS value: %s.") % default)
+            return VideoInfo(float(default))
+
+        videoInfo = cls._videoInfoWithoutMplayer(movieFile)
+        if videoInfo is not None:
+            return videoInfo
+        try:
+            mpOut, mpErr = Popen(
+                cls._mplayerCommand(movieFile), stdout=PIPE, stderr=PIPE).communicate()
+        except OSError:
+            mpOut = mpErr = None
+        return cls._videoInfoFromMplayer(movieFile, default, mpOut, mpErr)
+
+    @classmethod
+    def _videoInfoWithoutMplayer(cls, movieFile):
+        """Return VideoInfo of a movie which can be read from its headers or fpsCache or None."""
+        if not movieFile:
+            return None
+        fps = probeFps(movieFile)
+        if fps is not None:
+            log.debug(_("Got %(fps)s FPS from '%(movie)s' headers.") %
+                {"fps": fps, "movie": movieFile})
+            return VideoInfo(fps, movieFile)
+        return fpsCache.videoInfo(movieFile)
+
+    @classmethod
+    def _mplayerCommand(cls, movieFile):
+        return ['mplayer',
+            '-really-quiet', '-vo', 'null', '-ao', 'null', '-frames', '0', '-identify', movieFile]
+
+    @classmethod
+    def _videoInfoFromMplayer(cls, movieFile, default, mpOut, mpErr):
+        """Create VideoInfo from MPlayer output, which is None when MPlayer couldn't be run."""
 
         # initialize with a default FPS value, but not with a movieFile
         videoInfo = VideoInfo(float(default))
 
-        command = ['mplayer',
-            '-really-quiet', '-vo', 'null', '-ao', 'null', '-frames', '0', '-identify', movieFile]
+        if mpOut is None:
+            log.warning(_("Couldn't run mplayer. It has to be installed and placed in your $PATH "
+                "to detect FPS."))
+            return videoInfo
 
         try:
-            mpOut, mpErr = Popen(command, stdout=PIPE, stderr=PIPE).communicate()
             log.debug(mpOut)
             log.debug(mpErr)
 
@@ -213,14 +360,11 @@ class File:
             # all.
             videoInfo.fps = float(re.search(r'ID_VIDEO_FPS=([\w/.]+)\s?', str(mpOut)).group(1))
             videoInfo.videoPath = movieFile
-        except OSError:
-            log.warning(_("Couldn't run mplayer. It has to be installed and placed in your $PATH "
-                "to detect FPS."))
         except AttributeError:
             log.warning(_("Couldn't get FPS from %(movie)s. Using default value: %(fps)s.") %
                 {"movie": movieFile, "fps": videoInfo.fps})
         else:
-            pass
+            fpsCache.put(movieFile, videoInfo.fps)
             log.debug(P_(
                 "Got %(fps)s FPS from '%(movie)s'.",
                 "Got %(fps)s FPS from '%(movie)s'.",
@@ -228,7 +372,8 @@ class File:
 
         return videoInfo
 
-    def _searchForMovieFile(self):
+    def searchForMovieFile(self):
+        """Return a path of a movie with the same name as this file or an empty string."""
         filename = os.path.splitext(self._filePath)[0]
         for ext in self.MOVIE_EXTENSIONS:
             fileWithLowerExt = '.'.join((filename, ext))
@@ -248,3 +393,197 @@ class File:
 
     def __hash__(self):
         return hash(self._filePath)
+
+class FpsProber:
+    """Detects FPS of many movies at once. For movies which FPS can't be read from their headers
+    or fpsCache, MPlayer is run in background threads for at most 'limit' movies at the same
+    time and each run is killed after 'timeout' seconds. Results are
+    the same as File.detectFpsFromMovie() gives, but they can be prefetched before they're
+    needed, e.g. while other files are parsed.
+
+    Prober should be closed when it's not needed anymore (see close()). It can be used as
+    a context manager which does it.
+
+    MPlayer runs are waited for in threads instead of an asyncio event loop: asyncio subprocesses
+    need coroutines, which are written with 'async def' since Python 3.5 and with
+    @asyncio.coroutine before (removed in Python 3.11), so neither works on all supported Python
+    versions. Before Python 3.8, an event loop running in a background thread also can't wait for
+    subprocesses without a child watcher set up from the main thread."""
+
+    def __init__(self, limit = 4, timeout = 30):
+        self._limit = limit
+        self._timeout = timeout
+        self._executor = None
+        self._results = {} # movieFile: VideoInfo or Future of (mpOut, mpErr)
+
+        # running MPlayer processes, which are killed when prober is closed
+        self._processes = set()
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """Stop detecting FPS in background. MPlayer isn't run anymore for prefetched movies which
+        still wait for it and the running ones are killed. Returns when background threads are
+        finished. Results which have been already detected are still available and FPS of other
+        movies is detected right away when they're requested."""
+        if self._executor is None:
+            return
+        for movieFile, prefetched in list(self._results.items()):
+            if isinstance(prefetched, concurrent.futures.Future) and prefetched.cancel():
+                del self._results[movieFile]
+        with self._lock:
+            self._closing = True
+            for process in self._processes:
+                process.kill()
+        self._executor.shutdown(wait = True)
+        self._executor = None
+        self._closing = False
+
+    def prefetch(self, movieFiles):
+        """Start detecting FPS of given movies in background. Returns immediately."""
+        for movieFile in movieFiles:
+            if not movieFile or movieFile in self._results:
+                continue
+            videoInfo = File._videoInfoWithoutMplayer(movieFile)
+            if videoInfo is not None:
+                self._results[movieFile] = videoInfo
+                continue
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = self._limit)
+            self._results[movieFile] = self._executor.submit(self._runMplayer, movieFile)
+
+    def result(self, movieFile, default = 23.976):
+        """Return VideoInfo of a given movie or a default FPS value, exactly like
+        File.detectFpsFromMovie(). Waits for a prefetched result or runs MPlayer right away when
+        a movie hasn't been prefetched."""
+        prefetched = self._results.get(movieFile)
+        if prefetched is None:
+            return File.detectFpsFromMovie(movieFile, default)
+        if isinstance(prefetched, VideoInfo):
+            return VideoInfo(prefetched.fps, prefetched.videoPath)
+        mpOut, mpErr = prefetched.result()
+        return File._videoInfoFromMplayer(movieFile, default, mpOut, mpErr)
+
+    def _runMplayer(self, movieFile):
+        try:
+            process = Popen(File._mplayerCommand(movieFile), stdout = PIPE, stderr = PIPE)
+        except OSError:
+            return None, None
+
+        with self._lock:
+            if self._closing:
+                process.kill()
+            self._processes.add(process)
+        try:
+            return process.communicate(timeout = self._timeout)
+        except TimeoutExpired:
+            log.debug(_("MPlayer didn't finish in %(timeout)s seconds for '%(movie)s'.") %
+                {"timeout": self._timeout, "movie": movieFile})
+            process.kill()
+            process.communicate()
+            return b'', b''
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+class FpsCache:
+    """Persistent cache of FPS detected from movies, stored in a JSON file next to Subconvert
+    settings. Movies are identified by their real path, size and modification time, so modified
+    or replaced movies are detected again. Only 'maxEntries' recently used movies are
+    remembered."""
+
+    def __init__(self, path = None, maxEntries = 512):
+        self._path = path
+        self._maxEntries = maxEntries
+        self._entries = None # realpath: [size, mtime, fps], from the least recently used
+        self._lock = threading.Lock()
+
+    @classmethod
+    def defaultPath(cls):
+        return SubSettings().getFpsCachePath()
+
+    def path(self):
+        return self._path if self._path is not None else self.defaultPath()
+
+    def get(self, movieFile):
+        """Return FPS remembered for a given movie or None."""
+        identity = self._identity(movieFile)
+        if identity is None:
+            return None
+        realPath, size, mtime = identity
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            entry = self._entries.get(realPath)
+            if entry is None or entry[:2] != [size, mtime]:
+                return None
+            self._entries.move_to_end(realPath)
+            return entry[2]
+
+    def videoInfo(self, movieFile):
+        """Return VideoInfo of a given movie if its FPS is remembered or None."""
+        fps = self.get(movieFile)
+        if fps is None:
+            return None
+        log.debug(_("Got %(fps)s FPS from '%(movie)s' (cached).") %
+            {"fps": fps, "movie": movieFile})
+        return VideoInfo(fps, movieFile)
+
+    def put(self, movieFile, fps):
+        """Remember FPS of a given movie and store it on disk."""
+        identity = self._identity(movieFile)
+        if identity is None:
+            return
+        realPath, size, mtime = identity
+        with self._lock:
+            # Re-read the cache file, so entries stored in the meantime by other Subconvert
+            # processes aren't lost.
+            self._entries = self._read()
+            self._entries[realPath] = [size, mtime, fps]
+            self._entries.move_to_end(realPath)
+            while len(self._entries) > self._maxEntries:
+                self._entries.popitem(last = False)
+            self._write(self._entries)
+
+    @classmethod
+    def _identity(cls, movieFile):
+        if not movieFile:
+            return None
+        try:
+            st = os.stat(movieFile)
+        except OSError:
+            return None
+        return os.path.realpath(movieFile), st.st_size, st.st_mtime_ns
+
+    def _read(self):
+        try:
+            with open(self.path(), 'r', encoding = 'utf-8') as f:
+                entries = json.load(f, object_pairs_hook = OrderedDict)
+        except (OSError, ValueError):
+            return OrderedDict()
+        if not isinstance(entries, OrderedDict):
+            return OrderedDict()
+        return OrderedDict((realPath, entry) for realPath, entry in entries.items()
+            if isinstance(entry, list) and len(entry) == 3)
+
+    def _write(self, entries):
+        path = self.path()
+        tmpPath = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(tmpPath, 'w', encoding = 'utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmpPath, path)
+        except OSError as err:
+            log.debug(_("Couldn't save FPS cache to '%(path)s': %(err)s") %
+                {"path": path, "err": err})
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+
+fpsCache = FpsCache()
@@ -111,6 +111,30 @@ class SubSettings:
         except ValueError:
             pass
 
+    #
+    # FPS detected from movies is cached in a file next to config files
+    #
+
+    def getFpsCachePath(self):
+        return os.path.join(os.path.dirname(self._programState.fileName()), "fpscache.json")
+
+    #
+    # Memory (in MiB) which can be taken by undo history of each file and of all files. 0 means
+    # that there's no limit.
+    #
+
+    def getHistoryMemoryLimit(self):
+        return self._settings.value("history/file_memory_limit", 64, type = int)
+
+    def setHistoryMemoryLimit(self, val):
+        self._settings.setValue("history/file_memory_limit", val)
+
+    def getTotalHistoryMemoryLimit(self):
+        return self._settings.value("history/memory_limit", 256, type = int)
+
+    def setTotalHistoryMemoryLimit(self, val):
+        self._settings.setValue("history/memory_limit", val)
+
     #
     # Generic functions for windows/widgets. Please note that passed QWidgets must have previously
     # set objects names via QWidget::setObjectName(str) method. The convention is to use underscores
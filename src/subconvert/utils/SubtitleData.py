@@ -66,7 +66,7 @@ class SubtitleData:
     def verifySubtitles(self):
         if self.subtitles is None:
             raise TypeError("Subtitles cannot be of type 'NoneType'!")
-        if type(self.subtitles) is not SubManager:
+        if not isinstance(self.subtitles, SubManager):
             raise TypeError(_("Subtitles are not of type 'SubManager'!"))
 
     def verifyFps(self):
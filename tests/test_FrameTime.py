@@ -182,3 +182,68 @@ def test_change_fps_nook(bad_fps):
         ft.fps = bad_fps
     assert ft.fps == 25
 
+
+
+def test_change_fps_keeps_frames():
+    ft = FrameTime(23.976, frames=1000)
+    for fps in (25, 29.97, 23.976, 7):
+        ft.fps = fps
+    assert ft.frame == 1000
+
+
+def test_change_fps_keeps_time():
+    ft = FrameTime(23.976, time='1:23:45.678')
+    for fps in (25, 29.97, 7, 23.976):
+        ft.fps = fps
+    assert ft.toStr() == '1:23:45.678'
+
+
+def test_from_ms():
+    ft = FrameTime.fromMs(25.0, 3661101)
+    assert ft == FrameTime(25, time='1:01:01.101')
+    assert ft.ms == 3661101
+    assert ft.fullSeconds == 3661.101
+
+
+def test_from_frames():
+    ft = FrameTime.fromFrames(25.0, 100)
+    assert ft == FrameTime(25, frames=100)
+    assert ft.frame == 100
+    assert ft.ms == 4000
+
+
+def test_clone_is_independent():
+    ft = FrameTime(25, frames=100)
+    cloned = ft.clone()
+    cloned.fps = 50
+    assert ft.fps == 25
+    assert ft.frame == cloned.frame
+
+
+def test_no_instance_dict():
+    with pytest.raises(AttributeError):
+        FrameTime(25).foo = 1
+
+
+def test_from_components():
+    ft = FrameTime.fromComponents(25, 1, 1, 1, 101)
+    assert ft == FrameTime(25, time='1:01:01.101')
+    assert ft.fps == 25
+
+
+@pytest.mark.parametrize('components', [(0, 60, 0, 0), (0, 0, 60, 0), (0, 0, 0, 1000),
+                                        (-1, 0, 0, 0), (0, 0, 0, -1)])
+def test_from_components_incorrect(components):
+    with pytest.raises(ValueError):
+        FrameTime.fromComponents(25, *components)
+    with pytest.raises(ValueError):
+        FrameTime.fromComponents(0, 0, 0, 0, 0)
+
+
+def test_from_value():
+    for ft in (FrameTime(23.976, frames=100), FrameTime(23.976, time='0:01:02.345')):
+        other = FrameTime.fromValue(ft.fps, ft.origin, ft.value)
+        other.fps = 25
+        ft.fps = 25
+        assert other == ft
+        assert other.frame == ft.frame
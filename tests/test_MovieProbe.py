@@ -0,0 +1,166 @@
+#-*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2016 Michal Goral.
+
+This file is part of Subconvert
+
+Subconvert is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Subconvert is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import struct
+
+import pytest
+
+from subconvert.utils.MovieProbe import probeFps
+
+
+def riff_chunk(fourcc, data):
+    padding = b'\0' if len(data) % 2 else b''
+    return fourcc + struct.pack('<I', len(data)) + data + padding
+
+
+def riff_list(listType, *chunks):
+    return riff_chunk(b'LIST', listType + b''.join(chunks))
+
+
+def strh(streamType, scale, rate):
+    return riff_chunk(b'strh', streamType + b'\0' * 16 + struct.pack('<III', scale, rate, 0)
+                      + b'\0' * 28)
+
+
+def avi(*headerChunks, avih=40000):
+    mainHeader = riff_chunk(b'avih', struct.pack('<I', avih) + b'\0' * 52)
+    return riff_chunk(b'RIFF', b'AVI '
+                      + riff_list(b'hdrl', mainHeader, *headerChunks)
+                      + riff_list(b'movi', riff_chunk(b'00dc', b'frame' * 100)))
+
+
+def ebml_size(size):
+    return bytes([0x80 | size]) if size < 0x7f else b'\x01' + size.to_bytes(7, 'big')
+
+
+def ebml_element(elementId, data):
+    return elementId + ebml_size(len(data)) + data
+
+
+def mkv_track(trackType, defaultDuration=None):
+    data = ebml_element(b'\xd7', b'\x01') + ebml_element(b'\x83', bytes([trackType]))
+    if defaultDuration is not None:
+        data += ebml_element(b'\x23\xe3\x83', defaultDuration.to_bytes(4, 'big'))
+    return ebml_element(b'\xae', data)
+
+
+def mkv(*tracks, unknownSegmentSize=False):
+    header = ebml_element(b'\x1a\x45\xdf\xa3', ebml_element(b'\x42\x82', b'matroska'))
+    segment = (ebml_element(b'\x15\x49\xa9\x66', b'\0' * 20)
+               + ebml_element(b'\x16\x54\xae\x6b', b''.join(tracks))
+               + ebml_element(b'\x1f\x43\xb6\x75', b'\0' * 200))
+    if unknownSegmentSize:
+        return header + b'\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff' + segment
+    return header + ebml_element(b'\x18\x53\x80\x67', segment)
+
+
+def mp4_box(boxType, *children):
+    data = b''.join(children)
+    return struct.pack('>I', len(data) + 8) + boxType + data
+
+
+def mp4_track(handler, timescale, stts, mdhdVersion=0):
+    if mdhdVersion == 1:
+        mdhd = b'\x01\0\0\0' + b'\0' * 16 + struct.pack('>IQ', timescale, 0) + b'\0' * 4
+    else:
+        mdhd = b'\0' * 12 + struct.pack('>II', timescale, 0) + b'\0' * 4
+    sttsData = b'\0' * 4 + struct.pack('>I', len(stts)) + b''.join(
+        struct.pack('>II', count, delta) for count, delta in stts)
+    return mp4_box(b'trak',
+                   mp4_box(b'tkhd', b'\0' * 84),
+                   mp4_box(b'mdia',
+                           mp4_box(b'mdhd', mdhd),
+                           mp4_box(b'hdlr', b'\0' * 8 + handler + b'\0' * 12),
+                           mp4_box(b'minf', mp4_box(b'stbl', mp4_box(b'stts', sttsData)))))
+
+
+def mp4(*tracks, moovFirst=True):
+    ftyp = mp4_box(b'ftyp', b'isom\0\0\0\0isom')
+    mdat = mp4_box(b'mdat', b'\0' * 500)
+    moov = mp4_box(b'moov', mp4_box(b'mvhd', b'\0' * 100), *tracks)
+    return ftyp + (moov + mdat if moovFirst else mdat + moov)
+
+
+def probe(tmpdir, data, name='movie'):
+    path = tmpdir.join(name)
+    path.write_binary(data)
+    return probeFps(str(path))
+
+
+def test_avi_fps_from_video_stream_header(tmpdir):
+    data = avi(riff_list(b'strl', strh(b'auds', 1, 44100)),
+               riff_list(b'strl', strh(b'vids', 1001, 24000)))
+    assert probe(tmpdir, data) == 23.976
+
+
+def test_avi_fps_from_main_header(tmpdir):
+    assert probe(tmpdir, avi(avih=40000)) == 25
+
+
+def test_mkv_fps(tmpdir):
+    data = mkv(mkv_track(2), mkv_track(1, defaultDuration=41708333))
+    assert probe(tmpdir, data) == 23.976
+
+
+def test_mkv_fps_with_unknown_segment_size(tmpdir):
+    data = mkv(mkv_track(1, defaultDuration=33366667), unknownSegmentSize=True)
+    assert probe(tmpdir, data) == 29.97
+
+
+def test_mkv_without_default_duration(tmpdir):
+    assert probe(tmpdir, mkv(mkv_track(1))) is None
+
+
+@pytest.mark.parametrize('moovFirst', [True, False])
+def test_mp4_fps(tmpdir, moovFirst):
+    data = mp4(mp4_track(b'soun', 48000, [(100, 1024)]),
+               mp4_track(b'vide', 24000, [(240, 1001)]), moovFirst=moovFirst)
+    assert probe(tmpdir, data) == 23.976
+
+
+def test_mp4_fps_with_variable_frame_durations(tmpdir):
+    data = mp4(mp4_track(b'vide', 90000, [(10, 3600), (10, 3600), (5, 3600)], mdhdVersion=1))
+    assert probe(tmpdir, data) == 25
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'ID_VIDEO_FPS=25.000\n',
+    b'RIFF\xff\xff\xff\xffAVI LIST',
+    b'\x1a\x45\xdf\xa3\x00',
+    b'\0\0\0\x01ftyp',
+])
+def test_unsupported_or_damaged_movies(tmpdir, data):
+    assert probe(tmpdir, data) is None
+
+
+@pytest.mark.parametrize('data', [
+    avi(riff_list(b'strl', strh(b'vids', 1, 25))),
+    mkv(mkv_track(1, defaultDuration=40000000)),
+    mp4(mp4_track(b'vide', 25, [(10, 1)])),
+])
+def test_truncated_movies(tmpdir, data):
+    for end in range(0, len(data), 3):
+        assert probe(tmpdir, data[:end]) in (None, 25)
+
+
+def test_nonexistent_movie(tmpdir):
+    assert probeFps(str(tmpdir.join('nonexistent.avi'))) is None
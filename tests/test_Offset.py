@@ -23,7 +23,7 @@ import unittest
 
 from subconvert.parsing.Offset import SyncPoint, TimeSync
 from subconvert.parsing.FrameTime import FrameTime
-from subconvert.parsing.Core import Subtitle, SubManager
+from subconvert.parsing.Core import Subtitle, SubManager, ColumnarSubManager
 
 class TestOffset(unittest.TestCase):
     """Offset Unit Tests"""
@@ -144,7 +144,7 @@ class TestOffset(unittest.TestCase):
         self.assertEqual(self._subs[2].end, self.createFrameTime(8))
 
         self.assertTrue(self._subs[3].start > self.createFrameTime(7))
-        self.assertEqual(self._subs[3].end, self.createFrameTime(8)) # see _calculateTime() comments
+        self.assertEqual(self._subs[3].end, self.createFrameTime(8)) # see _interpolate() comments
         self.assertTrue(self._subs[3].start < self.createFrameTime(50))
 
         self.assertEqual(self._subs[4].start, self.createFrameTime(50))
@@ -180,3 +180,53 @@ class TestOffset(unittest.TestCase):
         self.assertEqual(self._subs[5].start, self.createFrameTime(5))
         self.assertEqual(self._subs[5].end, self.createFrameTime(6))
 
+    def test_syncWarnsAboutSubtitlesWithLowerTimes(self):
+        syncList = [
+            self.createSyncPoint(1, 7, 8),
+            self.createSyncPoint(5, 50, 60)
+        ]
+        with self.assertLogs('Subconvert', level='WARNING') as logs:
+            self._testedTimeSync.sync(syncList)
+
+        # starts and ends of 3rd and 4th subtitles are lower than 2nd subtitle times
+        self.assertEqual(len(logs.output), 4)
+        self.assertEqual(self._subs[2].start, self.createFrameTime(7))
+        self.assertEqual(self._subs[3].end, self.createFrameTime(8))
+
+    def test_syncBetweenSubtitlesWithEqualTimes(self):
+        syncList = [
+            self.createSyncPoint(1, 7, 8),
+            self.createSyncPoint(4, 50, 60)
+        ]
+        with self.assertLogs('Subconvert', level='WARNING') as logs:
+            self._testedTimeSync.sync(syncList)
+        self.assertTrue(any('the same time' in line for line in logs.output))
+
+        # 2nd and 5th subtitles start at the same time
+        self.assertEqual(self._subs[2].start, self.createFrameTime(7))
+        self.assertEqual(self._subs[3].start, self.createFrameTime(7))
+        self.assertEqual(self._subs[4].start, self.createFrameTime(50))
+        self.assertEqual(self._subs[4].end, self.createFrameTime(60))
+
+    def test_syncWithManySyncPoints(self):
+        self._subs.clear()
+        for i in range(1000):
+            self._subs.append(self.createSubtitle(2 * i, 2 * i + 1))
+
+        syncList = [self.createSyncPoint(i, 4 * i + 1, 4 * i + 3) for i in range(100, 1000, 100)]
+        self._testedTimeSync.sync(syncList)
+
+        self.assertEqual(self._subs[0].start, self.createFrameTime(0))
+        self.assertEqual(self._subs[50].start, self.createFrameTime(200.5))
+        self.assertEqual(self._subs[50].end, self.createFrameTime(202))
+        for syncPoint in syncList:
+            self.assertEqual(self._subs[syncPoint.subNo].start, syncPoint.start)
+            self.assertEqual(self._subs[syncPoint.subNo].end, syncPoint.end)
+
+class TestColumnarOffset(TestOffset):
+    """Offset Unit Tests for columnar storage"""
+
+    def setUp(self):
+        super().setUp()
+        self._subs = ColumnarSubManager.fromSubtitles(self._subs)
+        self._testedTimeSync = TimeSync(self._subs)
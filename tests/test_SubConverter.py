@@ -19,10 +19,12 @@ You should have received a copy of the GNU General Public License
 along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
 import unittest
 from subconvert.parsing.FrameTime import FrameTime
-from subconvert.parsing.Core import SubConverter, SubManager, Subtitle
-from subconvert.parsing.Formats import SubRip, SubViewer
+from subconvert.parsing.Core import SubConverter, SubManager, Subtitle, SubParser
+from subconvert.parsing.Core import SubConversionError
+from subconvert.parsing.Formats import SubRip, SubViewer, MicroDVD, MPL2, TMP
 from subconvert.utils.SubException import SubException
 
 # FIXME: SubConverter tests should not rely on actual subtitle parsers. A mocked parser should be
@@ -78,5 +80,69 @@ class TestSubConverter(unittest.TestCase):
         result = self.c.convert(SubRip, self.subs)
         self.assertEqual(''.join(self.subWithoutHeader).strip(), ''.join(result).strip())
 
+    def test_convertConsumesParserGenerator(self):
+        parser = SubParser()
+        parser.registerFormat(SubRip)
+        parser.registerFormat(SubViewer)
+        stream = io.StringIO(''.join(self.subWithHeader))
+        result = self.c.convert(SubViewer, parser.iterparse(stream, 25))
+        self.assertEqual(''.join(self.subWithHeader).strip(), ''.join(result).strip())
+
+    def test_convertIterableWithoutHeader(self):
+        result = self.c.convert(SubRip, iter(self.subs))
+        self.assertEqual(''.join(self.subWithoutHeader).strip(), ''.join(result).strip())
+
+    def test_convertToWritesEncodedSubtitles(self):
+        for Format in (SubRip, SubViewer):
+            for encoding in ('utf-8', 'utf-16', 'cp1250'):
+                stream = io.BytesIO()
+                self.c.convertTo(stream, Format, self.subs, encoding)
+                expected = ''.join(self.c.convert(Format, self.subs)).encode(encoding)
+                self.assertEqual(expected, stream.getvalue())
+
+    def test_convertToWritesInChunks(self):
+        class Stream(io.BytesIO):
+            writes = 0
+            def write(self, data):
+                self.writes += 1
+                return super().write(data)
+
+        self.c.WRITE_CHUNK_SIZE = 1
+        stream = Stream()
+        self.c.convertTo(stream, SubRip, self.subs, 'utf-8')
+        self.assertEqual(3, stream.writes)
+        self.assertEqual(''.join(self.c.convert(SubRip, self.subs)).encode('utf-8'),
+            stream.getvalue())
+
+    def test_convertToReportsUnencodableSubtitle(self):
+        self.subs.append(Subtitle(FrameTime(25.0, frames=100), FrameTime(25.0, frames=125), "Ω"))
+        with self.assertRaises(SubConversionError) as cm:
+            self.c.convertTo(io.BytesIO(), SubRip, self.subs, 'ascii')
+        self.assertEqual(3, cm.exception.subNo)
+
+        with self.assertRaises(SubConversionError) as cm:
+            self.c.convertTo(io.BytesIO(), SubViewer, self.subs, 'ascii')
+        self.assertEqual(3, cm.exception.subNo)
+
+    def test_convertRawSubtitlesGivesTheSameResultAsConvert(self):
+        parser = SubParser()
+        parser.registerFormat(SubRip)
+        content = ''.join(self.subWithoutHeader[:-1] + ["<i>{sub}title</i>  \n", "\n",
+            "2\n", "00:00:04,000 --> 00:00:05,000\n", " Third\n", "one\n"])
+        subs = parser.parse(content)
+        rawSubs = parser.parseRaw(content)
+        for Format in (SubRip, SubViewer, MicroDVD, MPL2, TMP):
+            self.assertEqual(self.c.convert(Format, subs), self.c.convert(Format, rawSubs))
+
+    def test_convertRawSubtitlesAfterTimeChange(self):
+        parser = SubParser()
+        parser.registerFormat(SubRip)
+        subs = parser.parse(self.subWithoutHeader)
+        rawSubs = parser.parseRaw(self.subWithoutHeader)
+        subs.offset(FrameTime(25.0, seconds=10))
+        rawSubs.offset(FrameTime(25.0, seconds=10))
+        self.assertEqual(self.c.convert(SubRip, subs), self.c.convert(SubRip, rawSubs))
+
+
 if __name__ == "__main__":
     unittest.main()
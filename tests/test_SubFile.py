@@ -0,0 +1,401 @@
+#-*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2016 Michal Goral.
+
+This file is part of Subconvert
+
+Subconvert is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Subconvert is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import glob
+import time
+import functools
+
+import pytest
+from PyQt5.QtCore import QSettings
+
+from subconvert.parsing.Core import SubConverter, SubManager, Subtitle
+from subconvert.parsing.Formats import SubRip
+from subconvert.parsing.FrameTime import FrameTime
+from subconvert.utils import SubFile as SubFileModule
+from subconvert.utils.SubFile import File, FpsProber, FpsCache, SubFileError
+from subconvert.utils.SubException import SubException
+
+
+def sub_paths():
+    curr_dir = os.path.dirname(os.path.realpath(__file__))
+    return glob.glob(os.path.join(curr_dir, 'subs', '*.txt'))
+
+
+def write_bytes(tmpdir, name, data):
+    path = tmpdir.join(name)
+    path.write_binary(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('path', sub_paths())
+def test_read_text_equals_read_lines(path):
+    f = File(path)
+    assert f.readText('utf-8') == ''.join(f.read('utf-8'))
+
+
+def test_read_text_translates_newlines(tmpdir):
+    path = write_bytes(tmpdir, 'newlines.sub', b'first\r\nsecond\rthird\n')
+    assert File(path).readText('utf-8') == 'first\nsecond\nthird\n'
+
+
+def test_read_text_decodes_in_chunks(tmpdir, monkeypatch):
+    monkeypatch.setattr(File, 'DECODE_CHUNK_SIZE', 3)
+    text = 'zażółć\r\ngęślą\r\njaźń\r\n'
+    path = write_bytes(tmpdir, 'chunks.sub', text.encode('utf-8'))
+    assert File(path).readText('utf-8') == text.replace('\r\n', '\n')
+
+
+def test_read_text_of_empty_file(tmpdir):
+    path = write_bytes(tmpdir, 'empty.sub', b'')
+    assert File(path).readText() == ''
+
+
+def test_read_text_with_incorrect_encoding(tmpdir):
+    path = write_bytes(tmpdir, 'incorrect.sub', 'zażółć'.encode('utf-8'))
+    with pytest.raises(SubFileError):
+        File(path).readText('ascii')
+    with pytest.raises(SubFileError):
+        File(path).readText('no-such-encoding')
+
+
+def test_iter_lines_equals_read_text(tmpdir):
+    path = write_bytes(tmpdir, 'lines.sub', b'first\r\nsecond\rthird')
+    assert list(File(path).iterLines('utf-8')) == ['first\n', 'second\n', 'third']
+
+
+def test_iter_lines_with_incorrect_encoding(tmpdir):
+    path = write_bytes(tmpdir, 'incorrect.sub', 'zażółć'.encode('utf-8'))
+    with pytest.raises(SubFileError):
+        list(File(path).iterLines('ascii'))
+    with pytest.raises(SubFileError):
+        list(File(path).iterLines('no-such-encoding'))
+
+
+def test_load_opens_file_once(tmpdir, monkeypatch):
+    path = write_bytes(tmpdir, 'once.sub', '{1}{2}zażółć\n'.encode('utf-8'))
+    opened = []
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return open(*args, **kwargs)
+    monkeypatch.setattr(SubFileModule, 'open', counting_open, raising=False)
+
+    content = File(path).load()
+    assert content.text == '{1}{2}zażółć\n'
+    assert content.size == len('{1}{2}zażółć\n'.encode('utf-8'))
+    assert opened == [path]
+
+
+@pytest.mark.parametrize('encoding, expected', [
+    ('utf-8-sig', 'utf-8-sig'),
+    ('utf-16', 'utf-16'),
+    ('utf-16-be', 'utf-16'),
+    ('utf-32', 'utf-32'),
+])
+def test_load_detects_encoding_from_bom(tmpdir, encoding, expected):
+    data = 'zażółć\r\n'.encode(encoding)
+    if encoding == 'utf-16-be':
+        data = b'\xfe\xff' + data
+    path = write_bytes(tmpdir, 'bom.sub', data)
+    content = File(path).load()
+    assert content.encoding == expected
+    assert content.text == 'zażółć\n'
+    assert File(path).detectEncoding() == expected
+
+
+def test_load_with_given_encoding(tmpdir):
+    path = write_bytes(tmpdir, 'cp1250.sub', 'zażółć'.encode('cp1250'))
+    content = File(path).load('cp1250')
+    assert content == ('zażółć', 'cp1250', 6)
+
+
+def test_file_must_exist_and_cannot_be_a_directory(tmpdir):
+    with pytest.raises(IOError):
+        File(str(tmpdir.join('nonexistent.sub')))
+    with pytest.raises(IOError):
+        File(str(tmpdir))
+
+
+def test_file_must_be_readable(tmpdir, monkeypatch):
+    path = write_bytes(tmpdir, 'unreadable.sub', b'{1}{2}Text\n')
+    monkeypatch.setattr(os, 'access', lambda path, mode: mode != os.R_OK)
+    with pytest.raises(IOError):
+        File(path)
+
+
+def test_write_content_list(tmpdir):
+    path = str(tmpdir.join('list.sub'))
+    File.write(path, ['zażółć\n', 'gęślą\n'], 'cp1250')
+    assert open(path, 'rb').read() == 'zażółć\ngęślą\n'.encode('cp1250')
+
+
+def test_write_with_writer(tmpdir):
+    path = str(tmpdir.join('writer.sub'))
+    File.write(path, lambda stream, encoding: stream.write('jaźń'.encode(encoding)), 'utf-16')
+    assert open(path, 'rb').read() == 'jaźń'.encode('utf-16')
+
+
+def test_overwrite_failure_keeps_original_file(tmpdir):
+    path = write_bytes(tmpdir, 'original.sub', b'original')
+
+    def failingWriter(stream, encoding):
+        stream.write(b'partial')
+        raise SubException('conversion failed')
+
+    with pytest.raises(SubException):
+        File(path).overwrite(failingWriter)
+    with pytest.raises(SubFileError):
+        File(path).overwrite(['zażółć'], 'ascii')
+    with pytest.raises(SubFileError):
+        File(path).overwrite(['zażółć'], 'no-such-encoding')
+
+    assert open(path, 'rb').read() == b'original'
+    assert tmpdir.listdir() == [tmpdir.join('original.sub')]
+
+
+def test_write_with_partially_applied_converter(tmpdir):
+    path = str(tmpdir.join('converted.srt'))
+    subs = SubManager()
+    subs.append(Subtitle(FrameTime(25.0, frames=0), FrameTime(25.0, frames=25), 'Text'))
+    converter = SubConverter()
+    File.write(path, functools.partial(converter.convertTo, Format=SubRip, subtitles=subs),
+               'utf-8')
+    assert open(path, 'rb').read() == ''.join(converter.convert(SubRip, subs)).encode('utf-8')
+
+
+# Fake mplayer prints contents of a given movie file. Movies with 'SLOW' inside take a while.
+# Each run is logged in 'calls' file.
+FAKE_MPLAYER = """#!/bin/sh
+for movie; do :; done
+echo "$movie" >> "$(dirname "$0")/calls"
+grep -q SLOW "$movie" && exec sleep 5
+cat "$movie"
+"""
+
+@pytest.fixture(autouse=True)
+def fps_cache(tmpdir, monkeypatch):
+    cache = FpsCache(str(tmpdir.join('config', 'fpscache.json')))
+    monkeypatch.setattr(SubFileModule, 'fpsCache', cache)
+    return cache
+
+
+def mplayer_calls(mplayer):
+    calls = mplayer.dirpath('calls')
+    return calls.read().splitlines() if calls.exists() else []
+
+
+@pytest.fixture
+def fake_mplayer(tmpdir, monkeypatch):
+    bindir = tmpdir.mkdir('bin')
+    mplayer = bindir.join('mplayer')
+    mplayer.write(FAKE_MPLAYER)
+    mplayer.chmod(0o755)
+    monkeypatch.setenv('PATH', os.pathsep.join([str(bindir), os.environ.get('PATH', '')]))
+    return mplayer
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_prober_gives_the_same_results_as_mplayer(tmpdir, fake_mplayer):
+    movies = [write_bytes(tmpdir, 'movie%d.avi' % i,
+                          ('ID_VIDEO_FPS=%d.000\n' % (24 + i)).encode())
+              for i in range(6)]
+    noFps = write_bytes(tmpdir, 'nofps.avi', b'ID_VIDEO_WIDTH=640\n')
+
+    prober = FpsProber(limit=2)
+    prober.prefetch(movies + [noFps, movies[0]])
+    for i, movie in enumerate(movies):
+        info = prober.result(movie)
+        assert info.fps == 24 + i
+        assert info.videoPath == movie
+        assert vars(info) == vars(File.detectFpsFromMovie(movie))
+
+    info = prober.result(noFps, default=25)
+    assert info.fps == 25
+    assert info.videoPath is None
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_prober_detects_movies_which_werent_prefetched(tmpdir, fake_mplayer):
+    movie = write_bytes(tmpdir, 'movie.avi', b'ID_VIDEO_FPS=29.970\n')
+    subPath = write_bytes(tmpdir, 'movie.sub', b'{1}{2}Text\n')
+    assert File(subPath).detectFps(prober=FpsProber()).fps == 29.97
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_prober_kills_mplayer_after_timeout(tmpdir, fake_mplayer):
+    movie = write_bytes(tmpdir, 'slow.avi', b'SLOW\nID_VIDEO_FPS=30.000\n')
+    prober = FpsProber(timeout=0.2)
+    start = time.monotonic()
+    prober.prefetch([movie])
+    info = prober.result(movie, default=25)
+    assert time.monotonic() - start < 4
+    assert info.fps == 25
+    assert info.videoPath is None
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_closing_prober_stops_mplayer(tmpdir, fake_mplayer):
+    movie = write_bytes(tmpdir, 'movie.avi', b'ID_VIDEO_FPS=24.000\n')
+    slow = [write_bytes(tmpdir, 'slow%d.avi' % i, b'SLOW\nID_VIDEO_FPS=30.000\n')
+            for i in range(3)]
+    start = time.monotonic()
+    with FpsProber(limit=2) as prober:
+        prober.prefetch([movie] + slow)
+        assert prober.result(movie).fps == 24
+    assert time.monotonic() - start < 4
+    # the last movie was still waiting for MPlayer when prober was closed
+    assert slow[-1] not in mplayer_calls(fake_mplayer)
+    assert prober.result(movie).fps == 24
+
+
+def test_fps_is_read_from_movie_headers_without_mplayer(tmpdir, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmpdir.mkdir('empty')))
+    # AVI with 40000 microseconds per frame
+    movie = write_bytes(tmpdir, 'movie.avi', b'RIFF\x50\0\0\0AVI LIST\x44\0\0\0hdrl'
+                        b'avih\x38\0\0\0\x40\x9c\0\0' + b'\0' * 52)
+    subPath = write_bytes(tmpdir, 'movie.sub', b'{1}{2}Text\n')
+    info = File(subPath).detectFps(default=30)
+    assert info.fps == 25
+    assert info.videoPath == movie
+    assert FpsProber().result(movie).fps == 25
+
+
+def test_prober_without_mplayer(tmpdir, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmpdir.mkdir('empty')))
+    prober = FpsProber()
+    prober.prefetch(['movie.avi'])
+    info = prober.result('movie.avi', default=25)
+    assert info.fps == 25
+    assert info.videoPath is None
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_mplayer_isnt_run_without_movie(tmpdir, fake_mplayer):
+    subPath = write_bytes(tmpdir, 'movie.sub', b'{1}{2}Text\n')
+    info = File(subPath).detectFps(default=25)
+    assert info.fps == 25
+    assert info.videoPath is None
+
+    prober = FpsProber()
+    prober.prefetch([''])
+    assert File(subPath).detectFps(default=25, prober=prober).fps == 25
+    assert mplayer_calls(fake_mplayer) == []
+
+
+def test_prober_reads_movie_headers_once(tmpdir, monkeypatch):
+    movie = write_bytes(tmpdir, 'movie.avi', b'RIFF\x50\0\0\0AVI LIST\x44\0\0\0hdrl'
+                        b'avih\x38\0\0\0\x40\x9c\0\0' + b'\0' * 52)
+    probed = []
+    probeFps = SubFileModule.probeFps
+    monkeypatch.setattr(SubFileModule, 'probeFps',
+                        lambda path: probed.append(path) or probeFps(path))
+    prober = FpsProber()
+    prober.prefetch([movie, movie])
+    assert prober.result(movie).fps == 25
+    assert prober.result(movie).videoPath == movie
+    assert probed == [movie]
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_detected_fps_is_cached(tmpdir, fake_mplayer, fps_cache):
+    movie = write_bytes(tmpdir, 'movie.avi', b'ID_VIDEO_FPS=29.970\n')
+    first = File.detectFpsFromMovie(movie)
+    second = File.detectFpsFromMovie(movie)
+    assert vars(first) == vars(second)
+    assert second.fps == 29.97
+    assert mplayer_calls(fake_mplayer) == [movie]
+
+    # the cache is persistent
+    reloaded = FpsCache(fps_cache.path())
+    assert reloaded.get(movie) == 29.97
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_prober_doesnt_run_mplayer_for_cached_movies(tmpdir, fake_mplayer):
+    movies = [write_bytes(tmpdir, 'movie%d.avi' % i,
+                          ('ID_VIDEO_FPS=%d.000\n' % (24 + i)).encode())
+              for i in range(3)]
+    File.detectFpsFromMovie(movies[0])
+
+    prober = FpsProber()
+    prober.prefetch(movies)
+    assert [prober.result(movie).fps for movie in movies] == [24, 25, 26]
+    assert sorted(mplayer_calls(fake_mplayer)) == movies
+
+    prober = FpsProber()
+    prober.prefetch(movies)
+    assert [prober.result(movie).fps for movie in movies] == [24, 25, 26]
+    assert len(mplayer_calls(fake_mplayer)) == 3
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_fps_is_detected_again_for_modified_movie(tmpdir, fake_mplayer):
+    movie = write_bytes(tmpdir, 'movie.avi', b'ID_VIDEO_FPS=25.000\n')
+    assert File.detectFpsFromMovie(movie).fps == 25
+    write_bytes(tmpdir, 'movie.avi', b'ID_VIDEO_FPS=30.000\n')
+    os.utime(movie, ns=(0, 0))
+    assert File.detectFpsFromMovie(movie).fps == 30
+    assert len(mplayer_calls(fake_mplayer)) == 2
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake mplayer is a shell script')
+def test_undetected_fps_is_not_cached(tmpdir, fake_mplayer, fps_cache):
+    movie = write_bytes(tmpdir, 'nofps.avi', b'ID_VIDEO_WIDTH=640\n')
+    assert File.detectFpsFromMovie(movie, default=25).videoPath is None
+    assert File.detectFpsFromMovie(movie, default=25).videoPath is None
+    assert len(mplayer_calls(fake_mplayer)) == 2
+    assert fps_cache.get(movie) is None
+
+
+def test_fps_cache_evicts_least_recently_used_movies(tmpdir):
+    movies = [write_bytes(tmpdir, 'movie%d.avi' % i, b'') for i in range(3)]
+    cache = FpsCache(str(tmpdir.join('fpscache.json')), maxEntries=2)
+    cache.put(movies[0], 24)
+    cache.put(movies[1], 25)
+    cache.get(movies[0])
+    cache.put(movies[2], 26)
+    reloaded = FpsCache(cache.path())
+    assert [reloaded.get(movie) for movie in movies] == [None, 25, 26]
+
+
+def test_fps_cache_merges_entries_of_other_processes(tmpdir):
+    movies = [write_bytes(tmpdir, 'movie%d.avi' % i, b'') for i in range(2)]
+    path = str(tmpdir.join('fpscache.json'))
+    first, second = FpsCache(path), FpsCache(path)
+    assert first.get(movies[0]) is None
+    second.put(movies[1], 25)
+    first.put(movies[0], 24)
+    assert [FpsCache(path).get(movie) for movie in movies] == [24, 25]
+
+
+def test_fps_cache_ignores_broken_file(tmpdir):
+    movie = write_bytes(tmpdir, 'movie.avi', b'')
+    path = write_bytes(tmpdir, 'fpscache.json', b'{"broken": ')
+    cache = FpsCache(path)
+    assert cache.get(movie) is None
+    cache.put(movie, 25)
+    assert FpsCache(path).get(movie) == 25
+    assert cache.get('nonexistent.avi') is None
+
+
+def test_fps_cache_is_stored_next_to_settings():
+    settings = QSettings(QSettings.IniFormat, QSettings.UserScope, 'subconvert', 'subconvert')
+    assert os.path.dirname(FpsCache().path()) == os.path.dirname(settings.fileName())
@@ -20,7 +20,8 @@ along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import unittest
-from subconvert.parsing.Core import SubManager, Subtitle
+from subconvert.parsing.Core import SubManager, ColumnarSubManager, Subtitle
+from subconvert.utils.SubException import SubException
 from tests.Mocks import *
 from subconvert.parsing.FrameTime import FrameTime
 
@@ -144,3 +145,296 @@ class TestSubManager(unittest.TestCase):
 
         self.assertIsNotNone(self.subWithNoEnd.end)
         self.assertIsNotNone(nextSub.end)
+
+    def test_viewDoesntCloneSubtitles(self):
+        self.addSubtitles(3)
+        view = self.m.view()
+        self.assertEqual(3, len(view))
+        self.assertIs(self.m._subs[1], view[1]._sub)
+        self.assertIs(self.m._subs[2], list(view)[-1]._sub)
+        self.assertEqual("Subtitle{gsp_nl}2", view[1].text)
+
+    def test_viewRejectsChanges(self):
+        self.addSubtitles(2)
+        clone = self.m.clone()
+        sub = self.m.view()[0]
+        with self.assertRaises(TypeError):
+            sub.change(text = "Changed")
+        with self.assertRaises(AttributeError):
+            sub.fps = 20
+        sub.start.fps = 20
+        self.assertEqual(10, self.m[0].start.fps)
+        self.assertEqual(10, clone[0].start.fps)
+        self.assertEqual(["Subtitle{gsp_nl}1", "Subtitle{gsp_nl}2"],
+            [sub.text for sub in clone])
+
+    def test_viewReflectsChanges(self):
+        self.addSubtitles(2)
+        view = self.m.view()
+        self.m.changeSubText(0, "Changed")
+        self.m.remove(1)
+        self.assertEqual(["Changed"], [sub.text for sub in view])
+
+    def test_offsetsAndFpsChangesAreComposed(self):
+        self.m.append(Subtitle(FrameTime(25, frames=25), FrameTime(25, seconds=2), "Text"))
+        self.m.changeFps(50)
+        self.m.offset(FrameTime(50, seconds=1))
+        self.m.offset(FrameTime(50, seconds=-0.5))
+        self.m.changeFps(10)
+        self.assertEqual(10, self.m.fps)
+        self.assertEqual(FrameTime(10, seconds=1), self.m[0].start)
+        self.assertEqual(FrameTime(10, seconds=2.5), self.m[0].end)
+
+    def test_offsetIsAppliedWhenSubtitlesAreAccessed(self):
+        self.addSubtitles(2)
+        sub = self.m.view()[1]
+        self.m.offset(FrameTime(10, seconds=3))
+        self.assertEqual(FrameTime(10, seconds=1), sub.start)
+        self.assertEqual(FrameTime(10, seconds=4), self.m[1].start)
+        self.assertEqual(FrameTime(10, seconds=4), sub.start)
+
+    def test_offsetIsntAppliedToAppendedSubtitles(self):
+        self.addSubtitles(1)
+        self.m.offset(FrameTime(10, seconds=3))
+        self.m.append(SubtitleMock(FrameTime(10, seconds=1), FrameTime(10, seconds=2), "New"))
+        self.assertEqual([3000, 1000], list(self.m.times()[0]))
+
+    def test_clearDiscardsOffset(self):
+        self.addSubtitles(1)
+        self.m.offset(FrameTime(10, seconds=3))
+        self.m.clear()
+        self.addSubtitles(1)
+        self.assertEqual(FrameTime(10, seconds=0), self.m[0].start)
+
+    def test_cloneIsIndependent(self):
+        for i in range(2):
+            self.m.append(Subtitle(FrameTime(10, seconds=i), FrameTime(10, seconds=i), str(i)))
+        other = self.m.clone()
+        other.changeSubText(0, "Changed")
+        other.offset(FrameTime(10, seconds=1))
+        self.m.changeSubStart(1, FrameTime(10, seconds=5))
+        self.m.append(Subtitle(FrameTime(10, seconds=6), FrameTime(10, seconds=7), "New"))
+        self.assertEqual(["0", "1", "New"], [sub.text for sub in self.m])
+        self.assertEqual([0, 5000, 6000], list(self.m.times()[0]))
+        self.assertEqual(["Changed", "1"], [sub.text for sub in other])
+        self.assertEqual([1000, 2000], list(other.times()[0]))
+
+    def test_storagePartsAreKeptUntilChange(self):
+        for i in range(2):
+            self.m.append(Subtitle(FrameTime(10, seconds=i), FrameTime(10, seconds=i), str(i)))
+        parts = self.m.storageParts()
+        other = self.m.clone()
+        self.assertIs(parts, self.m.storageParts())
+        self.assertIs(parts, other.storageParts())
+        self.assertEqual(set(id(part) for part in parts), self.m.storagePartIds())
+
+        other.changeSubText(0, "Changed")
+        self.assertIs(parts, self.m.storageParts())
+        self.assertIsNot(parts, other.storageParts())
+        self.assertEqual(set(id(part) for part in other.storageParts()), other.storagePartIds())
+        self.assertIs(parts[2], other.storageParts()[2])
+
+        self.m.append(Subtitle(FrameTime(10, seconds=3), FrameTime(10, seconds=4), "New"))
+        self.assertEqual(4, len(self.m.storageParts()))
+
+    def test_popFrontDoesntChangeClones(self):
+        for i in range(3):
+            self.m.append(Subtitle(FrameTime(10, seconds=i), None, str(i)))
+        other = self.m.clone()
+        popped = self.m.popFront(2)
+        self.assertEqual(["0", "1"], [sub.text for sub in popped])
+        self.assertEqual(["2"], [sub.text for sub in self.m])
+        self.assertTrue(self.m.hasPendingEnd())
+
+        popped[0].change(text = "Changed")
+        self.assertEqual(["0", "1", "2"], [sub.text for sub in other])
+
+        self.m.popFront(1)
+        self.assertEqual(0, self.m.size())
+        self.assertFalse(self.m.hasPendingEnd())
+
+    def test_restoreTimes(self):
+        self.m.append(SubtitleMock(FrameTime(10, frames=10), FrameTime(10, seconds=2), "Text"))
+        self.assertFalse(self.m.timesInMs())
+        state = self.m.timesState()
+        self.m.offset(FrameTime(10, seconds=1))
+        self.assertTrue(self.m.timesInMs())
+        self.m.restoreTimes(state)
+        self.assertEqual(10, self.m[0].start.frame)
+        self.assertEqual(FrameTime(10, seconds=2), self.m[0].end)
+        self.m.changeFps(20)
+        self.assertEqual(10, self.m[0].start.frame)
+
+
+class TestColumnarSubManager(unittest.TestCase):
+    """ColumnarSubManager test suite."""
+
+    def setUp(self):
+        self.m = ColumnarSubManager()
+
+    def createSubtitle(self, start, end, text="Subtitle", fps=25):
+        end = FrameTime(fps, seconds=end) if end is not None else None
+        return Subtitle(FrameTime(fps, seconds=start), end, text)
+
+    def addSubtitles(self, no):
+        for i in range(no):
+            self.m.append(self.createSubtitle(i, i + 0.5, "Subtitle %d" % (i + 1)))
+
+    def test_fromSubtitlesKeepsAllData(self):
+        subs = SubManager()
+        subs.header().add('title', 'Title')
+        subs.append(Subtitle(FrameTime(25, frames=10), FrameTime(25, frames=20), "Frames"))
+        subs.append(self.createSubtitle(1, 2, "Seconds"))
+        subs.append(self.createSubtitle(3, None, "No end"))
+
+        columnar = ColumnarSubManager.fromSubtitles(subs)
+        self.assertEqual(3, columnar.size())
+        self.assertEqual('Title', columnar.header().get('title'))
+        self.assertEqual(25, columnar.fps)
+        for expected, sub in zip(subs, columnar):
+            self.assertEqual(expected.start, sub.start)
+            self.assertEqual(expected.end, sub.end)
+            self.assertEqual(expected.text, sub.text)
+
+        # last subtitle's end should still be changed when a new one is appended
+        columnar.append(self.createSubtitle(4, 5))
+        self.assertEqual(FrameTime(25, seconds=3.85), columnar[2].end)
+
+    def test_subtitlesAreCreatedOnEachAccess(self):
+        self.addSubtitles(1)
+        self.m[0].change(text="Changed")
+        self.assertEqual("Subtitle 1", self.m[0].text)
+
+    def test_appendSetsEndTimes(self):
+        self.m.append(self.createSubtitle(0, None))
+        self.assertEqual(FrameTime(25, seconds=2.5), self.m[0].end)
+        self.m.append(self.createSubtitle(1, None))
+        self.assertEqual(FrameTime(25, seconds=0.85), self.m[0].end)
+        self.assertEqual(FrameTime(25, seconds=3.5), self.m[1].end)
+
+    def test_appendRejectsDifferentFps(self):
+        self.addSubtitles(1)
+        with self.assertRaises(ValueError):
+            self.m.append(self.createSubtitle(1, 2, fps=30))
+
+    def test_insertAndRemove(self):
+        self.addSubtitles(3)
+        self.m.insert(1, self.createSubtitle(0.5, 0.7, "Inserted"))
+        self.assertEqual(["Subtitle 1", "Inserted", "Subtitle 2", "Subtitle 3"],
+                         [sub.text for sub in self.m])
+        self.m.remove(0)
+        self.m.remove(-1)
+        self.assertEqual(["Inserted", "Subtitle 2"], [sub.text for sub in self.m])
+
+    def test_changeFpsKeepsOrigins(self):
+        self.m.append(Subtitle(FrameTime(25, frames=25), FrameTime(25, seconds=2), "Text"))
+        self.m.changeFps(50)
+        self.assertEqual(50, self.m.fps)
+        self.assertEqual(25, self.m[0].start.frame)
+        self.assertEqual(100, self.m[0].end.frame)
+
+    def test_offset(self):
+        self.m.append(Subtitle(FrameTime(25, frames=25), FrameTime(25, seconds=2), "Text"))
+        self.m.offset(FrameTime(25, seconds=-0.5))
+        self.assertEqual(FrameTime(25, seconds=0.5), self.m[0].start)
+        self.assertEqual(FrameTime(25, seconds=1.5), self.m[0].end)
+
+    def test_offsetsAreComposed(self):
+        self.m.append(Subtitle(FrameTime(25, frames=25), FrameTime(25, seconds=2), "Text"))
+        self.m.offset(FrameTime(25, seconds=1))
+        self.m.offset(FrameTime(25, seconds=-0.25))
+        self.m.changeFps(50)
+        self.m.offset(FrameTime(50, seconds=0.5))
+        self.assertEqual(FrameTime(50, seconds=2.25), self.m[0].start)
+        self.assertEqual(FrameTime(50, seconds=3.25), self.m[0].end)
+        self.assertEqual(self.m.clone(), self.m)
+
+    def test_changeSubTimes(self):
+        self.addSubtitles(2)
+        self.m.changeSubStart(1, FrameTime(25, seconds=10))
+        self.m.changeSubEnd(1, FrameTime(25, seconds=11))
+        self.m.changeSubText(1, "Changed")
+        self.assertEqual(FrameTime(25, seconds=10), self.m[1].start)
+        self.assertEqual(FrameTime(25, seconds=11), self.m[1].end)
+        self.assertEqual("Changed", self.m[1].text)
+        with self.assertRaises(ValueError):
+            self.m.changeSubStart(1, FrameTime(30, seconds=10))
+
+    def test_changeTimes(self):
+        self.addSubtitles(2)
+        starts, ends = self.m.times()
+        self.assertEqual([0, 1000], list(starts))
+        self.assertEqual([500, 1500], list(ends))
+        self.m.changeTimes([100, 200], [300, 400])
+        self.assertEqual(FrameTime(25, seconds=0.2), self.m[1].start)
+        self.assertEqual(FrameTime(25, seconds=0.4), self.m[1].end)
+
+    def test_restoreTimes(self):
+        self.m.append(Subtitle(FrameTime(25, frames=25), FrameTime(25, seconds=2), "Text"))
+        self.assertFalse(self.m.timesInMs())
+        state = self.m.timesState()
+        self.m.offset(FrameTime(25, seconds=1))
+        self.assertTrue(self.m.timesInMs())
+        self.m.restoreTimes(state)
+        self.m.changeSubStart(0, FrameTime(25, seconds=0))
+        self.m.restoreTimes(state)
+        self.assertEqual(25, self.m[0].start.frame)
+        self.assertEqual(FrameTime(25, seconds=2), self.m[0].end)
+        with self.assertRaises(SubException):
+            self.m.restoreTimes(ColumnarSubManager().timesState())
+
+    def test_cloneIsIndependent(self):
+        self.addSubtitles(2)
+        other = self.m.clone()
+        other.changeSubText(0, "Changed")
+        other.offset(FrameTime(25, seconds=1))
+        self.assertEqual("Subtitle 1", self.m[0].text)
+        self.assertEqual(FrameTime(25, seconds=0), self.m[0].start)
+        self.assertNotEqual(self.m, other)
+        self.assertEqual(self.m, self.m.clone())
+
+    def test_cloneIsIndependentFromChangedOriginal(self):
+        self.addSubtitles(2)
+        other = self.m.clone()
+        self.m.changeSubEnd(1, FrameTime(25, seconds=10))
+        self.m.remove(0)
+        self.m.changeFps(50)
+        self.assertEqual(2, other.size())
+        self.assertEqual(25, other.fps)
+        self.assertEqual(FrameTime(25, seconds=1.5), other[1].end)
+
+    def test_comparisonWithSubManager(self):
+        self.addSubtitles(2)
+        subs = SubManager()
+        for sub in self.m:
+            subs.append(sub)
+        self.assertTrue(self.m == subs)
+        self.assertTrue(subs == self.m)
+        self.assertFalse(self.m != subs)
+        self.assertFalse(subs != self.m)
+
+        subs.changeSubText(0, "Changed")
+        self.assertTrue(self.m != subs)
+        self.assertTrue(subs != self.m)
+        self.assertFalse(self.m == subs)
+        self.assertFalse(subs == self.m)
+        self.assertFalse(self.m == "Subtitle 1")
+        with self.assertRaises(TypeError):
+            subs < self.m
+
+    def test_popFront(self):
+        self.addSubtitles(3)
+        other = self.m.clone()
+        popped = self.m.popFront(2)
+        self.assertEqual(["Subtitle 1", "Subtitle 2"], [sub.text for sub in popped])
+        self.assertEqual(["Subtitle 3"], [sub.text for sub in self.m])
+        self.assertEqual(FrameTime(25, seconds=2), self.m[0].start)
+        self.assertEqual(3, other.size())
+
+    def test_view(self):
+        self.addSubtitles(2)
+        view = self.m.view()
+        self.m.changeSubText(0, "Changed")
+        self.assertEqual(2, len(view))
+        self.assertEqual(["Changed", "Subtitle 2"], [sub.text for sub in view])
+        self.assertEqual(FrameTime(25, seconds=1), view[-1].start)
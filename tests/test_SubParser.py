@@ -19,8 +19,10 @@ You should have received a copy of the GNU General Public License
 along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
 import unittest
-from subconvert.parsing.Core import SubParser, SubParsingError
+from subconvert.parsing.Core import SubParser, SubParsingError, Header, Subtitle
+from subconvert.parsing.Core import RawSubManager
 from subconvert.parsing.FrameTime import FrameTime
 from subconvert.parsing.Formats import *
 
@@ -79,3 +81,78 @@ class TestSubParser(unittest.TestCase):
     def test_parseSubWithoutHeaderDoesntFillInHeader(self):
         result = self.p.parse(self.subWithoutHeader)
         self.assertTrue(result.header().empty())
+
+    def test_parseReadsContentOnlyOnce(self):
+        result = self.p.parse(iter(self.subWithHeader))
+        self.assertEqual("First subtitle", result[0].text)
+        self.assertEqual(SubViewer, self.p.parsedFormat())
+
+        result = self.p.parse(iter(self.subWithoutHeader))
+        self.assertEqual("First subtitle", result[0].text)
+        self.assertEqual(SubRip, self.p.parsedFormat())
+
+    def test_parseRaisesErrorWithLineNumberOfIncorrectSubtitle(self):
+        content = self.subWithoutHeader + ["\n", "garbage\n", "\n"]
+        with self.assertRaises(SubParsingError) as cm:
+            self.p.parse(content)
+        self.assertEqual(10, cm.exception.lineNo)
+
+    def test_iterparseYieldsHeaderAndSubtitles(self):
+        result = list(self.p.iterparse(io.StringIO(''.join(self.subWithHeader))))
+        self.assertEqual(3, len(result))
+        self.assertIsInstance(result[0], Header)
+        self.assertEqual("Tahoma", result[0].get("font"))
+        self.assertIsInstance(result[1], Subtitle)
+        self.assertEqual("First subtitle", result[1].text)
+        self.assertEqual("Second{gsp_nl}subtitle", result[2].text)
+        self.assertEqual(SubViewer, self.p.parsedFormat())
+
+    def test_iterparseGivesTheSameSubtitlesAsParse(self):
+        subs = self.p.parse(self.subWithoutHeader)
+        result = list(self.p.iterparse(io.StringIO(''.join(self.subWithoutHeader))))
+        self.assertEqual(len(subs), len(result) - 1)
+        for sub, streamed in zip(subs, result[1:]):
+            self.assertEqual(sub.start, streamed.start)
+            self.assertEqual(sub.end, streamed.end)
+            self.assertEqual(sub.text, streamed.text)
+
+    def test_iterparseRaisesErrorForUnknownFormat(self):
+        with self.assertRaises(SubParsingError):
+            list(self.p.iterparse(io.StringIO("Not a subtitle\n")))
+
+    def test_parseRawKeepsOriginalTexts(self):
+        content = self.subWithoutHeader[:-1] + ["<i>subtitle</i>\n"]
+        result = self.p.parseRaw(content)
+        self.assertIsInstance(result, RawSubManager)
+        self.assertEqual(SubRip, result.inputFormat())
+        self.assertEqual(SubRip, self.p.parsedFormat())
+        self.assertEqual("First subtitle\n\n", result[0].text)
+        self.assertEqual("Second\n<i>subtitle</i>\n", result[1].text)
+
+    def test_parseRawGivesTheSameTimesAsParse(self):
+        subs = self.p.parse(self.subWithoutHeader)
+        result = self.p.parseRaw(self.subWithoutHeader)
+        self.assertEqual(len(subs), len(result))
+        for sub, raw in zip(subs, result):
+            self.assertEqual(sub.start, raw.start)
+            self.assertEqual(sub.end, raw.end)
+
+    def test_parseRawDoesntSupportFormatsWithHeader(self):
+        with self.assertRaises(SubParsingError):
+            self.p.parseRaw(self.subWithHeader)
+
+    def test_rawFormat(self):
+        self.p.registerFormat(MicroDVD)
+        self.assertEqual(SubRip, self.p.rawFormat(self.subWithoutHeader))
+        self.assertEqual(SubRip, self.p.rawFormat(''.join(self.subWithoutHeader)))
+        self.assertIsNone(self.p.rawFormat(self.subWithHeader))
+        self.assertIsNone(self.p.rawFormat("Not a subtitle\n"))
+        # SubRip and MicroDVD are equally probable
+        content = self.subWithoutHeader + ["{1}{2}Third\n", "{3}{4}Fourth\n"]
+        self.assertIsNone(self.p.rawFormat(content))
+
+    def test_parseRawRaisesErrorForIncorrectSubtitle(self):
+        content = self.subWithoutHeader + ["\n", "garbage\n", "\n"]
+        with self.assertRaises(SubParsingError) as cm:
+            self.p.parseRaw(content)
+        self.assertEqual(10, cm.exception.lineNo)
@@ -0,0 +1,248 @@
+#-*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2016 Michal Goral.
+
+This file is part of Subconvert
+
+Subconvert is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Subconvert is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import pickle
+
+import pytest
+
+from subconvert.gui.DataModel import DataController
+from subconvert.gui.SubtitleCommands import Snapshot, ChangeData, CreateSubtitlesFromData, \
+    OffsetSubtitles
+from subconvert.parsing.Core import SubParser, ColumnarSubManager, Subtitle
+from subconvert.parsing.Formats import SubRip
+from subconvert.parsing.FrameTime import FrameTime
+from subconvert.utils.SubtitleData import SubtitleData
+
+PATH = 'subtitles.srt'
+
+
+def make_data(count=2000):
+    subs = ColumnarSubManager()
+    for i in range(count):
+        subs.append(Subtitle(FrameTime(25, frames=50 * i), FrameTime(25, frames=50 * i + 40),
+                             'Subtitle number %d{gsp_nl}with a second line' % i))
+    data = SubtitleData()
+    data.subtitles = subs
+    data.fps = 25.0
+    data.outputFormat = SubRip
+    data.inputEncoding = 'utf-8'
+    data.outputEncoding = 'utf-8'
+    return data
+
+
+@pytest.fixture
+def controller():
+    controller = DataController(SubParser())
+    controller.execute(CreateSubtitlesFromData(PATH, make_data()))
+    return controller
+
+
+def change_encoding(controller, encoding):
+    data = controller.data(PATH)
+    data.outputEncoding = encoding
+    controller.execute(ChangeData(PATH, data))
+
+
+def change_text(controller, text):
+    data = controller.data(PATH)
+    data.subtitles.changeSubText(0, text)
+    controller.execute(ChangeData(PATH, data))
+
+
+def texts(controller):
+    return [sub.text for sub in controller.subtitles(PATH)]
+
+
+def test_subtitles_shared_with_live_data_arent_counted(controller):
+    change_encoding(controller, 'windows-1250')
+    dataSize = Snapshot(controller.data(PATH)).size()
+    assert controller.historyMemoryUsage(PATH) < dataSize / 100
+
+
+def test_subtitles_kept_by_many_commands_are_counted_once(controller):
+    originalTexts = controller._storage[PATH].subtitles.storageParts()[-1]
+    textsSize = len(pickle.dumps(originalTexts, pickle.HIGHEST_PROTOCOL))
+
+    # original texts are now kept by old and new data of the first command and by old data of
+    # the second one
+    change_encoding(controller, 'windows-1250')
+    change_text(controller, 'Changed')
+    assert textsSize < controller.historyMemoryUsage(PATH) < textsSize + 10000
+
+
+def test_compression_doesnt_copy_shared_subtitles(controller):
+    change_encoding(controller, 'windows-1250')
+    change_text(controller, 'Changed')
+    history = controller.history(PATH)
+    live = controller._storage[PATH]
+    liveColumns = live.subtitles.storageParts()
+
+    usage = history.memoryUsage()
+    assert history.shrink(usage, discard=False) > 0
+    assert history.memoryUsage() < usage
+
+    # times are shared with live data and texts with old data of the second command
+    oldData = history.command(0)._oldData
+    assert oldData.get() is not oldData.get()
+    for column, liveColumn in zip(oldData.get().subtitles.storageParts()[:-1], liveColumns):
+        assert column is liveColumn
+    assert oldData.get().subtitles.storageParts()[-1] is \
+        history.command(1)._oldData.get().subtitles.storageParts()[-1]
+
+    history.undo()
+    history.undo()
+    assert controller.data(PATH).outputEncoding == 'utf-8'
+    assert texts(controller) == [sub.text for sub in make_data().subtitles]
+
+
+def test_snapshot_compress_round_trip():
+    data = make_data()
+    snapshot = Snapshot(data)
+    size = snapshot.size()
+    assert snapshot.compress() > 0
+    assert snapshot.size() < size
+
+    restored = snapshot.get()
+    assert restored is not data
+    assert restored is not snapshot.get()
+    assert restored.subtitles == data.subtitles
+    assert restored.outputEncoding == data.outputEncoding
+    assert restored.outputFormat is data.outputFormat
+
+    snapshot.discard()
+    assert snapshot.size() == 0
+
+
+def change_texts(controller, count):
+    for i in range(count):
+        change_text(controller, 'Version %d' % (i + 1))
+
+
+def undo_all(history):
+    firstTexts = []
+    while history.canUndo():
+        history.undo()
+        firstTexts.append(texts(history.parent())[0])
+    return firstTexts
+
+
+def test_shrink_compresses_before_discarding(controller):
+    change_texts(controller, 3)
+    history = controller.history(PATH)
+    usage = history.memoryUsage()
+
+    freed = history.shrink(1)
+    assert freed > 0
+    # sizes are approximate
+    assert abs(history.memoryUsage() - (usage - freed)) < 100
+    assert history.count() == 3
+    assert undo_all(history) == ['Version 2', 'Version 1', 'Subtitle number 0{gsp_nl}with a '
+                                 'second line']
+
+
+def test_oldest_commands_are_removed(controller):
+    change_texts(controller, 3)
+    history = controller.history(PATH)
+    history.shrink(history.memoryUsage(), discard=False)
+    oldest = history.command(0)
+
+    # everything is already compressed, so the oldest command must be removed
+    assert history.shrink(1) > 0
+    assert history.count() == 2
+    assert history.index() == 2
+    assert oldest.snapshots()[0].size() == 0
+    assert undo_all(history) == ['Version 2', 'Version 1']
+
+    # redo of the remaining commands still works
+    while history.canRedo():
+        history.redo()
+    assert texts(controller)[0] == 'Version 3'
+
+
+def test_commands_without_data_arent_removed(controller):
+    # the first offset keeps times in frames for undo, the second one is only undone with an
+    # opposite offset
+    offset = FrameTime(25, frames=10)
+    controller.execute(OffsetSubtitles(PATH, offset))
+    controller.execute(OffsetSubtitles(PATH, offset))
+    history = controller.history(PATH)
+    history.shrink(history.memoryUsage(), discard=False)
+    assert history.command(1).memoryUsage() == 0
+
+    assert history.shrink(history.memoryUsage() + 1) > 0
+    assert history.count() == 1
+    history.undo()
+    assert not history.canUndo()
+    assert controller.subtitles(PATH)[1].start == FrameTime(25, frames=60)
+
+
+def test_undo_position_is_kept_when_commands_are_removed(controller):
+    change_texts(controller, 3)
+    history = controller.history(PATH)
+    history.undo()
+    history.shrink(history.memoryUsage(), discard=False)
+
+    history.shrink(1)
+    assert history.count() == 2
+    assert history.index() == 1
+    history.redo()
+    assert texts(controller)[0] == 'Version 3'
+
+
+def test_history_memory_limit(controller):
+    change_texts(controller, 5)
+    usage = controller.historyMemoryUsage(PATH)
+    controller.setHistoryMemoryLimits(usage // 10, None)
+    assert controller.historyMemoryUsage(PATH) <= usage // 10
+
+    change_text(controller, 'Version 6')
+    assert controller.historyMemoryUsage(PATH) <= usage // 10
+    assert texts(controller)[0] == 'Version 6'
+    assert controller.history(PATH).undoText() == 'Subtitle data change'
+
+
+def test_clean_state_is_reset_when_its_command_is_removed(controller):
+    controller.setCleanState(PATH)
+    change_texts(controller, 2)
+    history = controller.history(PATH)
+    history.shrink(history.memoryUsage(), discard=False)
+
+    history.shrink(1)
+    assert history.count() == 1
+    assert history.cleanIndex() == -1
+    assert not controller.isCleanState(PATH)
+    history.undo()
+    assert not controller.isCleanState(PATH)
+
+
+def test_clean_state_is_kept_after_removed_commands(controller):
+    change_text(controller, 'Version 1')
+    controller.setCleanState(PATH)
+    change_text(controller, 'Version 2')
+    history = controller.history(PATH)
+    history.shrink(history.memoryUsage(), discard=False)
+
+    history.shrink(1)
+    assert history.count() == 1
+    assert history.cleanIndex() == 0
+    history.undo()
+    assert controller.isCleanState(PATH)
+    assert texts(controller)[0] == 'Version 1'
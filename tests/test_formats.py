@@ -25,7 +25,8 @@ import json
 import pytest
 
 from subconvert.utils.SubFile import File
-from subconvert.parsing.Core import SubParser, Subtitle
+from subconvert.parsing.Core import SubParser, SubParsingError, Subtitle
+from subconvert.parsing.Core import FormatRegistry, formatRegistry
 from subconvert.parsing.FrameTime import FrameTime 
 from subconvert.parsing.Formats import MicroDVD, SubRip, SubViewer, TMP, MPL2
 
@@ -91,3 +92,214 @@ def test_correct_subs(parser, params):
     if descr.get('header') is not None:
         for key in descr['header']:
             subs.header().get(key) == descr['header'][key]
+
+
+@pytest.mark.parametrize('params', gen_params())
+def test_sniff_correct_subs(parser, params):
+    contents, descr = params
+
+    guesses = parser.sniff(''.join(contents))
+    fmt, confidence = guesses[0]
+
+    assert fmt.NAME == descr['format']
+    assert confidence > 0.5
+    assert len(guesses) == len(parser.formats)
+
+    parser.parse(contents)
+    assert parser.parsedConfidence() == confidence
+
+
+def test_sniff_unknown_text(parser):
+    guesses = parser.sniff('Not a subtitle\n')
+    assert all(confidence == 0 for fmt, confidence in guesses)
+
+
+@pytest.mark.parametrize('fmt', [MicroDVD, MPL2, TMP])
+def test_parse_buffer_gives_the_same_subs(parser, fmt):
+    sub_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'subs',
+                            '%s-1.txt' % fmt.OPT)
+    contents = File(sub_name).read()
+    expected = parser.parse(iter(contents)) # iterators are parsed line by line
+    result = list(fmt().parseBuffer(25, ''.join(contents)))
+
+    assert len(expected) == len([sub for offset, sub in result if sub.text])
+    for sub, (offset, check) in zip(expected, result):
+        assert sub.start == check.start
+        assert sub.text == check.text
+
+
+@pytest.mark.parametrize('fmt', [MicroDVD, MPL2, TMP])
+def test_parse_doesnt_fall_back_to_line_loop(parser, fmt, monkeypatch):
+    sub_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'subs',
+                            '%s-1.txt' % fmt.OPT)
+    contents = File(sub_name).read()
+    expected = list(parser.iterparse(iter(contents)))[1:] # iterparse feeds lines one by one
+
+    def createSubtitle(self, fps, section):
+        raise AssertionError('%s parsed line by line' % self.NAME)
+
+    monkeypatch.setattr(fmt, 'createSubtitle', createSubtitle)
+    result = parser.parse(contents)
+    assert parser.parsedFormat() is fmt
+    assert [(sub.start, sub.end, sub.text) for sub in result] == \
+        [(sub.start, sub.end, sub.text) for sub in expected]
+
+
+def test_wrongly_sniffed_format_isnt_parsed_line_by_line(parser, monkeypatch):
+    # MicroDVD is judged first, as it's as probable as SubRip
+    contents = '1\n00:00:01,000 --> 00:00:02,000\n{1}{2}Hello\n'
+    assert parser.sniff(contents)[0][0] is MicroDVD
+
+    def createSubtitle(self, fps, section):
+        raise AssertionError('%s parsed line by line' % self.NAME)
+
+    monkeypatch.setattr(MicroDVD, 'createSubtitle', createSubtitle)
+    parser.parse(contents)
+    assert parser.parsedFormat() is SubRip
+
+
+def test_parse_buffer_reports_first_mismatched_line():
+    buffer = '{1}{2}First\n\n{3}{4}Second\nSomething else\n{5}{6}Third\n'
+    with pytest.raises(SubParsingError) as excinfo:
+        list(MicroDVD().parseBuffer(25, buffer))
+    assert excinfo.value.lineNo == 3
+
+
+def render_with_template(fmt, subNo, sub):
+    try:
+        text = sub.text.format(**fmt.formatting)
+    except KeyError:
+        text = sub.text
+    return fmt.subFormatTemplate.format(gsp_no=subNo,
+        gsp_from=fmt.convertTime(sub.start, 'time_from'),
+        gsp_to=fmt.convertTime(sub.end, 'time_to'),
+        gsp_text=text.strip())
+
+
+@pytest.mark.parametrize('fmt', [MicroDVD, SubRip, SubViewer, TMP, MPL2])
+@pytest.mark.parametrize('text', ['Text', ' {gsp_b_}Bold{_gsp_b}{gsp_nl}100% ',
+                                  '{{braces}}', '{unknown}'])
+def test_renderer_gives_the_same_output_as_template(fmt, text):
+    fmt = fmt()
+    sub = Subtitle(FrameTime(25, time='1:02:03.456'), FrameTime(25, frames=100000), text)
+    assert fmt.renderer()(7, sub) == render_with_template(fmt, 7, sub)
+
+
+def test_renderer_with_custom_template():
+    class Custom(SubRip):
+        def __init__(self):
+            super().__init__()
+            self._subFormat = '{gsp_text} ({gsp_to}-{gsp_from}) {gsp_no:>3}\n'
+
+    fmt = Custom()
+    sub = Subtitle(FrameTime(25, seconds=1), FrameTime(25, seconds=2), 'Text')
+    assert fmt.renderer()(7, sub) == 'Text (00:00:02,000-00:00:01,000)   7\n'
+
+
+@pytest.mark.parametrize('fmt', [MicroDVD, SubRip, SubViewer, TMP, MPL2])
+def test_renderer_formats_times_with_time_template(fmt, monkeypatch):
+    fmt = fmt()
+    sub = Subtitle(FrameTime(23.976, time='1:02:03.456'), FrameTime(23.976, frames=100001), 'Text')
+    expected = render_with_template(fmt, 7, sub)
+
+    def convertTime(frametime, which):
+        raise AssertionError('convertTime() called by a compiled renderer')
+
+    monkeypatch.setattr(fmt, 'convertTime', convertTime)
+    assert fmt.TIME_TEMPLATE is not None
+    assert fmt.renderer()(7, sub) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    (' <b>Bold</b> {x} ', '{gsp_b_}Bold{_gsp_b} {{x}}'),
+    ('<i>a\r\nb</i>\nc', '{gsp_i_}a{gsp_nl}b{_gsp_i}\nc'),
+    ('a\rb', 'a{gsp_nl}b'),
+    ('</u><u>', '{_gsp_u}{gsp_u_}'),
+])
+def test_format_sub(text, expected):
+    fmt = SubRip()
+    assert fmt.formatSub(text) == expected
+    assert fmt.formatSub(text) == expected # cached replacements
+
+
+def test_format_sub_with_custom_newline():
+    fmt = TMP()
+    assert fmt.formatSub('{a}|b|\n') == '{{a}}{gsp_nl}b{gsp_nl}'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{y:i}First|Second', '{gsp_i_}First{_gsp_i}{gsp_nl}Second'),
+    ('{y:u}{y:b}Both', '{gsp_u_}{gsp_b_}Both{_gsp_b}{_gsp_u}'),
+    ('{x}|{Y:b}', '{{x}}{gsp_nl}{{Y:b}}'),
+])
+def test_format_micro_dvd_sub(text, expected):
+    assert MicroDVD().formatSub(text) == expected
+
+
+@pytest.mark.parametrize('fmt', [MicroDVD, MPL2, TMP])
+def test_parse_raw_buffer_gives_the_same_times(fmt):
+    sub_name = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'subs',
+                            '%s-1.txt' % fmt.OPT)
+    buffer = ''.join(File(sub_name).read())
+    expected = list(fmt().parseBuffer(25, buffer))
+    result = list(fmt().parseRawBuffer(25, buffer))
+
+    assert len(expected) == len(result)
+    for (offset, sub), (rawOffset, start, end, text) in zip(expected, result):
+        assert offset == rawOffset
+        assert sub.start == start
+        assert sub.end == end
+
+
+@pytest.mark.parametrize('text, fmt, expected', [
+    ('First|second', MPL2, 'First{nl}second'),
+    (' First|second ', SubRip, 'First{nl}second'),
+    ('{y:i}Italic', MPL2, None),
+    ('{braces}', MicroDVD, None),
+])
+def test_text_converter(text, fmt, expected):
+    if expected is not None:
+        expected = expected.format(nl=fmt().formatting['gsp_nl'])
+    assert MicroDVD().textConverter(fmt)(text) == expected
+
+
+def test_text_converter_doesnt_convert_tags():
+    assert SubRip().textConverter(MicroDVD)('<i>Italic</i>') is None
+    assert SubRip().textConverter(MicroDVD)('Line\nanother') == 'Line|another'
+
+
+def test_format_registry_shares_instances():
+    registry = FormatRegistry()
+    assert registry.register(SubRip) is SubRip
+    fmt = registry.instance(SubRip)
+    assert isinstance(fmt, SubRip)
+    assert registry.instance(SubRip) is fmt
+    assert registry.instance(MicroDVD) is not fmt
+    assert registry.formats() == [SubRip, MicroDVD]
+
+
+def test_shared_format_parses_subsequent_files(parser):
+    first = parser.parse('{1}{2}First\n')
+    second = parser.parse('{3}{4}Second\n')
+    assert formatRegistry.instance(MicroDVD) is formatRegistry.instance(MicroDVD)
+    assert [sub.text for sub in first] == ['First']
+    assert [sub.text for sub in second] == ['Second']
+
+
+def test_sniff_tie_is_parsed_with_low_confidence(parser):
+    # MicroDVD-like text line of SubRip subtitle makes both formats equally probable
+    contents = '1\n00:00:01,000 --> 00:00:02,000\n{1}{2}Hello\n'
+    guesses = parser.sniff(contents)
+    assert guesses[0][1] == guesses[1][1] == 0.5
+    assert set(fmt for fmt, confidence in guesses[:2]) == {MicroDVD, SubRip}
+
+    subs = parser.parse(contents)
+    assert parser.parsedFormat() is SubRip
+    assert parser.parsedConfidence() == 0.5
+    assert parser.parsedWithLowConfidence()
+    assert subs.size() == 1
+
+
+def test_sniffed_format_has_high_confidence(parser):
+    parser.parse('1\n00:00:01,000 --> 00:00:02,000\nHello\n')
+    assert not parser.parsedWithLowConfidence()
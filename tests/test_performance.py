@@ -0,0 +1,358 @@
+#-*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2016 Michal Goral.
+
+This file is part of Subconvert
+
+Subconvert is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Subconvert is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Subconvert. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Benchmarks of the most performance-critical paths. They compare a new implementation with the
+# old one (or with itself for different input sizes) instead of checking absolute times, which
+# would depend on a machine. They're deselected by default; run them with
+# `pytest -s -m benchmark tests/test_performance.py` to see the numbers.
+
+import time
+import tracemalloc
+
+import pytest
+
+from subconvert.cli import syncparse
+from subconvert.parsing import Core
+from subconvert.parsing.Core import SubParser, SubConverter, ColumnarSubManager, FormatRegistry
+from subconvert.parsing.FrameTime import FrameTime
+from subconvert.parsing.Offset import SyncPoint, TimeSync
+from subconvert.parsing.Formats import MicroDVD, SubRip, SubViewer, TMP, MPL2
+
+from tests.test_formats import render_with_template
+
+
+def best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+@pytest.fixture
+def parser():
+    parser = SubParser()
+    parser.registerFormat(MicroDVD)
+    parser.registerFormat(SubRip)
+    parser.registerFormat(SubViewer)
+    parser.registerFormat(TMP)
+    parser.registerFormat(MPL2)
+    return parser
+
+
+def gen_line_subs(fmt, count):
+    if fmt is MicroDVD:
+        line = '{%(start)d}{%(end)d}Subtitle %(no)d|second line\n'
+    elif fmt is MPL2:
+        line = '[%(start)d][%(end)d]Subtitle %(no)d|second line\n'
+    elif fmt is TMP:
+        line = '%(h)02d:%(m)02d:%(s)02d:Subtitle %(no)d|second line\n'
+    ret = []
+    for i in range(count):
+        secs = 3 * i
+        ret.append(line % dict(start=10 * secs, end=10 * secs + 20, no=i,
+                               h=secs // 3600, m=secs // 60 % 60, s=secs % 60))
+    return ret
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('fmt', [MicroDVD, MPL2, TMP])
+def test_buffer_engine_is_faster_than_line_loop(parser, fmt):
+    content = gen_line_subs(fmt, 50000)
+
+    # iterparse always feeds formats line by line
+    lineLoop = best_time(lambda: list(parser.iterparse(content)), repeat=5)
+    bufferEngine = best_time(lambda: parser.parse(content), repeat=5)
+    assert parser.parsedFormat() is fmt
+
+    print('%s: line loop: %.3fs, whole-buffer engine: %.3fs (%.1fx)' %
+          (fmt.NAME, lineLoop, bufferEngine, lineLoop / bufferEngine))
+    assert bufferEngine < lineLoop
+
+
+def gen_single_section_sub(size):
+    # SubViewer, because other formats give up when subtitle isn't found within a few first lines
+    content = ['[INFORMATION]\n', '[TITLE]Title\n', '[END INFORMATION]\n', '[SUBTITLE]\n',
+               '[COLF]&HFFFFFF,[STYLE]no,[SIZE]24,[FONT]Tahoma\n', '00:00:01.00,00:00:02.00\n']
+    line = 'A very long subtitle which never ends, so it is parsed as a single section.\n'
+    for i in range(size // len(line)):
+        content.append(line)
+    return content
+
+
+@pytest.mark.benchmark
+def test_parse_time_of_a_single_section_is_linear(parser):
+    small = gen_single_section_sub(256 * 1024)
+    big = gen_single_section_sub(1024 * 1024)
+
+    smallTime = best_time(lambda: parser.parse(small))
+    bigTime = best_time(lambda: parser.parse(big))
+    assert parser.parsedFormat() is SubViewer
+    assert len(parser.results) == 1
+
+    print('Single section: 256 KB: %.3fs, 1 MB: %.3fs' % (smallTime, bigTime))
+    # 4 times more data; quadratic parsing would take about 16 times longer
+    assert bigTime < 8 * smallTime
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('fmt, timestamp, timeString', [
+    (SubRip, '01:23:45,678', '1:23:45.678'),
+    (SubViewer, '01:23:45.67', '1:23:45.670'),
+    (TMP, '01:23:45', '1:23:45'),
+    (MPL2, '50256', '1:23:45.600'),
+])
+def test_frametime_hooks_dont_parse_time_strings(fmt, timestamp, timeString):
+    count = 100000
+    frametime = fmt().frametime
+    assert frametime(25, timestamp) == FrameTime(25, time=timeString)
+
+    # Hooks used to format a time string which was parsed again by FrameTime, so they were always
+    # slower than parsing that string alone.
+    def parseTimeStrings():
+        for _ in range(count):
+            FrameTime(25, time=timeString)
+
+    def callHooks():
+        for _ in range(count):
+            frametime(25, timestamp)
+
+    timeStringParsing = best_time(parseTimeStrings)
+    hook = best_time(callHooks)
+
+    print('%s: time string: %d timestamps/s, frametime(): %d timestamps/s' %
+          (fmt.NAME, count / timeStringParsing, count / hook))
+    assert hook < timeStringParsing
+
+
+def allocated_memory(func):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.benchmark
+def test_columnar_storage_is_compact(parser):
+    count = 50000
+    content = gen_line_subs(MicroDVD, count)
+
+    subtitles, listMemory = allocated_memory(lambda: parser.parse(content))
+    columnar, columnarMemory = allocated_memory(
+        lambda: ColumnarSubManager.fromSubtitles(subtitles))
+    assert columnar.size() == count
+
+    # texts are shared, so only memory used by columns is counted
+    print('Memory per subtitle: SubManager: %d B, ColumnarSubManager: %d B' %
+          (listMemory / count, columnarMemory / count))
+    assert columnarMemory * 5 < listMemory
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('columnar', [False, True])
+def test_clones_are_copied_on_write(parser, columnar):
+    count = 50000
+    subtitles = parser.parse(gen_line_subs(MicroDVD, count))
+    if columnar:
+        subtitles = ColumnarSubManager.fromSubtitles(subtitles)
+
+    clone, cloneMemory = allocated_memory(subtitles.clone)
+    _, changeMemory = allocated_memory(lambda: clone.changeSubText(0, 'Changed'))
+    assert subtitles[0].text != clone[0].text
+
+    # only a list of subtitles or texts is copied
+    print('clone: %d B, first change: %d B' % (cloneMemory, changeMemory))
+    assert cloneMemory < 10000
+    assert changeMemory < 9 * count
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('fmt', [MicroDVD, SubRip, SubViewer, TMP, MPL2])
+def test_convert_throughput(parser, fmt):
+    count = 50000
+    subtitles = parser.parse(gen_line_subs(MicroDVD, count))
+    instance = fmt()
+    render = instance.renderer()
+
+    def convertWithTemplate():
+        for subNo, sub in enumerate(subtitles.view()):
+            render_with_template(instance, subNo, sub)
+
+    def convertWithRenderer():
+        for subNo, sub in enumerate(subtitles.view()):
+            render(subNo, sub)
+
+    assert SubConverter().convert(fmt, subtitles)[-1] == \
+        render_with_template(instance, count - 1, subtitles[-1])
+
+    withTemplate = best_time(convertWithTemplate)
+    withRenderer = best_time(convertWithRenderer)
+
+    # Formats which times are single integers (frames, deciseconds) gain little here, so only
+    # the numbers are printed; test_formats checks that times are formatted with TIME_TEMPLATE.
+    print('%s: template: %d subtitles/s, compiled renderer: %d subtitles/s' %
+          (fmt.NAME, count / withTemplate, count / withRenderer))
+
+
+def format_sub_per_tag(fmt, string):
+    # Tag translation which looks up and escapes each tag for every subtitle.
+    string = string.strip()
+    string = string.replace('{', '{{').replace('}', '}}')
+    for openTag, closeTag in (('gsp_b_', '_gsp_b'), ('gsp_i_', '_gsp_i'), ('gsp_u_', '_gsp_u')):
+        for tag in (openTag, closeTag):
+            if fmt.formatting[tag]:
+                formatTag = fmt.formatting[tag].replace('{', '{{').replace('}', '}}')
+                string = string.replace(formatTag, ''.join(['{', tag, '}']))
+    return string.replace('\n', '{gsp_nl}')
+
+
+@pytest.mark.benchmark
+def test_format_sub_uses_precomputed_replacements():
+    fmt = SubRip()
+    texts = ['Subtitle <i>%d</i>\nsecond line' % i for i in range(100000)]
+    assert [fmt.formatSub(text) for text in texts[:10]] == \
+        [format_sub_per_tag(fmt, text) for text in texts[:10]]
+
+    def perTag():
+        for text in texts:
+            format_sub_per_tag(fmt, text)
+
+    def precomputed():
+        for text in texts:
+            fmt.formatSub(text)
+
+    perTagTime = best_time(perTag)
+    precomputedTime = best_time(precomputed)
+    print('per tag: %.3fs, precomputed: %.3fs' % (perTagTime, precomputedTime))
+    assert precomputedTime < perTagTime
+
+
+@pytest.mark.benchmark
+def test_raw_subtitles_are_converted_faster(parser):
+    subs = parser.parse(gen_line_subs(MicroDVD, 50000))
+    content = ''.join(SubConverter().convert(SubRip, subs))
+    converter = SubConverter()
+    assert converter.convert(SubRip, parser.parse(content)) == \
+        converter.convert(SubRip, parser.parseRaw(content))
+
+    def convertParsed():
+        for line in converter.iterconvert(SubRip, parser.parse(content)):
+            pass
+
+    def convertRaw():
+        for line in converter.iterconvert(SubRip, parser.parseRaw(content)):
+            pass
+
+    parsedTime = best_time(convertParsed)
+    rawTime = best_time(convertRaw)
+    print('Sub Rip re-encoding: GSP: %.3fs, raw: %.3fs' % (parsedTime, rawTime))
+    assert rawTime < parsedTime
+
+
+@pytest.mark.benchmark
+def test_batch_conversion_shares_formats(parser, monkeypatch):
+    contents = ['{%d}{%d}Subtitle|second line\n{200}{300}Last\n' % (i, i + 10)
+                for i in range(3000)]
+
+    def convertAll():
+        for content in contents:
+            for line in SubConverter().iterconvert(SubRip, parser.parse(content)):
+                pass
+
+    def convertAllWithNewFormats():
+        for content in contents:
+            monkeypatch.setattr(Core, 'formatRegistry', FormatRegistry())
+            for line in SubConverter().iterconvert(SubRip, parser.parse(content)):
+                pass
+
+    newFormatsTime = best_time(convertAllWithNewFormats)
+    monkeypatch.undo()
+    sharedTime = best_time(convertAll)
+    print('batch of %d files: new formats: %.3fs, shared formats: %.3fs' %
+          (len(contents), newFormatsTime, sharedTime))
+    assert sharedTime < newFormatsTime
+
+
+def sync_per_subtitle(subs, syncPoints):
+    # Sync which computes and changes times of subtitles one by one, for sync points sorted by
+    # subtitle numbers and given for the first and the last subtitle.
+    oldSubs = subs.clone()
+    for first, second in zip(syncPoints, syncPoints[1:]):
+        oldFirst, oldSecond = oldSubs[first.subNo], oldSubs[second.subNo]
+        for subNo in range(first.subNo, second.subNo + 1):
+            old = oldSubs[subNo]
+            for attr, change in (('start', subs.changeSubStart), ('end', subs.changeSubEnd)):
+                oldDelta = getattr(oldSecond, attr).ms - getattr(oldFirst, attr).ms
+                newDelta = getattr(second, attr).ms - getattr(first, attr).ms
+                proportion = (getattr(old, attr).ms - getattr(oldFirst, attr).ms) / oldDelta
+                newTime = getattr(first, attr).ms + int(round(newDelta * proportion))
+                change(subNo, FrameTime.fromMs(subs.fps, newTime))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('columnar', [False, True])
+def test_sync_computes_times_in_bulk(parser, columnar):
+    subs = parser.parse(gen_line_subs(MicroDVD, 50000))
+    if columnar:
+        subs = ColumnarSubManager.fromSubtitles(subs)
+    fps = subs.fps
+    syncPoints = [SyncPoint(subNo, FrameTime.fromMs(fps, subNo * 3100),
+                            FrameTime.fromMs(fps, subNo * 3100 + 2100))
+                  for subNo in list(range(0, 50000, 1250)) + [49999]]
+
+    perSubtitle = subs.clone()
+    sync_per_subtitle(perSubtitle, syncPoints)
+    synced = subs.clone()
+    TimeSync(synced).sync(list(syncPoints))
+    assert synced.times() == perSubtitle.times()
+
+    perSubtitleTime = best_time(lambda: sync_per_subtitle(subs.clone(), syncPoints), repeat=1)
+    bulkTime = best_time(lambda: TimeSync(subs.clone()).sync(list(syncPoints)), repeat=1)
+    print('sync with %d points: per subtitle: %.3fs, in bulk: %.3fs' %
+          (len(syncPoints), perSubtitleTime, bulkTime))
+    assert bulkTime < perSubtitleTime
+
+
+@pytest.mark.benchmark
+def test_sync_offset_doesnt_create_sync_points(parser):
+    subs = parser.parse(gen_line_subs(MicroDVD, 50000))
+
+    def withSyncPoints():
+        synced = subs.clone()
+        TimeSync(synced).sync(syncparse.parse('+2s', synced))
+        return synced
+
+    def withOffset():
+        synced = subs.clone()
+        syncparse.sync('+2s', synced)
+        return synced
+
+    assert withOffset().times() == withSyncPoints().times()
+    syncPointsTime = best_time(withSyncPoints, repeat=1)
+    offsetTime = best_time(withOffset, repeat=1)
+    print('--sync +2s: sync points: %.3fs, offset: %.3fs' % (syncPointsTime, offsetTime))
+    assert offsetTime < syncPointsTime
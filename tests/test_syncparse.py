@@ -21,7 +21,7 @@ import itertools
 import collections
 import pytest
 
-from subconvert.cli.syncparse import parse
+from subconvert.cli.syncparse import parse, sync
 from subconvert.parsing.Core import SubManager, Subtitle
 from subconvert.parsing.FrameTime import FrameTime
 from subconvert.utils.SubException import SubException
@@ -260,3 +260,29 @@ def test_parse_incorrect_time_spec(subs):
 
     with pytest.raises(SubException):
         parse(':_15s', subs)
+
+
+def test_sync_offset(subs, fps):
+    expected = [(sub.start + FrameTime(fps, seconds=3), sub.end + FrameTime(fps, seconds=3))
+                for sub in subs]
+    sync('+3s', subs)
+    assert [(sub.start, sub.end) for sub in subs] == expected
+
+
+def test_sync_offset_substract_too_much(subs):
+    with pytest.raises(SubException):
+        sync('-10s 1ms', subs)
+    assert subs[0].start == FrameTime(25, seconds=10)
+
+
+def test_sync_with_sync_points(subs, fps):
+    sync('1: +1s, -1: 1m', subs)
+    assert subs[0].start == FrameTime(fps, seconds=11)
+    assert subs[2].start == FrameTime(fps, seconds=60)
+    assert subs[2].end == FrameTime(fps, seconds=69)
+
+
+def test_sync_empty_subtitles():
+    subs = SubManager()
+    sync('+3s', subs)
+    assert len(subs) == 0